@@ -0,0 +1,292 @@
+"""Flow7 API / scheduler benchmark.
+
+Seeds a throwaway database with N users, M plans and K device tokens per user, drives the
+`main.py` app in-process through an ASGI client and prints machine-readable JSON results so
+runs can be compared across commits:
+
+    python benchmarks/bench_api.py --users 50 --plans 20000 --tokens 2 --ops 300 --out bench.json
+    python benchmarks/bench_api.py --database-url postgresql://localhost/flow7_bench
+
+FCM is stubbed: dispatch goes through the in-memory push transport (flow7_core.push).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, time as PyTime, timedelta, timezone
+from pathlib import Path
+from uuid import uuid4
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=20, help="seeded users (N)")
+    ap.add_argument("--plans", type=int, default=5000, help="seeded plans across all users (M)")
+    ap.add_argument("--tokens", type=int, default=2, help="device tokens per user (K)")
+    ap.add_argument("--ops", type=int, default=200, help="timed requests per API operation")
+    ap.add_argument("--dispatch", type=int, default=500, help="plans dispatched in the bulk dispatch phase")
+    ap.add_argument("--database-url", default=None, help="defaults to a fresh SQLite file in a temp dir")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--out", default=None, help="write JSON results here instead of stdout")
+    return ap.parse_args()
+
+
+def summarize(samples, wall):
+    samples = sorted(samples)
+    if not samples:
+        return {"count": 0}
+
+    def pct(p):
+        return samples[min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))] * 1000.0
+
+    return {
+        "count": len(samples),
+        "wall_s": round(wall, 4),
+        "ops_per_s": round(len(samples) / wall, 2) if wall > 0 else None,
+        "mean_ms": round(statistics.fmean(samples) * 1000.0, 3),
+        "p50_ms": round(pct(50), 3),
+        "p99_ms": round(pct(99), 3),
+        "max_ms": round(samples[-1] * 1000.0, 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+class _Slots:
+    """Hands out non-overlapping (date, start, end) slots per user so writes never conflict."""
+
+    def __init__(self, first_day: date, days: int):
+        self.first_day = first_day
+        self.days = days
+        self.next = {}
+
+    def take(self, uid):
+        n = self.next.get(uid, 0)
+        self.next[uid] = n + 1
+        day = self.first_day + timedelta(days=n % self.days)
+        minute = (n // self.days) * 10  # 10-minute slots, 9 minutes long
+        if minute + 9 >= 24 * 60:
+            raise RuntimeError("slot space exhausted; lower --plans/--ops or raise --users")
+        start = PyTime(minute // 60, minute % 60)
+        end = PyTime((minute + 9) // 60, (minute + 9) % 60)
+        return day, start, end
+
+
+def seed(args, SessionLocal, PlanORM, DeviceToken, UserSettings, slots, users):
+    db = SessionLocal()
+    try:
+        db.add_all([UserSettings(uid=u, timezone="UTC") for u in users])
+        db.add_all([DeviceToken(id=str(uuid4()), uid=u, token=f"tok-{u}-{i}", platform="android") for u in users for i in range(args.tokens)])
+        rows = []
+        for i in range(args.plans):
+            uid = users[i % len(users)]
+            d, st, et = slots.take(uid)
+            rows.append(PlanORM(id=str(uuid4()), user_id=uid, date=d, start_time=st, end_time=et, title=f"seed {i}", description="benchmark", notified=False))
+            if len(rows) >= 1000:
+                db.add_all(rows)
+                db.commit()
+                rows = []
+        db.add_all(rows)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def run_api(args, app, users, slots, rng):
+    import httpx
+
+    results = {}
+    created = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def timed(name, calls):
+            samples = []
+            wall_start = time.perf_counter()
+            for method, url, kwargs, expect in calls:
+                t0 = time.perf_counter()
+                r = await client.request(method, url, **kwargs)
+                samples.append(time.perf_counter() - t0)
+                if r.status_code != expect:
+                    raise RuntimeError(f"{name}: {method} {url} -> {r.status_code} {r.text[:200]}")
+                if name == "create":
+                    created.append((kwargs["headers"], r.json()))
+            results[name] = summarize(samples, time.perf_counter() - wall_start)
+
+        def auth(uid):
+            return {"Authorization": f"Bearer {uid}"}
+
+        def body(d, st, et, title):
+            return {"date": d.isoformat(), "start_time": st.strftime("%H:%M"), "end_time": et.strftime("%H:%M"), "title": title}
+
+        calls = []
+        for i in range(args.ops):
+            uid = rng.choice(users)
+            d, st, et = slots.take(uid)
+            calls.append(("POST", "/api/plans", {"headers": auth(uid), "json": body(d, st, et, f"bench {i}")}, 201))
+        await timed("create", calls)
+
+        today = date.today()
+        calls = []
+        for _ in range(args.ops):
+            uid = rng.choice(users)
+            params = {"start_date": today.isoformat(), "end_date": (today + timedelta(days=slots.days)).isoformat()}
+            calls.append(("GET", "/api/plans", {"headers": auth(uid), "params": params}, 200))
+        await timed("list", calls)
+
+        calls = []
+        targets = created[: args.ops // 2]
+        for headers, plan in targets:
+            uid = plan["user_id"]
+            d, st, et = slots.take(uid)
+            calls.append(("PUT", f"/api/plans/{plan['id']}", {"headers": headers, "json": body(d, st, et, plan["title"] + " (upd)")}, 200))
+        await timed("update", calls)
+
+        # force-update: move a plan onto a slot taken by another plan of the same user, deleting the latter
+        by_user = {}
+        for headers, plan in created[len(targets):]:
+            by_user.setdefault(plan["user_id"], []).append((headers, plan))
+        calls = []
+        survivors = [plan for _, plan in targets]
+        for group in by_user.values():
+            for (headers, plan), (_, victim) in zip(group[0::2], group[1::2]):
+                payload = {k: victim[k] for k in ("date", "start_time", "end_time")}
+                payload["title"] = plan["title"]
+                calls.append(("PUT", f"/api/plans/{plan['id']}", {"headers": headers, "json": payload, "params": {"force": "true"}}, 200))
+                survivors.append(plan)
+        await timed("force_update", calls)
+
+        calls = [("DELETE", f"/api/plans/{p['id']}", {"headers": auth(p["user_id"])}, 204) for p in survivors]
+        await timed("delete", calls)
+    return results
+
+
+def _install_fcm_stub():
+    """Route pushes to the in-memory fake transport so dispatch cost excludes the network."""
+    from flow7_core.push import InMemoryTransport, set_transport
+
+    transport = InMemoryTransport(keep_messages=False)
+    set_transport(transport)
+    return transport
+
+
+def run_scheduler(args, SessionLocal, PlanORM, scheduler):
+    from sqlalchemy import select, update
+    from flow7_core.config import SCHEDULE_LOOKAHEAD_DAYS
+
+    results = {}
+    # pending plans for init_and_reschedule: not yet notified and inside the same
+    # [-1d, +SCHEDULE_LOOKAHEAD_DAYS] date window reschedule_pending_plans scans
+    now_utc = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        pending = db.execute(select(PlanORM.id).where(
+            PlanORM.notified == False,
+            PlanORM.date.between((now_utc - timedelta(days=1)).date(), (now_utc + timedelta(days=SCHEDULE_LOOKAHEAD_DAYS)).date()),
+        )).scalars().all()
+    finally:
+        db.close()
+
+    t0 = time.perf_counter()
+    scheduler.init_and_reschedule()
+    results["init_and_reschedule"] = {"pending_plans": len(pending), "wall_s": round(time.perf_counter() - t0, 4)}
+    scheduler.shutdown()
+
+    sent = _install_fcm_stub()
+    # dispatch only sends reminders that are due: move the dispatched plans' start into the recent
+    # past (users are UTC), two minutes apart per user so they are not coalesced into digests
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0, tzinfo=None)
+    db = SessionLocal()
+    try:
+        db.execute(update(PlanORM).values(notified=False, notified_mask=0))
+        rows = db.execute(select(PlanORM.id, PlanORM.user_id).limit(args.dispatch)).all()
+        per_user = {}
+        for pid, uid in rows:
+            k = per_user[uid] = per_user.get(uid, 0) + 1
+            start = now - timedelta(minutes=2 * k)
+            db.execute(update(PlanORM).where(PlanORM.id == pid).values(
+                date=start.date(), start_time=start.time(), end_time=None, reminder_mask=None, notify_at=start))
+        db.commit()
+        ids = [pid for pid, _ in rows]
+    finally:
+        db.close()
+    samples = []
+    wall_start = time.perf_counter()
+    for pid in ids:
+        t0 = time.perf_counter()
+        scheduler._dispatch_notification_job(pid)
+        samples.append(time.perf_counter() - t0)
+    results["dispatch"] = summarize(samples, time.perf_counter() - wall_start)
+    results["dispatch"]["push_messages"] = sent.delivered
+    if ids and not sent.delivered:
+        raise RuntimeError("dispatch phase sent no push messages; the timings would measure no-ops")
+    return results
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    tmpdir = None
+    if args.database_url is None:
+        tmpdir = tempfile.mkdtemp(prefix="flow7-bench-")
+        args.database_url = f"sqlite:///{tmpdir}/bench.db"
+    # must be set before flow7_core.config is imported
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # measure handler cost, not the per-uid limiter
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    sys.path.insert(0, str(REPO_ROOT))
+
+    t0 = time.perf_counter()
+    import main as app_module
+    import_s = time.perf_counter() - t0
+    from flow7_core.db import SessionLocal, init_db
+    from flow7_core.models import PlanORM, DeviceToken, UserSettings
+    from flow7_core import scheduler
+
+    init_db()
+    users = [f"benchuser{i}" for i in range(args.users)]
+    # FREE tier may plan 14 days ahead; keep every slot inside that window
+    slots = _Slots(date.today() + timedelta(days=1), 13)
+    t0 = time.perf_counter()
+    seed(args, SessionLocal, PlanORM, DeviceToken, UserSettings, slots, users)
+    seed_s = time.perf_counter() - t0
+
+    api = asyncio.run(run_api(args, app_module.app, users, slots, rng))
+    sched = run_scheduler(args, SessionLocal, PlanORM, scheduler)
+
+    report = {
+        "benchmark": "flow7_api",
+        "git_revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": args.database_url.split("://", 1)[0],
+        "params": {"users": args.users, "plans": args.plans, "tokens": args.tokens, "ops": args.ops, "dispatch": args.dispatch, "seed": args.seed},
+        "setup": {"import_s": round(import_s, 4), "seed_s": round(seed_s, 4)},
+        "api": api,
+        "scheduler": sched,
+    }
+    out = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(out + "\n", encoding="utf-8")
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Flow7 cold-start benchmark.
+
+Starts fresh interpreters and measures, per run:
+
+  * import_s   - `import main` (module import only, no I/O besides reading .env)
+  * startup_s  - the FastAPI startup hooks (schema check, scheduler start); requests are served after this
+  * ready_s    - until GET /api/ready would answer 200 (background rescheduling of pending plans done)
+
+and prints machine-readable JSON so runs can be compared across commits:
+
+    python benchmarks/bench_startup.py --runs 5 --pending 2000 --out startup.json
+    python benchmarks/bench_startup.py --importtime   # also list the slowest imports of one run
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Runs inside each child interpreter; prints one JSON line with the phase timings.
+_CHILD = r"""
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+
+
+async def run():
+    # drive the app's lifespan the way uvicorn does: startup hooks on enter, shutdown on exit
+    async with main.app.router.lifespan_context(main.app):
+        t2 = time.perf_counter()
+        while not main._startup_state["rescheduled"]:
+            await asyncio.sleep(0.001)
+        return t2, time.perf_counter()
+
+
+t2, t3 = asyncio.run(run())
+print(json.dumps({"import_s": t1 - t0, "startup_s": t2 - t1, "ready_s": t3 - t0}))
+"""
+
+# Seeds pending plans (due within the reschedule window) before the timed runs.
+_SEED = r"""
+import sys
+from datetime import datetime, timedelta, timezone, time as PyTime
+from uuid import uuid4
+import main
+from flow7_core.db import SessionLocal, init_db
+from flow7_core.models import PlanORM
+init_db()
+n = int(sys.argv[1])
+now = datetime.now(timezone.utc)
+db = SessionLocal()
+for i in range(n):
+    start = now + timedelta(days=1 + i % 6, minutes=i % 1400)
+    db.add(PlanORM(id=str(uuid4()), user_id=f"startupuser{i % 50}", date=start.date(), start_time=PyTime(start.hour, start.minute),
+                   end_time=None, title=f"pending {i}", notified=False, notify_at=start))
+db.commit()
+db.close()
+"""
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5, help="fresh interpreter starts to time")
+    ap.add_argument("--pending", type=int, default=1000, help="pending plans seeded for the background reschedule")
+    ap.add_argument("--database-url", default=None, help="defaults to a fresh SQLite file in a temp dir")
+    ap.add_argument("--importtime", action="store_true", help="report the slowest imports (python -X importtime)")
+    ap.add_argument("--out", default=None, help="write JSON results here instead of stdout")
+    return ap.parse_args()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def child_env(database_url):
+    env = dict(os.environ)
+    env["DATABASE_URL"] = database_url
+    env.setdefault("LOG_LEVEL", "WARNING")
+    env["PYTHONPATH"] = str(REPO_ROOT) + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "min_ms": round(values[0] * 1000.0, 1),
+        "median_ms": round(statistics.median(values) * 1000.0, 1),
+        "max_ms": round(values[-1] * 1000.0, 1),
+    }
+
+
+def slowest_imports(env, top=15):
+    """Direct imports of main ranked by cumulative import time."""
+    r = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    rows = []
+    for line in r.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        # importtime indents by nesting depth: two spaces = imported directly by main
+        if not cumulative_us.strip().isdigit() or not name.startswith("   ") or name.startswith("    "):
+            continue
+        rows.append({"module": name.strip(), "cumulative_ms": round(int(cumulative_us) / 1000.0, 1)})
+    return sorted(rows, key=lambda r: -r["cumulative_ms"])[:top]
+
+
+def main():
+    args = parse_args()
+    if args.database_url is None:
+        args.database_url = f"sqlite:///{tempfile.mkdtemp(prefix='flow7-startup-')}/startup.db"
+    env = child_env(args.database_url)
+    if args.pending:
+        subprocess.run([sys.executable, "-c", _SEED, str(args.pending)], cwd=REPO_ROOT, env=env, check=True)
+
+    samples = []
+    for _ in range(args.runs):
+        r = subprocess.run([sys.executable, "-c", _CHILD], cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+        if r.returncode != 0:
+            raise RuntimeError(r.stderr[-2000:])
+        samples.append(json.loads(r.stdout.strip().splitlines()[-1]))
+
+    report = {
+        "benchmark": "flow7_startup",
+        "git_revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": args.database_url.split("://", 1)[0],
+        "params": {"runs": args.runs, "pending": args.pending},
+        "phases": {phase: summarize([s[phase] for s in samples]) for phase in ("import_s", "startup_s", "ready_s")},
+    }
+    if args.importtime:
+        report["slowest_imports"] = slowest_imports(env)
+    out = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(out + "\n", encoding="utf-8")
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+"""Flow7 scheduler crash-recovery soak test.
+
+Exercises the restart rules of flow7_core.scheduler (reschedule_pending_plans): a missed
+notification runs right after a restart if it is at most GRACE_WINDOW old and is never sent
+otherwise. Two phases, each in a fresh interpreter and database, print machine-readable JSON:
+
+  * soak      - plans are dispatched under a simulated clock while the process is killed at
+                random points (idle, before a send, between send and commit) and restarted after
+                a random downtime. Every plan is then checked:
+                  lost        recoverable (downtime ended within GRACE_WINDOW of notify_at) but never sent
+                  duplicated  sent twice without a crash between its send and commit
+                  late        sent more than GRACE_WINDOW after notify_at
+                Duplicates caused by a crash between send and commit are at-least-once delivery
+                and reported separately (crash_window_duplicates).
+  * recovery  - N pending plans are seeded and two restarts (empty, then populated job store) are
+                timed with APScheduler's SQLAlchemy job store (paused, so nothing runs), with the
+                DB statements and commits each restart issues.
+
+    python benchmarks/soak_scheduler.py --soak-plans 2000 --crashes 40
+    python benchmarks/soak_scheduler.py --pending 10000,100000,1000000 --out soak.json
+    python benchmarks/soak_scheduler.py --pending 0        # soak only
+
+The simulated clock replaces scheduler._utcnow; APScheduler is replaced in the soak phase by an
+in-memory stand-in whose jobs survive "crashes", like the persistent job store does.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, time as PyTime, timedelta, timezone
+from pathlib import Path
+from uuid import uuid4
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--soak-plans", type=int, default=2000, help="plans dispatched in the soak phase (0 skips it)")
+    ap.add_argument("--crashes", type=int, default=40, help="kills injected during the soak phase")
+    ap.add_argument("--horizon-hours", type=float, default=72.0, help="notify_at values are spread over this many hours")
+    ap.add_argument("--pending", default="10000,100000,1000000", help="comma-separated pending plan counts for the recovery phase (0 skips it)")
+    ap.add_argument("--database-dir", default=None, help="where the throwaway SQLite files go (default: a temp dir)")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--out", default=None, help="write JSON results here instead of stdout")
+    ap.add_argument("--child", choices=("soak", "recovery"), help=argparse.SUPPRESS)
+    ap.add_argument("--child-pending", type=int, default=0, help=argparse.SUPPRESS)
+    return ap.parse_args(argv)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def summarize(values, scale=1.0, unit="ms"):
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    return {
+        "count": len(values),
+        f"min_{unit}": round(values[0] * scale, 2),
+        f"median_{unit}": round(statistics.median(values) * scale, 2),
+        f"max_{unit}": round(values[-1] * scale, 2),
+    }
+
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0, 1)
+
+
+class WriteCounter:
+    """Counts statements by verb and commits on the engines it is attached to."""
+
+    def __init__(self):
+        self.statements = {}
+        self.commits = 0
+
+    def attach(self, engine):
+        from sqlalchemy import event
+
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine, "commit", self._on_commit)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper()
+        self.statements[verb] = self.statements.get(verb, 0) + 1
+
+    def _on_commit(self, conn):
+        self.commits += 1
+
+    def snapshot(self):
+        return dict(self.statements), self.commits
+
+    def since(self, snapshot):
+        statements, commits = snapshot
+        delta = {verb: n - statements.get(verb, 0) for verb, n in self.statements.items() if n - statements.get(verb, 0)}
+        writes = sum(n for verb, n in delta.items() if verb in ("INSERT", "UPDATE", "DELETE"))
+        return {"statements": delta, "write_statements": writes, "commits": self.commits - commits}
+
+
+# --- soak phase (child) ---
+
+class Crash(BaseException):
+    """Simulated process death; a BaseException so the scheduler's `except Exception` blocks let it through."""
+
+
+class SimClock:
+    def __init__(self, start: datetime):
+        self.current = start
+
+    def now(self) -> datetime:
+        return self.current
+
+    def advance_to(self, when: datetime):
+        if when > self.current:
+            self.current = when
+
+
+class FakeScheduler:
+    """In-memory stand-in for APScheduler with a persistent job store: date jobs keyed by id.
+
+    `jobs` is shared across restarts, as the SQLAlchemy job store is; the harness runs due jobs.
+    """
+
+    def __init__(self, jobs: dict):
+        self.jobs = jobs
+
+    def add_job(self, func, trigger, run_date, id, args, replace_existing=True, misfire_grace_time=None, **kwargs):
+        self.jobs[id] = (run_date, func, tuple(args), misfire_grace_time)
+
+    def remove_job(self, job_id):
+        del self.jobs[job_id]
+
+    def get_jobs(self):
+        return list(self.jobs)
+
+    def next_run(self):
+        return min((job[0] for job in self.jobs.values()), default=None)
+
+    def pop_due(self, now):
+        due = sorted(((job[0], job_id) for job_id, job in self.jobs.items() if job[0] <= now))
+        return [(job_id, self.jobs.pop(job_id)) for _, job_id in due]
+
+
+def run_soak(args):
+    from flow7_core import scheduler
+    from flow7_core.db import SessionLocal, engine, init_db
+    from flow7_core.models import PlanORM, UserSettings
+
+    rng = random.Random(args.seed)
+    init_db()
+    writes = WriteCounter()
+    writes.attach(engine)
+
+    start = datetime(2030, 1, 7, 0, 0, tzinfo=timezone.utc)
+    clock = SimClock(start)
+    scheduler._utcnow = clock.now
+    grace = scheduler.GRACE_WINDOW
+
+    # seed plans (UTC users, one reminder each) with notify_at spread over the horizon
+    users = max(1, args.soak_plans // 5)
+    db = SessionLocal()
+    db.add_all([UserSettings(uid=f"soak{u}", timezone="UTC") for u in range(users)])
+    plans = []
+    horizon_minutes = int(args.horizon_hours * 60)
+    for i in range(args.soak_plans):
+        at = start + timedelta(minutes=10 + rng.randrange(horizon_minutes))
+        plans.append(PlanORM(id=str(uuid4()), user_id=f"soak{i % users}", date=at.date(), start_time=PyTime(at.hour, at.minute),
+                             end_time=None, title="", notified=False, notified_mask=0))
+    for p in plans:
+        p.title = p.id  # the payload carries the title; it maps sends back to plans
+    db.add_all(plans)
+    db.commit()
+    due_at = {p.id: datetime.combine(p.date, p.start_time).replace(tzinfo=timezone.utc) for p in plans}
+    db.close()
+
+    jobs = {}
+    scheduler._scheduler = FakeScheduler(jobs)
+    # the real lookahead would leave later days to restarts; arm every plan up front
+    scheduler.schedule_notifications_for_plans(plans)
+
+    sends = {}           # plan id -> [send times]
+    crash_window = set()  # plans whose send was interrupted before its commit
+    pending_crash = []   # crash mode armed for the next send: "before_send" / "after_send"
+
+    def record(payloads):
+        if pending_crash and pending_crash[0] == "before_send":
+            pending_crash.pop()
+            raise Crash()
+        for payload in payloads:
+            sends.setdefault(payload["title"], []).append(clock.now())
+        if pending_crash and pending_crash[0] == "after_send":
+            pending_crash.pop()
+            crash_window.update(payload["title"] for payload in payloads)
+            raise Crash()
+
+    scheduler.send_notification_to_user = lambda uid, payload: record([payload])
+    scheduler.send_digest_to_user = lambda uid, payloads: record(list(payloads))
+
+    crash_times = sorted(start + timedelta(minutes=rng.uniform(0, horizon_minutes)) for _ in range(args.crashes))
+    downtimes, recoveries = [], []
+    restarts = misfired = 0
+
+    def crash_and_restart():
+        nonlocal restarts, misfired
+        roll = rng.random()
+        if roll < 0.7:
+            downtime = timedelta(minutes=rng.uniform(1, 30))
+        elif roll < 0.9:
+            downtime = timedelta(hours=rng.uniform(1, 20))
+        else:
+            downtime = timedelta(hours=rng.uniform(25, 48))  # longer than GRACE_WINDOW
+        down_at = clock.now()
+        clock.advance_to(down_at + downtime)
+        downtimes.append((down_at, clock.now()))
+        restarts += 1
+        # APScheduler drops date jobs missed by more than their misfire_grace_time when it wakes up
+        for job_id, job in list(jobs.items()):
+            run_date, _, _, misfire_grace_time = job
+            if misfire_grace_time is not None and clock.now() - run_date > timedelta(seconds=misfire_grace_time):
+                del jobs[job_id]
+                misfired += 1
+        snap = writes.snapshot()
+        t0 = time.perf_counter()
+        counts = scheduler.reschedule_pending_plans()
+        recoveries.append({"wall_s": time.perf_counter() - t0, "downtime_s": downtime.total_seconds(), **(counts or {}), **writes.since(snap)})
+
+    end = start + timedelta(minutes=horizon_minutes) + grace * 3
+    while True:
+        next_job = scheduler._scheduler.next_run()
+        next_crash = crash_times[0] if crash_times else None
+        if next_job is None and next_crash is None:
+            break
+        if next_crash is not None and (next_job is None or next_crash <= next_job):
+            crash_times.pop(0)
+            clock.advance_to(next_crash)
+            mode = rng.choice(("idle", "before_send", "after_send"))
+            if mode == "idle" or next_job is None:
+                crash_and_restart()
+            else:
+                pending_crash[:] = [mode]
+            continue
+        if next_job > end:
+            break
+        clock.advance_to(next_job)
+        for job_id, (run_date, func, job_args, _) in scheduler._scheduler.pop_due(clock.now()):
+            try:
+                func(*job_args)
+            except Crash:
+                crash_and_restart()
+                break
+    pending_crash.clear()
+
+    def restart_after(at):
+        for down_at, up_at in downtimes:
+            if down_at <= at < up_at:
+                return up_at
+        return at
+
+    lost = duplicated = crash_dups = late = skipped = 0
+    for plan_id, due in due_at.items():
+        times = sends.get(plan_id, [])
+        recoverable = restart_after(due) - due <= grace
+        if not times:
+            if recoverable:
+                lost += 1
+            else:
+                skipped += 1
+        if len(times) > 1:
+            if plan_id in crash_window:
+                crash_dups += 1
+            else:
+                duplicated += 1
+        late += sum(1 for t in times if t - due > grace)
+
+    return {
+        "plans": args.soak_plans,
+        "users": users,
+        "crashes_injected": args.crashes,
+        "restarts": restarts,
+        "misfired_jobs_dropped": misfired,
+        "sent": sum(len(t) for t in sends.values()),
+        "skipped_too_old": skipped,
+        "lost": lost,
+        "duplicated": duplicated,
+        "crash_window_duplicates": crash_dups,
+        "late": late,
+        "ok": lost == 0 and duplicated == 0 and late == 0,
+        "recovery_wall": summarize([r["wall_s"] for r in recoveries], 1000.0),
+        "recovery_write_statements": summarize([r["write_statements"] for r in recoveries], unit="n"),
+        "recovery_commits": summarize([r["commits"] for r in recoveries], unit="n"),
+    }
+
+
+# --- recovery phase (child) ---
+
+def seed_pending(n: int, now: datetime, rng: random.Random):
+    """Core bulk insert of n pending plans with notify_at in [now - 30h, now + 6d]."""
+    from sqlalchemy import insert
+    from flow7_core.db import SessionLocal
+    from flow7_core.models import PlanORM
+
+    users = max(1, n // 20)
+    db = SessionLocal()
+    try:
+        batch = []
+        for i in range(n):
+            at = now + timedelta(minutes=rng.randrange(-30 * 60, 6 * 24 * 60))
+            at = at.replace(second=0, microsecond=0)
+            batch.append({
+                "id": str(uuid4()), "user_id": f"rec{i % users}", "date": at.date(), "start_time": PyTime(at.hour, at.minute),
+                "end_time": None, "title": f"pending {i}", "notified": False, "notified_mask": 0,
+                "notify_at": at.replace(tzinfo=None),
+            })
+            if len(batch) >= 10000:
+                db.execute(insert(PlanORM), batch)
+                batch = []
+        if batch:
+            db.execute(insert(PlanORM), batch)
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_recovery(args):
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from flow7_core import scheduler
+    from flow7_core.config import DATABASE_URL
+    from flow7_core.db import engine, init_db
+
+    rng = random.Random(args.seed)
+    init_db()
+    n = args.child_pending
+    now = datetime.now(timezone.utc)
+    t0 = time.perf_counter()
+    seed_pending(n, now, rng)
+    seed_s = time.perf_counter() - t0
+
+    writes = WriteCounter()
+    writes.attach(engine)
+    jobstore = SQLAlchemyJobStore(url=DATABASE_URL)
+    sched = BackgroundScheduler(jobstores={"default": jobstore}, timezone=timezone.utc)
+    sched.start(paused=True)
+    writes.attach(jobstore.engine)
+    scheduler._scheduler = sched
+
+    restarts = []
+    try:
+        for label in ("cold_job_store", "warm_job_store"):
+            snap = writes.snapshot()
+            t0 = time.perf_counter()
+            counts = scheduler.reschedule_pending_plans() or {}
+            restarts.append({"restart": label, "recovery_s": round(time.perf_counter() - t0, 3), **counts, **writes.since(snap)})
+    finally:
+        scheduler._scheduler = None
+        sched.shutdown(wait=False)
+    return {"pending": n, "seed_s": round(seed_s, 2), "restarts": restarts, "max_rss_mb": max_rss_mb()}
+
+
+# --- parent ---
+
+def run_child(phase: str, args, database_dir: str, pending: int = 0) -> dict:
+    db_path = os.path.join(database_dir, f"soak-{phase}-{pending}.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    env = dict(os.environ)
+    env["DATABASE_URL"] = f"sqlite:///{db_path}"
+    env.setdefault("LOG_LEVEL", "WARNING")
+    env["PYTHONPATH"] = str(REPO_ROOT) + os.pathsep + env.get("PYTHONPATH", "")
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--child", phase, "--child-pending", str(pending),
+           "--soak-plans", str(args.soak_plans), "--crashes", str(args.crashes),
+           "--horizon-hours", str(args.horizon_hours), "--seed", str(args.seed)]
+    r = subprocess.run(cmd, cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    if r.returncode != 0:
+        raise RuntimeError(r.stderr[-2000:])
+    return json.loads(r.stdout.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        result = run_soak(args) if args.child == "soak" else run_recovery(args)
+        print(json.dumps(result, default=str))
+        return
+
+    database_dir = args.database_dir or tempfile.mkdtemp(prefix="flow7-soak-")
+    report = {
+        "benchmark": "flow7_scheduler_soak",
+        "git_revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": "sqlite",
+        "params": {"soak_plans": args.soak_plans, "crashes": args.crashes, "horizon_hours": args.horizon_hours, "pending": args.pending, "seed": args.seed},
+    }
+    if args.soak_plans:
+        report["soak"] = run_child("soak", args, database_dir)
+    scales = [int(n) for n in args.pending.split(",") if int(n) > 0]
+    if scales:
+        report["recovery"] = [run_child("recovery", args, database_dir, n) for n in scales]
+    out = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(out + "\n", encoding="utf-8")
+    else:
+        print(out)
+    if args.soak_plans and not report["soak"]["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
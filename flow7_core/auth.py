@@ -1,18 +1,90 @@
 from fastapi import Depends, HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import event
 from sqlalchemy.orm import Session
-from firebase_admin import auth as firebase_auth
 import base64
 import json
 from .db import get_db
 from .models import UserSettings
-from .config import FIREBASE_ADMIN_AVAILABLE, REQUIRE_STRICT_AUTH, FIREBASE_CHECK_REVOKED
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+from .config import firebase_available, REQUIRE_STRICT_AUTH, FIREBASE_CHECK_REVOKED, USER_CONTEXT_TTL_SECONDS, USER_CONTEXT_CACHE_SIZE
 from .state import USER_SUBSCRIPTIONS
 
 
 token_auth_scheme = HTTPBearer(auto_error=False)
 
 
+@dataclass(frozen=True)
+class UserContext:
+    """The resolved user of a request. Frozen: one cached instance is shared by concurrent requests."""
+
+    uid: str
+    # `subscription` is the legacy name of subscription_level (never None here)
+    subscription: str
+    subscription_level: Optional[str]
+    subscription_expires_at: Optional[datetime]
+    subscription_score: Optional[int]
+    language_code: Optional[str]
+    theme_preference: Optional[str]
+    theme: Optional[str]
+    notifications_enabled: Optional[bool]
+    timezone: Optional[str]
+
+# uid -> (user context, monotonic expiry). Settings writes and the subscription sweeper call
+# invalidate_user_context(), so the TTL only bounds staleness across processes.
+_USER_CONTEXTS = OrderedDict()
+_USER_CONTEXTS_LOCK = threading.Lock()
+
+
+def invalidate_user_context(uid: str) -> None:
+    with _USER_CONTEXTS_LOCK:
+        _USER_CONTEXTS.pop(uid, None)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_settings_writes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, UserSettings):
+            session.info.setdefault("flow7_settings_written", set()).add(obj.uid)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_settings_writes(session):
+    # invalidate after commit so a concurrent request cannot re-cache the pre-commit row
+    for uid in session.info.pop("flow7_settings_written", ()):
+        invalidate_user_context(uid)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_settings_writes(session):
+    session.info.pop("flow7_settings_written", None)
+
+
+def _cached_user_context(uid: str):
+    with _USER_CONTEXTS_LOCK:
+        entry = _USER_CONTEXTS.get(uid)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del _USER_CONTEXTS[uid]
+            return None
+        _USER_CONTEXTS.move_to_end(uid)
+        return entry[0]
+
+
+def _cache_user_context(uid: str, user) -> None:
+    with _USER_CONTEXTS_LOCK:
+        _USER_CONTEXTS[uid] = (user, time.monotonic() + USER_CONTEXT_TTL_SECONDS)
+        _USER_CONTEXTS.move_to_end(uid)
+        while len(_USER_CONTEXTS) > USER_CONTEXT_CACHE_SIZE:
+            _USER_CONTEXTS.popitem(last=False)
+
+
 async def get_current_user(
     token: HTTPAuthorizationCredentials = Security(token_auth_scheme), db: Session = Depends(get_db)
 ):
@@ -25,7 +97,9 @@ async def get_current_user(
     id_token = token.credentials
 
     uid = None
-    if FIREBASE_ADMIN_AVAILABLE:
+    if firebase_available():
+        from firebase_admin import auth as firebase_auth
+
         try:
             decoded = firebase_auth.verify_id_token(id_token, check_revoked=FIREBASE_CHECK_REVOKED)
             uid = decoded.get("uid")
@@ -42,6 +116,10 @@ async def get_current_user(
     if uid is None:
         raise HTTPException(status_code=401, detail="Unable to resolve user from token")
 
+    cached = _cached_user_context(uid)
+    if cached is not None:
+        return cached
+
     # Ensure UserSettings exists and migrate from in-memory fallback if present
     us = db.query(UserSettings).get(uid)
     if us is None:
@@ -52,23 +130,20 @@ async def get_current_user(
         db.commit()
         db.refresh(us)
 
-    # Attach subscription and other settings to a simple user object for endpoints
-    # Provide both `subscription_level` and legacy `subscription` for backward compatibility
-    user = {
-        "uid": uid,
-        "subscription": us.subscription_level or "FREE",
-        "subscription_level": us.subscription_level,
-        "subscription_expires_at": us.subscription_expires_at,
-        "subscription_score": us.subscription_score,
-        "language_code": us.language_code,
-        "theme_preference": us.theme,
-        "theme": us.theme,
-        "notifications_enabled": us.notifications_enabled,
-        "timezone": us.timezone,
-    }
-    # Return a simple object with attribute access (compat with existing code expecting .uid)
-    from types import SimpleNamespace
-    return SimpleNamespace(**user)
+    user = UserContext(
+        uid=uid,
+        subscription=us.subscription_level or "FREE",
+        subscription_level=us.subscription_level,
+        subscription_expires_at=us.subscription_expires_at,
+        subscription_score=us.subscription_score,
+        language_code=us.language_code,
+        theme_preference=us.theme,
+        theme=us.theme,
+        notifications_enabled=us.notifications_enabled,
+        timezone=us.timezone,
+    )
+    _cache_user_context(uid, user)
+    return user
 
 
 def _parse_uid_from_token(token_str: str) -> str:
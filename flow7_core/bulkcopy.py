@@ -0,0 +1,109 @@
+from datetime import date as PyDate, datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Date, String, and_, cast, exists, func, insert, literal, select, true, union_all
+from sqlalchemy.orm import Session, aliased
+
+from flow7_core.models import PlanORM
+
+# Set-based "copy range" (POST /api/plans/copy): every plan of a source date range is copied to
+# `repeat` target ranges, each shifted by another `offset_days`. Conflicts with existing plans are
+# found in one joined query, and the copies are written with one INSERT .. SELECT that generates
+# ids in the database and returns them (RETURNING), so the source rows never round-trip through Python.
+# Date arithmetic and UUID generation are dialect specific; SQLite and Postgres are supported.
+
+SUPPORTED_DIALECTS = ("sqlite", "postgresql")
+# ids per SELECT when the new copies are loaded back
+LOAD_BATCH_SIZE = 500
+
+
+def _shift_date(dialect: str, column, days):
+    if dialect == "sqlite":
+        # date() keeps the ISO text format SQLAlchemy's Date type stores on SQLite
+        return func.date(column, func.printf("%+d days", days), type_=Date)
+    return column + days
+
+
+def _new_uuid(dialect: str):
+    if dialect == "sqlite":
+        hex_ = lambda n: func.lower(func.hex(func.randomblob(n)))
+        # random version-4 layout: xxxxxxxx-xxxx-4xxx-[89ab]xxx-xxxxxxxxxxxx
+        return (hex_(4) + "-" + hex_(2) + "-4" + func.substr(hex_(2), 2) + "-"
+                + func.substr("89ab", 1 + func.abs(func.random()) % 4, 1) + func.substr(hex_(2), 2) + "-" + hex_(6))
+    return cast(func.gen_random_uuid(), String)
+
+
+def _repeats(repeat: int):
+    """Subquery of k = 1 .. repeat."""
+    return union_all(*[select(literal(k).label("k")) for k in range(1, repeat + 1)]).subquery("repeats")
+
+
+def source_bounds(db: Session, uid: str, start_date: PyDate, end_date: PyDate) -> Tuple[int, Optional[PyDate], Optional[PyDate]]:
+    """(plan count, first date, last date) of the source range."""
+    return tuple(db.execute(select(func.count(PlanORM.id), func.min(PlanORM.date), func.max(PlanORM.date)).where(
+        PlanORM.user_id == uid,
+        PlanORM.date.between(start_date, end_date),
+    )).one())
+
+
+def _source_and_target(dialect: str, uid: str, start_date: PyDate, end_date: PyDate, offset_days: int, repeat: int):
+    src = aliased(PlanORM, name="src")
+    ks = _repeats(repeat)
+    target_date = _shift_date(dialect, src.date, ks.c.k * offset_days)
+    source_filter = and_(src.user_id == uid, src.date.between(start_date, end_date))
+    return src, ks, target_date, source_filter
+
+
+def _overlaps(existing, src, target_date):
+    return and_(
+        existing.user_id == src.user_id,
+        existing.date == target_date,
+        existing.start_time < src.end_time,
+        existing.end_time > src.start_time,
+    )
+
+
+def find_conflicts(db: Session, uid: str, start_date: PyDate, end_date: PyDate, offset_days: int, repeat: int) -> List[dict]:
+    """Every (source plan, copy number) whose target slot overlaps an existing plan, in one query."""
+    dialect = db.get_bind().dialect.name
+    src, ks, target_date, source_filter = _source_and_target(dialect, uid, start_date, end_date, offset_days, repeat)
+    existing = aliased(PlanORM, name="existing")
+    stmt = (
+        select(src.id, ks.c.k, target_date.label("target_date"), src.start_time, src.end_time, src.title,
+               existing.id.label("conflict_id"), existing.title.label("conflict_title"))
+        .select_from(src)
+        .join(ks, true())
+        .join(existing, _overlaps(existing, src, target_date))
+        .where(source_filter)
+        .order_by(ks.c.k, src.date, src.start_time, src.id)
+    )
+    return [dict(row._mapping) for row in db.execute(stmt)]
+
+
+def insert_copies(db: Session, uid: str, start_date: PyDate, end_date: PyDate, offset_days: int, repeat: int, created_at: datetime) -> List[str]:
+    """INSERT .. SELECT the copies that do not overlap an existing plan; returns the new ids (RETURNING)."""
+    dialect = db.get_bind().dialect.name
+    src, ks, target_date, source_filter = _source_and_target(dialect, uid, start_date, end_date, offset_days, repeat)
+    existing = aliased(PlanORM, name="existing")
+    columns = ["id", "user_id", "date", "start_time", "end_time", "title", "description", "reminder_mask",
+               "notified", "notified_mask", "dispatch_shard", "created_at", "updated_at"]
+    rows = (
+        select(
+            _new_uuid(dialect), src.user_id, target_date, src.start_time, src.end_time, src.title, src.description,
+            src.reminder_mask, literal(False), literal(0), src.dispatch_shard, literal(created_at), literal(created_at),
+        )
+        .select_from(src)
+        .join(ks, true())
+        .where(source_filter, ~exists().where(_overlaps(existing, src, target_date)))
+    )
+    table = PlanORM.__table__
+    return list(db.execute(insert(table).from_select(columns, rows).returning(table.c.id)).scalars())
+
+
+def load_copies(db: Session, ids: List[str]) -> List[PlanORM]:
+    """The inserted copies by id (in chunks of LOAD_BATCH_SIZE), ordered by date and start."""
+    copies = []
+    for i in range(0, len(ids), LOAD_BATCH_SIZE):
+        copies.extend(db.execute(select(PlanORM).where(PlanORM.id.in_(ids[i:i + LOAD_BATCH_SIZE]))).scalars())
+    copies.sort(key=lambda p: (p.date, p.start_time))
+    return copies
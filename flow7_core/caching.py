@@ -0,0 +1,75 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+# Clients may keep a copy but must revalidate it on every use (304 when unchanged)
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Build a weak ETag from the validator parts (timestamps, counts, query params)."""
+    raw = "|".join("" if p is None else (p.isoformat() if isinstance(p, datetime) else str(p)) for p in parts)
+    return 'W/"%s"' % hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _as_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    """updated_at columns are written both naive (utcnow) and aware; treat naive as UTC."""
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # weak comparison: ignore W/ prefixes on both sides
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == wanted:
+            return True
+    return False
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None, use_modified_since: bool = True) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since for a GET.
+
+    If-None-Match takes precedence. If-Modified-Since is only honored when `use_modified_since`
+    is set, i.e. when a newer timestamp is guaranteed for every change (not true for deletes).
+    """
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        return _etag_matches(inm, etag)
+    ims = request.headers.get("if-modified-since")
+    lm = _as_utc(last_modified)
+    if use_modified_since and ims and lm is not None:
+        try:
+            since = parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP dates have second resolution
+        return lm.replace(microsecond=0) <= since
+    return False
+
+
+def set_validators(response: Response, etag: str, last_modified: Optional[datetime] = None) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    lm = _as_utc(last_modified)
+    if lm is not None:
+        response.headers["Last-Modified"] = format_datetime(lm, usegmt=True)
+
+
+def not_modified_response(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    response = Response(status_code=304)
+    set_validators(response, etag, last_modified)
+    return response
@@ -1,4 +1,5 @@
 import os
+import threading
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -9,28 +10,151 @@ FIREBASE_CREDENTIAL_PATH = os.getenv("FIREBASE_CREDENTIAL_PATH")
 REQUIRE_STRICT_AUTH = os.getenv("REQUIRE_STRICT_AUTH", "false").lower() in ("1", "true", "yes")
 FIREBASE_CHECK_REVOKED = os.getenv("FIREBASE_CHECK_REVOKED", "false").lower() in ("1", "true", "yes")
 
-# Try to initialize firebase_admin if credentials are provided
-FIREBASE_ADMIN_AVAILABLE = False
-try:
-    import firebase_admin
-    from firebase_admin import credentials
-
-    if FIREBASE_CREDENTIAL_PATH:
-        cred = credentials.Certificate(FIREBASE_CREDENTIAL_PATH)
-        firebase_admin.initialize_app(cred)
-        FIREBASE_ADMIN_AVAILABLE = True
-    else:
-        # If no credential path, firebase_admin may still be importable but not configured
-        FIREBASE_ADMIN_AVAILABLE = False
-except Exception:
-    # firebase_admin not available or failed to init
-    FIREBASE_ADMIN_AVAILABLE = False
+# firebase-admin is imported and initialized on first use (auth, push), not at import time:
+# loading google-auth and the credential file would otherwise dominate cold starts.
+_firebase_ready = None  # None = not attempted yet
+_firebase_lock = threading.Lock()
+
+
+def init_firebase() -> bool:
+    """Initialize firebase_admin once if FIREBASE_CREDENTIAL_PATH is set. Returns availability."""
+    global _firebase_ready
+    if _firebase_ready is not None:
+        return _firebase_ready
+    with _firebase_lock:
+        if _firebase_ready is None:
+            ready = False
+            if FIREBASE_CREDENTIAL_PATH:
+                try:
+                    import firebase_admin
+                    from firebase_admin import credentials
+
+                    if not firebase_admin._apps:
+                        firebase_admin.initialize_app(credentials.Certificate(FIREBASE_CREDENTIAL_PATH))
+                    ready = True
+                except Exception:
+                    # firebase_admin not installed or failed to init
+                    ready = False
+            _firebase_ready = ready
+    return _firebase_ready
+
+
+def firebase_available() -> bool:
+    return init_firebase()
 
 # DB URL helper (used by db module too) - provide a deterministic default
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 DEFAULT_SQLITE_PATH = PROJECT_ROOT / "maindb.db"
 DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{DEFAULT_SQLITE_PATH}")
+# Optional read replica for read-heavy endpoints (plan list, profile). Unset = everything on DATABASE_URL.
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL") or None
+# After a write, that user's reads stay on the primary for this long (read-your-writes over replica lag)
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+REPLICA_STICKY_MAX_USERS = int(os.getenv("REPLICA_STICKY_MAX_USERS", "100000"))
 
 # Firebase send tuning
 FIREBASE_SEND_RETRIES = int(os.getenv("FIREBASE_SEND_RETRIES", "2"))
 FIREBASE_SEND_BACKOFF = float(os.getenv("FIREBASE_SEND_BACKOFF", "1.5"))
+
+# Response compression: bodies smaller than this many bytes are sent as-is
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "500"))
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", "6"))
+
+# Logging (see flow7_core.log)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # json | text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# at most this many records per message template per window (WARNING and above are never limited)
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", "20"))
+LOG_RATE_WINDOW_SECONDS = float(os.getenv("LOG_RATE_WINDOW_SECONDS", "60"))
+
+# Push delivery (see flow7_core.push): auto | firebase | http | memory | log
+PUSH_TRANSPORT = os.getenv("PUSH_TRANSPORT", "auto").lower()
+PUSH_STANDIN_URL = os.getenv("PUSH_STANDIN_URL", "http://127.0.0.1:8787")
+PUSH_HTTP_TIMEOUT = float(os.getenv("PUSH_HTTP_TIMEOUT", "10"))
+PUSH_BATCH_SIZE = int(os.getenv("PUSH_BATCH_SIZE", "500"))  # FCM multicast accepts at most 500 tokens
+PUSH_CONCURRENCY = int(os.getenv("PUSH_CONCURRENCY", "4"))
+
+# When a plan's reminder fires, the user's pending plans due within this many seconds after it
+# are sent with it as a single digest notification (0 disables coalescing)
+NOTIFY_COALESCE_WINDOW_SECONDS = int(os.getenv("NOTIFY_COALESCE_WINDOW_SECONDS", "60"))
+# Notification texts (flow7_core.i18n) are rendered in user_settings.language_code; users whose
+# language has no templates get this one
+NOTIFICATION_DEFAULT_LANGUAGE = os.getenv("NOTIFICATION_DEFAULT_LANGUAGE", "en").lower()
+
+# Notification dispatch: "scheduler" (one APScheduler job per plan in every API process) or "sharded"
+# (plans.notify_at is polled by dispatcher processes, each owning a share of the uid-hash shards;
+# see flow7_core.dispatch). DISPATCH_SHARDS is fixed since plans store their shard.
+DISPATCH_MODE = os.getenv("DISPATCH_MODE", "scheduler").lower()
+DISPATCH_SHARDS = 256
+DISPATCH_POLL_SECONDS = float(os.getenv("DISPATCH_POLL_SECONDS", "5"))
+# a dispatcher that has not renewed its leases/heartbeat for this long is considered gone
+DISPATCH_LEASE_SECONDS = int(os.getenv("DISPATCH_LEASE_SECONDS", "30"))
+DISPATCH_BATCH_SIZE = int(os.getenv("DISPATCH_BATCH_SIZE", "500"))  # due plans fetched per poll
+DISPATCH_CONCURRENCY = int(os.getenv("DISPATCH_CONCURRENCY", "8"))  # plans dispatched in parallel per process
+
+# Reminders for plans and users without their own choice: comma-separated names from
+# flow7_core.reminders.REMINDER_SLOTS (e.g. "start-10m,start"); "start" is a single reminder at the start time
+DEFAULT_REMINDERS = os.getenv("DEFAULT_REMINDERS", "start")
+
+# Subscription tiers: how many days ahead a user may plan
+SUBSCRIPTION_LIMITS_IN_DAYS = {"FREE": 14, "PRO": 60, "ULTRA": 365}
+
+# Notification jobs are kept for plans dated up to this many days ahead (restart reschedule, bulk copy);
+# later plans get theirs from the look-ahead sweep when they enter the window
+SCHEDULE_LOOKAHEAD_DAYS = int(os.getenv("SCHEDULE_LOOKAHEAD_DAYS", "7"))
+# Interval of the look-ahead sweep (scheduler dispatch mode only); must be well below a day
+SCHEDULE_SWEEP_INTERVAL_SECONDS = int(os.getenv("SCHEDULE_SWEEP_INTERVAL_SECONDS", "3600"))
+
+# Per-uid token-bucket rate limiting (FREE tier values; other tiers get RATE_LIMIT_TIER_MULTIPLIERS times them)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "120"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "30"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Paid tiers buy headroom, not an unbounded request budget: a longer planning horizon barely changes
+# how often a client calls the API, so the scale is a small fixed step per tier (unknown tiers = FREE)
+RATE_LIMIT_TIER_MULTIPLIERS = {"FREE": 1.0, "PRO": 2.0, "ULTRA": 3.0}
+
+# Expired subscriptions are downgraded by a periodic sweeper (flow7_core.subscriptions)
+SUBSCRIPTION_SWEEP_INTERVAL_SECONDS = int(os.getenv("SUBSCRIPTION_SWEEP_INTERVAL_SECONDS", "300"))
+SUBSCRIPTION_SWEEP_BATCH_SIZE = int(os.getenv("SUBSCRIPTION_SWEEP_BATCH_SIZE", "1000"))
+# Resolved user contexts (settings row) are cached per process for this long
+USER_CONTEXT_TTL_SECONDS = float(os.getenv("USER_CONTEXT_TTL_SECONDS", "60"))
+USER_CONTEXT_CACHE_SIZE = int(os.getenv("USER_CONTEXT_CACHE_SIZE", "50000"))
+
+# Idempotency-Key support for plan writes (flow7_core.idempotency)
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "20000"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+
+# Retention: notified plans older than this many days move to plans_archive (0 disables compaction).
+# Lowering it is safe; after raising it, archived plans newer than the new cutoff are no longer listed.
+PLAN_RETENTION_DAYS = int(os.getenv("PLAN_RETENTION_DAYS", "90"))
+PLAN_ARCHIVE_INTERVAL_SECONDS = int(os.getenv("PLAN_ARCHIVE_INTERVAL_SECONDS", "3600"))
+PLAN_ARCHIVE_BATCH_SIZE = int(os.getenv("PLAN_ARCHIVE_BATCH_SIZE", "1000"))
+
+# Plan change events for open clients (GET /api/plans/events, flow7_core.events): memory | standin
+EVENTS_BROKER = os.getenv("EVENTS_BROKER", "memory").lower()
+EVENTS_STANDIN_URL = os.getenv("EVENTS_STANDIN_URL", "http://127.0.0.1:8788")
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))  # per stream; a slow client past this gets a resync event
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+EVENTS_MAX_STREAMS_PER_USER = int(os.getenv("EVENTS_MAX_STREAMS_PER_USER", "5"))
+
+# Device token registration (PUT /user/devices/, flow7_core.devices)
+DEVICE_LAST_SEEN_RESOLUTION_SECONDS = int(os.getenv("DEVICE_LAST_SEEN_RESOLUTION_SECONDS", "86400"))
+DEVICE_TOKEN_CACHE_TTL_SECONDS = float(os.getenv("DEVICE_TOKEN_CACHE_TTL_SECONDS", "300"))
+DEVICE_TOKEN_CACHE_SIZE = int(os.getenv("DEVICE_TOKEN_CACHE_SIZE", "50000"))
+
+# In-memory user state fallbacks (flow7_core.state): max uids per store, and how long a fallback
+# settings entry lives without being rewritten (session timezones carry their own ttl_hours)
+STATE_MAX_ENTRIES = int(os.getenv("STATE_MAX_ENTRIES", "100000"))
+USER_FALLBACK_TTL_SECONDS = float(os.getenv("USER_FALLBACK_TTL_SECONDS", "86400"))
+# expired entries are also purged by a scheduler job this often, so expiry does not wait for traffic
+STATE_PURGE_INTERVAL_SECONDS = int(os.getenv("STATE_PURGE_INTERVAL_SECONDS", "60"))
+
+# iCalendar import (POST /api/plans/import): request bodies above ICS_IMPORT_MAX_BYTES are rejected,
+# bodies are spooled to disk above ICS_IMPORT_SPOOL_BYTES, and plans are inserted and committed
+# ICS_IMPORT_CHUNK_SIZE at a time
+ICS_IMPORT_MAX_BYTES = int(os.getenv("ICS_IMPORT_MAX_BYTES", str(20 * 1024 * 1024)))
+ICS_IMPORT_SPOOL_BYTES = int(os.getenv("ICS_IMPORT_SPOOL_BYTES", str(1024 * 1024)))
+ICS_IMPORT_CHUNK_SIZE = int(os.getenv("ICS_IMPORT_CHUNK_SIZE", "500"))
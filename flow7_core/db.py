@@ -1,17 +1,87 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from .config import DATABASE_URL
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from .config import DATABASE_URL, DATABASE_REPLICA_URL, REPLICA_STICKY_SECONDS, REPLICA_STICKY_MAX_USERS
+from .metrics import instrument_engine, DB_READS_ROUTED
 
-# Create engine and session factory
-connect_args = {}
-if DATABASE_URL.startswith("sqlite"):
-    connect_args = {"check_same_thread": False}
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args, echo=False)
+def _connect_args(url: str) -> dict:
+    if url.startswith("sqlite"):
+        return {"check_same_thread": False}
+    return {}
+
+
+# Create engine and session factory
+engine = create_engine(DATABASE_URL, connect_args=_connect_args(DATABASE_URL), echo=False)
+instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Optional read replica. Schema and replication are managed outside the app (streaming replication
+# on Postgres; for local testing a copy of the primary SQLite file works).
+replica_engine = None
+ReplicaSessionLocal = None
+if DATABASE_REPLICA_URL:
+    replica_engine = create_engine(DATABASE_REPLICA_URL, connect_args=_connect_args(DATABASE_REPLICA_URL), echo=False)
+    instrument_engine(replica_engine, track_pool=False)
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
+
+def add_missing_columns(bind=None) -> list:
+    """ALTER existing tables to add nullable model columns they lack (create_all never alters).
+
+    Covers the additive changes this app makes; anything else needs a real migration.
+    Returns the added "table.column" names.
+    """
+    from sqlalchemy import inspect
+
+    bind = bind or engine
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present or not column.nullable:
+                    continue
+                col_type = column.type.compile(dialect=bind.dialect)
+                conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}')
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def add_missing_indexes(bind=None) -> None:
+    """Create model indexes missing from existing tables (create_all only indexes tables it creates)."""
+    bind = bind or engine
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+
+def init_db() -> None:
+    """Create missing tables/columns, the search index and the plan statistics. Run from app startup (or by scripts), never as an import side effect."""
+    from sqlalchemy import inspect
+    from . import models  # noqa: F401  registers every table on Base.metadata
+    from .search import ensure_search_index
+    from .stats import backfill_stats
+    from .dispatch import backfill_dispatch_shards
+
+    existing_tables = set(inspect(engine).get_table_names())
+    Base.metadata.create_all(bind=engine)
+    added = add_missing_columns()
+    add_missing_indexes()
+    if "plans.dispatch_shard" in added:
+        backfill_dispatch_shards(engine)
+    ensure_search_index(engine)
+    if models.PlanDailyStats.__tablename__ not in existing_tables:
+        backfill_stats(engine)
+
 
 def get_db():
     db = SessionLocal()
@@ -19,3 +89,68 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# uid -> monotonic time until which that user's reads stay on the primary
+_STICKY_USERS = OrderedDict()
+_STICKY_LOCK = threading.Lock()
+
+
+def mark_user_written(uid: str) -> None:
+    """Pin `uid`'s reads to the primary for REPLICA_STICKY_SECONDS (called after each commit)."""
+    if ReplicaSessionLocal is None or not uid:
+        return
+    with _STICKY_LOCK:
+        _STICKY_USERS[uid] = time.monotonic() + REPLICA_STICKY_SECONDS
+        _STICKY_USERS.move_to_end(uid)
+        if len(_STICKY_USERS) > REPLICA_STICKY_MAX_USERS:
+            _STICKY_USERS.popitem(last=False)
+
+
+def _is_sticky(uid: str) -> bool:
+    with _STICKY_LOCK:
+        until = _STICKY_USERS.get(uid)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            del _STICKY_USERS[uid]
+            return False
+        return True
+
+
+def read_session_for(uid: str) -> Session:
+    """Session for a read-only request of `uid`: the replica unless the user wrote recently."""
+    if ReplicaSessionLocal is None:
+        DB_READS_ROUTED.inc(target="primary")
+        return SessionLocal()
+    if _is_sticky(uid):
+        DB_READS_ROUTED.inc(target="sticky")
+        return SessionLocal()
+    DB_READS_ROUTED.inc(target="replica")
+    return ReplicaSessionLocal()
+
+
+# Rows owned by a user carry it as `user_id` (plans) or `uid` (settings, devices)
+def _row_owner(obj):
+    return getattr(obj, "user_id", None) or getattr(obj, "uid", None)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_written_users(session, flush_context):
+    if ReplicaSessionLocal is None:
+        return
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        uid = _row_owner(obj)
+        if uid:
+            session.info.setdefault("flow7_users_written", set()).add(uid)
+
+
+@event.listens_for(Session, "after_commit")
+def _stick_written_users(session):
+    for uid in session.info.pop("flow7_users_written", ()):
+        mark_user_written(uid)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_written_users(session):
+    session.info.pop("flow7_users_written", None)
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from uuid import uuid4
+
+from sqlalchemy import delete, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from flow7_core.config import DEVICE_LAST_SEEN_RESOLUTION_SECONDS, DEVICE_TOKEN_CACHE_TTL_SECONDS, DEVICE_TOKEN_CACHE_SIZE
+from flow7_core.db import SessionLocal
+from flow7_core.models import DeviceToken
+from flow7_core.metrics import DEVICE_REGISTRATIONS
+
+# uid -> (tokens, monotonic expiry). Registration and pruning invalidate both the old and the new
+# owner of a token, so the TTL only bounds staleness across processes.
+_USER_TOKENS = OrderedDict()
+_USER_TOKENS_LOCK = threading.Lock()
+
+
+def invalidate_user_tokens(*uids: str) -> None:
+    with _USER_TOKENS_LOCK:
+        for uid in uids:
+            _USER_TOKENS.pop(uid, None)
+
+
+def user_tokens(uid: str) -> List[str]:
+    """Device tokens of `uid`, served from the per-uid cache when fresh."""
+    now = time.monotonic()
+    with _USER_TOKENS_LOCK:
+        entry = _USER_TOKENS.get(uid)
+        if entry is not None and entry[1] > now:
+            _USER_TOKENS.move_to_end(uid)
+            return entry[0]
+    db = SessionLocal()
+    try:
+        tokens = db.execute(select(DeviceToken.token).where(DeviceToken.uid == uid)).scalars().all()
+    finally:
+        db.close()
+    with _USER_TOKENS_LOCK:
+        _USER_TOKENS[uid] = (tokens, now + DEVICE_TOKEN_CACHE_TTL_SECONDS)
+        _USER_TOKENS.move_to_end(uid)
+        while len(_USER_TOKENS) > DEVICE_TOKEN_CACHE_SIZE:
+            _USER_TOKENS.popitem(last=False)
+    return tokens
+
+
+def _upsert_statement(dialect: str, values: dict, stale_before: datetime):
+    """INSERT .. ON CONFLICT (token) DO UPDATE, skipping the update when nothing would change."""
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(DeviceToken).values(**values)
+    excluded = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=[DeviceToken.token],
+        set_={"uid": excluded.uid, "platform": excluded.platform, "last_seen_at": excluded.last_seen_at},
+        where=or_(
+            DeviceToken.uid != excluded.uid,
+            DeviceToken.platform.is_distinct_from(excluded.platform),
+            DeviceToken.last_seen_at.is_(None),
+            DeviceToken.last_seen_at < stale_before,
+        ),
+    )
+
+
+def register_device_token(db: Session, uid: str, token: str, platform: Optional[str], now: Optional[datetime] = None) -> Tuple[bool, Optional[str]]:
+    """Attach `token` to `uid` (moving it from a previous owner) and refresh last_seen_at.
+
+    Returns (written, previous_uid). App launches re-register the same token constantly, so the
+    common case is a single indexed read and no write: the row is only touched when the owner or
+    platform changes or last_seen_at is older than DEVICE_LAST_SEEN_RESOLUTION_SECONDS.
+    """
+    now = (now or datetime.now(timezone.utc)).astimezone(timezone.utc).replace(tzinfo=None)
+    stale_before = now - timedelta(seconds=DEVICE_LAST_SEEN_RESOLUTION_SECONDS)
+    current = db.execute(select(DeviceToken.uid, DeviceToken.platform, DeviceToken.last_seen_at).where(DeviceToken.token == token)).first()
+    if current is not None and current.uid == uid and current.platform == platform and current.last_seen_at is not None and current.last_seen_at >= stale_before:
+        DEVICE_REGISTRATIONS.inc(outcome="unchanged")
+        return False, uid
+
+    values = {"id": str(uuid4()), "uid": uid, "token": token, "platform": platform, "last_seen_at": now, "created_at": now}
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        db.execute(_upsert_statement(dialect, values, stale_before))
+        db.commit()
+    else:
+        # generic fallback: update in place, or insert and retry as an update if a concurrent insert won
+        try:
+            row = db.execute(select(DeviceToken).where(DeviceToken.token == token)).scalar_one_or_none()
+            if row is None:
+                db.add(DeviceToken(**values))
+            else:
+                row.uid, row.platform, row.last_seen_at = uid, platform, now
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            row = db.execute(select(DeviceToken).where(DeviceToken.token == token)).scalar_one()
+            row.uid, row.platform, row.last_seen_at = uid, platform, now
+            db.commit()
+
+    previous_uid = current.uid if current is not None else None
+    invalidate_user_tokens(*{uid, previous_uid} - {None})
+    DEVICE_REGISTRATIONS.inc(outcome="moved" if previous_uid not in (None, uid) else ("refreshed" if current is not None else "created"))
+    return True, previous_uid
+
+
+def prune_tokens(uids, tokens) -> int:
+    """Delete tokens the provider reported as unregistered and drop the cached token lists of `uids`."""
+    tokens = list(tokens)
+    if not tokens:
+        return 0
+    db = SessionLocal()
+    try:
+        deleted = db.execute(delete(DeviceToken).where(DeviceToken.token.in_(tokens))).rowcount
+        db.commit()
+    finally:
+        db.close()
+    invalidate_user_tokens(*uids)
+    return deleted or 0
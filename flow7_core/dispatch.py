@@ -0,0 +1,222 @@
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import List, Set
+
+from sqlalchemy import bindparam, delete, exists, or_, select, update
+from sqlalchemy.orm import Session
+
+from flow7_core.config import DISPATCH_SHARDS, DISPATCH_POLL_SECONDS, DISPATCH_LEASE_SECONDS, DISPATCH_BATCH_SIZE, DISPATCH_CONCURRENCY
+from flow7_core.db import SessionLocal
+from flow7_core.models import PlanORM, DispatchLease, DispatchWorker, UserSettings, dispatch_shard_for
+from flow7_core.metrics import DISPATCH_SHARDS_HELD, DISPATCH_WORKERS, DISPATCH_POLL_LATENCY
+from flow7_core.log import get_logger
+
+logger = get_logger("dispatch")
+
+# Sharded notification dispatch (DISPATCH_MODE=sharded). Instead of one APScheduler job per plan in
+# every process, dispatchers poll plans.notify_at, which already holds each pending plan's next
+# reminder. Plans are split into DISPATCH_SHARDS shards by a hash of user_id (plans.dispatch_shard),
+# so all plans of a user go through one process and per-user locking and coalescing stay local.
+#
+# Coordination uses only the database. Live dispatchers heartbeat in dispatch_workers and split the
+# shards evenly (shard s belongs to the (s mod n)-th live worker by id). A shard is only polled under
+# its dispatch_leases row, which is taken and renewed with conditional UPDATEs. When a dispatcher
+# joins, the others release the shards now assigned to it at their next poll. When one leaves, it
+# releases its leases; when one dies, its leases expire after DISPATCH_LEASE_SECONDS. Throughput
+# grows with the number of dispatchers because each polls and sends only its own shards.
+
+# stop dispatching a batch when the lease has less than this left (a stalled process must not overlap the next owner)
+LEASE_SAFETY_SECONDS = 5
+# worker rows without a heartbeat for this many lease periods are deleted
+STALE_WORKER_LEASES = 10
+# how old a due notify_at may be and still be sent (matches scheduler.GRACE_WINDOW)
+GRACE_WINDOW = timedelta(hours=24)
+
+
+def _utcnow() -> datetime:
+    # notify_at and lease times are stored as naive UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def assigned_shards(workers: List[str], worker_id: str, shards: int = DISPATCH_SHARDS) -> Set[int]:
+    """Shards `worker_id` should own among the sorted live `workers`."""
+    if worker_id not in workers:
+        return set()
+    index, count = workers.index(worker_id), len(workers)
+    return {s for s in range(shards) if s % count == index}
+
+
+def backfill_dispatch_shards(engine) -> int:
+    """Set dispatch_shard on plans that predate the column; one UPDATE per user, run once."""
+    db = Session(bind=engine)
+    try:
+        uids = db.execute(select(PlanORM.user_id).where(PlanORM.dispatch_shard.is_(None)).distinct()).scalars().all()
+        if uids:
+            plans = PlanORM.__table__
+            db.execute(
+                update(plans).where(plans.c.user_id == bindparam("b_uid")).values(dispatch_shard=bindparam("b_shard")),
+                [{"b_uid": uid, "b_shard": dispatch_shard_for(uid)} for uid in uids],
+            )
+            db.commit()
+            logger.info("dispatch shards assigned to existing plans", extra={"users": len(uids)})
+        return len(uids)
+    finally:
+        db.close()
+
+
+class ShardDispatcher:
+    """One dispatcher process's view: its heartbeat, leased shards and the poll over their due plans."""
+
+    def __init__(self, worker_id: str = None, session_factory=SessionLocal, dispatch=None, clock=_utcnow):
+        self.worker_id = worker_id or new_worker_id()
+        self.session_factory = session_factory
+        self.clock = clock
+        self.held: Set[int] = set()
+        self._lease_deadline = 0.0  # monotonic time until which self.held is safe to use
+        self._leases_created = False
+        self._pool = None
+        if dispatch is None:
+            from flow7_core.scheduler import _dispatch_plan as dispatch
+        self._dispatch = dispatch
+
+    def _ensure_lease_rows(self, db: Session) -> None:
+        if self._leases_created:
+            return
+        present = set(db.execute(select(DispatchLease.shard)).scalars())
+        missing = [{"shard": s} for s in range(DISPATCH_SHARDS) if s not in present]
+        if missing:
+            try:
+                db.execute(DispatchLease.__table__.insert(), missing)
+                db.commit()
+            except Exception:
+                db.rollback()  # another dispatcher created them concurrently
+        self._leases_created = True
+
+    def rebalance(self, db: Session) -> Set[int]:
+        """Heartbeat, then release shards assigned elsewhere and take or renew the ones assigned here."""
+        now = self.clock()
+        started = time.monotonic()
+        ttl = timedelta(seconds=DISPATCH_LEASE_SECONDS)
+        me = self.worker_id
+        self._ensure_lease_rows(db)
+
+        if not db.execute(update(DispatchWorker).where(DispatchWorker.worker_id == me).values(heartbeat_at=now)).rowcount:
+            db.add(DispatchWorker(worker_id=me, heartbeat_at=now))
+        db.execute(delete(DispatchWorker).where(DispatchWorker.heartbeat_at < now - ttl * STALE_WORKER_LEASES))
+        db.flush()
+        workers = sorted(db.execute(select(DispatchWorker.worker_id).where(DispatchWorker.heartbeat_at >= now - ttl)).scalars())
+        wanted = assigned_shards(workers, me)
+
+        lease = DispatchLease
+        db.execute(update(lease).where(lease.owner == me, lease.shard.not_in(wanted)).values(owner=None, expires_at=None))
+        if wanted:
+            db.execute(update(lease).where(
+                lease.shard.in_(wanted),
+                or_(lease.owner == me, lease.owner.is_(None), lease.expires_at.is_(None), lease.expires_at < now),
+            ).values(owner=me, expires_at=now + ttl))
+        db.commit()
+        self.held = set(db.execute(select(lease.shard).where(lease.owner == me, lease.expires_at > now)).scalars())
+        self._lease_deadline = started + DISPATCH_LEASE_SECONDS - LEASE_SAFETY_SECONDS
+        DISPATCH_WORKERS.set(len(workers))
+        DISPATCH_SHARDS_HELD.set(len(self.held))
+        return self.held
+
+    def due_plan_ids(self, db: Session) -> List[str]:
+        if not self.held:
+            return []
+        now = self.clock()
+        return list(db.execute(select(PlanORM.id).where(
+            PlanORM.dispatch_shard.in_(self.held),
+            PlanORM.notified == False,
+            PlanORM.notify_at <= now,
+            PlanORM.notify_at >= now - GRACE_WINDOW,
+            # users who turned notifications off; users without a settings row default to on
+            ~exists().where(UserSettings.uid == PlanORM.user_id, UserSettings.notifications_enabled == False),
+        ).order_by(PlanORM.notify_at).limit(DISPATCH_BATCH_SIZE)).scalars())
+
+    def _dispatch_checked(self, plan_id: str) -> bool:
+        if time.monotonic() >= self._lease_deadline:
+            return False
+        self._dispatch(plan_id)
+        return True
+
+    def poll(self) -> int:
+        """One round: rebalance leases and dispatch due plans of the held shards. Returns plans dispatched."""
+        with DISPATCH_POLL_LATENCY.time():
+            db = self.session_factory()
+            try:
+                self.rebalance(db)
+                plan_ids = self.due_plan_ids(db)
+            finally:
+                db.close()
+            if not plan_ids:
+                return 0
+            if DISPATCH_CONCURRENCY > 1 and len(plan_ids) > 1:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=DISPATCH_CONCURRENCY, thread_name_prefix="flow7-dispatch")
+                done = sum(self._pool.map(self._dispatch_checked, plan_ids))
+            else:
+                done = sum(self._dispatch_checked(plan_id) for plan_id in plan_ids)
+        if done < len(plan_ids):
+            logger.warning("dispatch: lease nearly expired; %d due plans left for the next poll", len(plan_ids) - done)
+        return done
+
+    def release(self) -> None:
+        """Give up all leases and the heartbeat so the remaining dispatchers take over right away."""
+        db = self.session_factory()
+        try:
+            db.execute(update(DispatchLease).where(DispatchLease.owner == self.worker_id).values(owner=None, expires_at=None))
+            db.execute(delete(DispatchWorker).where(DispatchWorker.worker_id == self.worker_id))
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("dispatch: failed to release leases")
+        finally:
+            db.close()
+        self.held = set()
+        DISPATCH_SHARDS_HELD.set(0)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+def run_forever(dispatcher: ShardDispatcher, stop: threading.Event) -> None:
+    logger.info("dispatcher started", extra={"worker_id": dispatcher.worker_id})
+    try:
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                dispatcher.poll()
+            except Exception:
+                logger.exception("dispatch: poll failed")
+            stop.wait(max(0.0, DISPATCH_POLL_SECONDS - (time.monotonic() - started)))
+    finally:
+        dispatcher.release()
+        logger.info("dispatcher stopped", extra={"worker_id": dispatcher.worker_id})
+
+
+def main() -> None:
+    """Dedicated dispatcher process: python -m flow7_core.dispatch (run as many as needed)."""
+    from flow7_core.config import init_firebase
+    from flow7_core.db import init_db
+
+    init_db()
+    init_firebase()
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    run_forever(ShardDispatcher(), stop)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import abc
+import asyncio
+import itertools
+import json
+import queue
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from flow7_core.config import EVENTS_BROKER, EVENTS_STANDIN_URL, EVENTS_QUEUE_SIZE, EVENTS_HEARTBEAT_SECONDS
+from flow7_core.metrics import EVENT_STREAMS, EVENTS_PUBLISHED, EVENTS_DROPPED
+from flow7_core.log import get_logger
+
+logger = get_logger("events")
+
+# Plan change events for open clients (GET /api/plans/events, Server-Sent Events). Write paths queue
+# events on their Session; they are published only after the transaction commits. The broker fans
+# them out to the subscriptions of the event's uid: in-process by default, or through the local
+# stand-in (flow7_core.events_standin) when several API processes serve the same users.
+#
+# Nothing is kept for replay. Event ids are opaque and unique across processes and restarts (a
+# per-process token plus a counter) so that a reconnecting EventSource sends Last-Event-ID; any
+# such reconnect is answered with `resync`, since the events it missed are gone.
+
+_process_token = uuid.uuid4().hex[:12]
+_event_seq = itertools.count(1)
+
+
+def _next_event_id() -> str:
+    return f"{_process_token}-{next(_event_seq)}"
+
+
+class Subscription:
+    """One open stream. Events are handed over from any thread onto the stream's event loop."""
+
+    def __init__(self, uid: str, loop: asyncio.AbstractEventLoop, maxsize: int = EVENTS_QUEUE_SIZE):
+        self.uid = uid
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def _put(self, item) -> None:
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # slow client: drop, and tell it to refetch once it catches up
+            self.overflowed = True
+            EVENTS_DROPPED.inc()
+
+    def deliver(self, item) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self._put, item)
+        except RuntimeError:
+            pass  # loop already closed; the stream is gone
+
+
+class EventBroker(abc.ABC):
+    name = "base"
+
+    @abc.abstractmethod
+    def publish(self, uid: str, item: dict) -> None:
+        ...
+
+    @abc.abstractmethod
+    def subscribe(self, uid: str) -> Subscription:
+        ...
+
+    @abc.abstractmethod
+    def unsubscribe(self, sub: Subscription) -> None:
+        ...
+
+    @abc.abstractmethod
+    def stream_count(self, uid: Optional[str] = None) -> int:
+        ...
+
+
+class InMemoryEventBroker(EventBroker):
+    """Fan-out to the streams open in this process."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._subs: Dict[str, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def _fan_out(self, uid: str, item: dict) -> None:
+        with self._lock:
+            subs = list(self._subs.get(uid, ()))
+        for sub in subs:
+            sub.deliver(item)
+
+    def publish(self, uid, item):
+        EVENTS_PUBLISHED.inc()
+        self._fan_out(uid, item)
+
+    def subscribe(self, uid):
+        sub = Subscription(uid, asyncio.get_running_loop())
+        with self._lock:
+            self._subs.setdefault(uid, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subs.get(sub.uid)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.uid]
+
+    def stream_count(self, uid=None):
+        with self._lock:
+            if uid is not None:
+                return len(self._subs.get(uid, ()))
+            return sum(len(s) for s in self._subs.values())
+
+
+class StandInEventBroker(InMemoryEventBroker):
+    """Relays events through the local stand-in so every API process sees every write.
+
+    publish() only enqueues; a sender thread posts to the stand-in and a reader thread consumes
+    its NDJSON stream and fans events out locally (including this process's own events).
+    """
+
+    name = "standin"
+
+    def __init__(self, base_url: str = EVENTS_STANDIN_URL):
+        super().__init__()
+        import httpx
+
+        self.client = httpx.Client(base_url=base_url.rstrip("/"), timeout=httpx.Timeout(10.0, read=None))
+        self._outbox: "queue.Queue" = queue.Queue(maxsize=10000)
+        threading.Thread(target=self._send_loop, name="flow7-events-send", daemon=True).start()
+        threading.Thread(target=self._read_loop, name="flow7-events-read", daemon=True).start()
+
+    def publish(self, uid, item):
+        EVENTS_PUBLISHED.inc()
+        try:
+            self._outbox.put_nowait({"uid": uid, "event": item})
+        except queue.Full:
+            EVENTS_DROPPED.inc()
+
+    def _send_loop(self):
+        while True:
+            message = self._outbox.get()
+            try:
+                self.client.post("/v1/publish", json=message).raise_for_status()
+            except Exception as e:
+                EVENTS_DROPPED.inc()
+                logger.warning("event stand-in publish failed: %s", e)
+
+    def _read_loop(self):
+        backoff = 0.5
+        while True:
+            try:
+                with self.client.stream("GET", "/v1/stream") as r:
+                    r.raise_for_status()
+                    backoff = 0.5
+                    for line in r.iter_lines():
+                        if line:
+                            message = json.loads(line)
+                            self._fan_out(message["uid"], message["event"])
+            except Exception as e:
+                logger.warning("event stand-in stream lost, reconnecting: %s", e)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 10.0)
+
+
+_broker: Optional[EventBroker] = None
+_broker_lock = threading.Lock()
+
+
+def _build_broker(kind: str) -> EventBroker:
+    if kind == "standin":
+        return StandInEventBroker()
+    return InMemoryEventBroker()
+
+
+def get_broker() -> EventBroker:
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = _build_broker(EVENTS_BROKER)
+    return _broker
+
+
+def set_broker(broker: Optional[EventBroker]) -> None:
+    """Swap the active broker (tests, stand-in runs). None re-reads EVENTS_BROKER."""
+    global _broker
+    with _broker_lock:
+        _broker = broker
+
+
+EVENT_STREAMS.set_callback(lambda: _broker.stream_count() if _broker is not None else 0)
+
+
+def queue_plan_event(db: Session, uid: str, kind: str, data: dict) -> None:
+    """Publish `kind` (plan.created / plan.updated / plan.deleted) for `uid` once `db` commits."""
+    db.info.setdefault("flow7_plan_events", []).append((uid, kind, data))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_plan_events(session):
+    pending = session.info.pop("flow7_plan_events", None)
+    if not pending:
+        return
+    broker = get_broker()
+    for uid, kind, data in pending:
+        try:
+            broker.publish(uid, {"id": _next_event_id(), "type": kind, "data": data})
+        except Exception:
+            logger.exception("failed to publish plan event")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_plan_events(session):
+    session.info.pop("flow7_plan_events", None)
+
+
+def _sse(item: dict) -> bytes:
+    return f"id: {item['id']}\nevent: {item['type']}\ndata: {json.dumps(item['data'], ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+async def sse_stream(uid: str, request, heartbeat: float = EVENTS_HEARTBEAT_SECONDS):
+    """Yield SSE frames of `uid`'s events until the client disconnects; comments keep proxies from timing out.
+
+    A client reconnecting with Last-Event-ID may have missed events; it gets `resync` straight away.
+    """
+    broker = get_broker()
+    sub = broker.subscribe(uid)
+    try:
+        yield b"retry: 3000\n\n"
+        if request.headers.get("last-event-id"):
+            yield b"event: resync\ndata: {}\n\n"
+        while True:
+            try:
+                item = await asyncio.wait_for(sub.queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield b": ping\n\n"
+                continue
+            if sub.overflowed:
+                sub.overflowed = False
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                yield b"event: resync\ndata: {}\n\n"
+                continue
+            yield _sse(item)
+    finally:
+        broker.unsubscribe(sub)
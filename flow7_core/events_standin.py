@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import json
+from typing import Any, Dict, Set
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+# Local pub/sub stand-in for running several API processes against one set of clients. Start it with
+#   python -m flow7_core.events_standin --port 8788
+# and point every API process at it with
+#   EVENTS_BROKER=standin EVENTS_STANDIN_URL=http://127.0.0.1:8788
+# Every published event is relayed to every connected API process, which fans it out to its own streams.
+
+app = FastAPI(title="Flow7 event stand-in")
+_streams: Set[asyncio.Queue] = set()
+_stats = {"published": 0, "dropped": 0}
+
+STREAM_QUEUE_SIZE = 10000
+
+
+class PublishRequest(BaseModel):
+    uid: str
+    event: Dict[str, Any]
+
+
+@app.post("/v1/publish")
+async def publish(req: PublishRequest):
+    line = (json.dumps({"uid": req.uid, "event": req.event}, ensure_ascii=False) + "\n").encode("utf-8")
+    _stats["published"] += 1
+    for q in list(_streams):
+        try:
+            q.put_nowait(line)
+        except asyncio.QueueFull:
+            _stats["dropped"] += 1
+    return {"delivered_to": len(_streams)}
+
+
+@app.get("/v1/stream")
+async def stream():
+    q: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    _streams.add(q)
+
+    async def lines():
+        try:
+            while True:
+                yield await q.get()
+        finally:
+            _streams.discard(q)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/v1/stats")
+def get_stats():
+    return {**_stats, "streams": len(_streams)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local event pub/sub stand-in server")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8788)
+    args = ap.parse_args()
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import base64
+import csv
+import io
+import json
+from datetime import date as PyDate, time as PyTime
+from typing import Callable, Iterator, Optional
+
+from sqlalchemy import func, select, tuple_, union_all
+from sqlalchemy.orm import aliased
+
+from flow7_core.db import SessionLocal
+from flow7_core.models import PlanORM, PlanArchiveORM
+from flow7_core.retention import PLAN_COLUMNS, range_reaches_archive
+
+# rows fetched per round trip when streaming an export
+EXPORT_YIELD_PER = 500
+
+CSV_FIELDS = ["id", "user_id", "date", "start_time", "end_time", "title", "description", "notified"]
+
+
+def encode_cursor(plan) -> str:
+    """Encode the (date, start_time, id) keyset position of a plan as an opaque cursor."""
+    raw = json.dumps([plan.date.isoformat(), plan.start_time.isoformat(), plan.id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Decode a cursor produced by `encode_cursor`. Raises ValueError on malformed input."""
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        d, t, plan_id = json.loads(base64.urlsafe_b64decode((cursor + padding).encode("ascii")))
+        return PyDate.fromisoformat(d), PyTime.fromisoformat(t), str(plan_id)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def _range_filter(table, uid: str, start_date: Optional[PyDate], end_date: Optional[PyDate], after=None):
+    c = table.c
+    clauses = [c.user_id == uid]
+    if start_date is not None:
+        clauses.append(c.date >= start_date)
+    if end_date is not None:
+        clauses.append(c.date <= end_date)
+    if after is not None:
+        clauses.append(tuple_(c.date, c.start_time, c.id) > tuple_(*after))
+    return clauses
+
+
+def _plans_with_archive(uid: str, start_date: Optional[PyDate], end_date: Optional[PyDate], after=None):
+    """PlanORM entity over `plans UNION ALL plans_archive`, with the filters pushed into both branches."""
+    branches = []
+    for table in (PlanORM.__table__, PlanArchiveORM.__table__):
+        cols = [table.c[name] for name in PLAN_COLUMNS]
+        branches.append(select(*cols).where(*_range_filter(table, uid, start_date, end_date, after)))
+    return aliased(PlanORM, union_all(*branches).subquery("plans_all"))
+
+
+def plans_range_query(uid: str, start_date: Optional[PyDate] = None, end_date: Optional[PyDate] = None, after=None):
+    """Select a user's plans ordered by the (date, start_time, id) keyset.
+
+    `after` is a decoded cursor; only rows strictly after that position are returned. Ranges that
+    start before the retention cutoff also read plans_archive (rows come back as read-only PlanORM).
+    """
+    if range_reaches_archive(start_date):
+        plans = _plans_with_archive(uid, start_date, end_date, after)
+        return select(plans).order_by(plans.date, plans.start_time, plans.id)
+    stmt = select(PlanORM).where(*_range_filter(PlanORM.__table__, uid, start_date, end_date, after))
+    return stmt.order_by(PlanORM.date, PlanORM.start_time, PlanORM.id)
+
+
+def plans_range_stats(uid: str, start_date: Optional[PyDate], end_date: Optional[PyDate]):
+    """Select (row count, max updated_at) of a user's plans in a range, for conditional GETs."""
+    if range_reaches_archive(start_date):
+        plans = _plans_with_archive(uid, start_date, end_date)
+        return select(func.count(plans.id), func.max(plans.updated_at))
+    return select(func.count(PlanORM.id), func.max(PlanORM.updated_at)).where(
+        *_range_filter(PlanORM.__table__, uid, start_date, end_date))
+
+
+def iter_plans(uid: str, start_date: Optional[PyDate] = None, end_date: Optional[PyDate] = None) -> Iterator[PlanORM]:
+    """Yield a user's plans from a server-side cursor, holding at most EXPORT_YIELD_PER rows.
+
+    Opens its own session so it can outlive the request-scoped one while a response streams.
+    """
+    db = SessionLocal()
+    try:
+        stmt = plans_range_query(uid, start_date, end_date).execution_options(yield_per=EXPORT_YIELD_PER)
+        for plan in db.execute(stmt).scalars():
+            yield plan
+            # drop rows already written out so the identity map does not grow with history size
+            db.expunge(plan)
+    finally:
+        db.close()
+
+
+def stream_ndjson(plans: Iterator[PlanORM], serialize: Callable[[PlanORM], dict]) -> Iterator[bytes]:
+    for plan in plans:
+        yield (json.dumps(serialize(plan), ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def stream_csv(plans: Iterator[PlanORM], serialize: Callable[[PlanORM], dict]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for plan in plans:
+        writer.writerow(serialize(plan))
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
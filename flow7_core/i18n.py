@@ -0,0 +1,147 @@
+from string import Formatter
+from typing import Callable, Dict, Optional
+
+from flow7_core.config import NOTIFICATION_DEFAULT_LANGUAGE
+from flow7_core.reminders import REMINDER_SLOTS
+
+# Notification texts per language (the app's locales, see flow7_app/lib/l10n). The catalog is
+# compiled once at import: every template is checked for its placeholders and bound to str.format,
+# and the label of every reminder slot is resolved per language, so rendering a message is a few
+# dict lookups and one format call. Plan titles and descriptions are user content and never translated.
+
+# templates and the placeholders they may use
+_FIELDS = {
+    "starts_now": (),
+    "ends_now": (),
+    "starts_in": ("offset",),
+    "digest_title": ("count",),
+}
+# offset units: (n == 1, otherwise)
+_UNITS = ("minutes", "hours", "days")
+
+_TEXTS = {
+    "ar": {
+        "starts_now": "يبدأ الآن", "ends_now": "ينتهي الآن", "starts_in": "يبدأ بعد {offset}",
+        "minutes": ("{n} دقيقة", "{n} دقيقة"), "hours": ("{n} ساعة", "{n} ساعة"), "days": ("{n} يوم", "{n} يوم"),
+        "digest_title": "Flow7: {count} خطط",
+    },
+    "de": {
+        "starts_now": "Beginnt jetzt", "ends_now": "Endet jetzt", "starts_in": "Beginnt in {offset}",
+        "minutes": ("{n} Minute", "{n} Minuten"), "hours": ("{n} Stunde", "{n} Stunden"), "days": ("{n} Tag", "{n} Tagen"),
+        "digest_title": "Flow7: {count} Pläne",
+    },
+    "en": {
+        "starts_now": "Starting now", "ends_now": "Ending now", "starts_in": "Starts in {offset}",
+        "minutes": ("{n} minute", "{n} minutes"), "hours": ("{n} hour", "{n} hours"), "days": ("{n} day", "{n} days"),
+        "digest_title": "Flow7: {count} plans",
+    },
+    "es": {
+        "starts_now": "Empieza ahora", "ends_now": "Termina ahora", "starts_in": "Empieza en {offset}",
+        "minutes": ("{n} minuto", "{n} minutos"), "hours": ("{n} hora", "{n} horas"), "days": ("{n} día", "{n} días"),
+        "digest_title": "Flow7: {count} planes",
+    },
+    "fr": {
+        "starts_now": "Commence maintenant", "ends_now": "Se termine maintenant", "starts_in": "Commence dans {offset}",
+        "minutes": ("{n} minute", "{n} minutes"), "hours": ("{n} heure", "{n} heures"), "days": ("{n} jour", "{n} jours"),
+        "digest_title": "Flow7 : {count} plans",
+    },
+    "hi": {
+        "starts_now": "अभी शुरू हो रहा है", "ends_now": "अभी समाप्त हो रहा है", "starts_in": "{offset} में शुरू होगा",
+        "minutes": ("{n} मिनट", "{n} मिनट"), "hours": ("{n} घंटे", "{n} घंटे"), "days": ("{n} दिन", "{n} दिन"),
+        "digest_title": "Flow7: {count} योजनाएँ",
+    },
+    "it": {
+        "starts_now": "Inizia ora", "ends_now": "Finisce ora", "starts_in": "Inizia tra {offset}",
+        "minutes": ("{n} minuto", "{n} minuti"), "hours": ("{n} ora", "{n} ore"), "days": ("{n} giorno", "{n} giorni"),
+        "digest_title": "Flow7: {count} piani",
+    },
+    "ja": {
+        "starts_now": "まもなく開始", "ends_now": "まもなく終了", "starts_in": "{offset}後に開始",
+        "minutes": ("{n}分", "{n}分"), "hours": ("{n}時間", "{n}時間"), "days": ("{n}日", "{n}日"),
+        "digest_title": "Flow7: {count}件の予定",
+    },
+    "ru": {
+        # only "one" and "other" forms are kept; the reminder offsets (1, 2 h; 5-30 min; 1 d) need no more
+        "starts_now": "Начинается сейчас", "ends_now": "Заканчивается сейчас", "starts_in": "Начнётся через {offset}",
+        "minutes": ("{n} минуту", "{n} минут"), "hours": ("{n} час", "{n} часа"), "days": ("{n} день", "{n} дня"),
+        "digest_title": "Flow7: планов — {count}",
+    },
+    "tr": {
+        "starts_now": "Şimdi başlıyor", "ends_now": "Şimdi bitiyor", "starts_in": "{offset} sonra başlıyor",
+        "minutes": ("{n} dakika", "{n} dakika"), "hours": ("{n} saat", "{n} saat"), "days": ("{n} gün", "{n} gün"),
+        "digest_title": "Flow7: {count} plan",
+    },
+    "zh": {
+        "starts_now": "即将开始", "ends_now": "即将结束", "starts_in": "{offset}后开始",
+        "minutes": ("{n}分钟", "{n}分钟"), "hours": ("{n}小时", "{n}小时"), "days": ("{n}天", "{n}天"),
+        "digest_title": "Flow7：{count} 个计划",
+    },
+}
+
+
+def _compile(template: str, fields, where: str) -> Callable[..., str]:
+    """Bound str.format of `template` after checking it uses only `fields`; raises ValueError otherwise."""
+    used = {name for _, name, _, _ in Formatter().parse(template) if name is not None}
+    unknown = used - set(fields)
+    if unknown:
+        raise ValueError(f"{where}: unknown placeholder(s) {sorted(unknown)}")
+    return template.format
+
+
+def _offset_text(texts: dict, minutes: int, lang: str) -> str:
+    """Largest whole unit of `minutes` (e.g. 60 -> "1 hour", 1440 -> "1 day")."""
+    for unit, size in (("days", 1440), ("hours", 60)):
+        if minutes % size == 0:
+            break
+    else:
+        unit, size = "minutes", 1
+    n = minutes // size
+    one, other = texts[unit]
+    return _compile(one if n == 1 else other, ("n",), f"{lang}.{unit}")(n=n)
+
+
+class NotificationTemplates:
+    """Compiled texts of one language."""
+
+    __slots__ = ("language", "digest_title", "reminder_labels")
+
+    def __init__(self, language: str, texts: dict):
+        missing = (set(_FIELDS) | set(_UNITS)) - set(texts)
+        if missing:
+            raise ValueError(f"{language}: missing template(s) {sorted(missing)}")
+        compiled = {key: _compile(texts[key], fields, f"{language}.{key}") for key, fields in _FIELDS.items()}
+        self.language = language
+        self.digest_title = compiled["digest_title"]
+        # reminder name -> label, e.g. "start-1h" -> "Starts in 1 hour"
+        labels = {}
+        for name, anchor, minutes in REMINDER_SLOTS:
+            if minutes == 0:
+                labels[name] = compiled["starts_now" if anchor == "start" else "ends_now"]()
+            elif anchor == "start" and minutes < 0:
+                labels[name] = compiled["starts_in"](offset=_offset_text(texts, -minutes, language))
+            else:
+                raise ValueError(f"no label rule for reminder slot {name!r}")
+        self.reminder_labels: Dict[str, str] = labels
+
+    def reminder_label(self, name: str) -> str:
+        return self.reminder_labels.get(name) or self.reminder_labels["start"]
+
+
+CATALOG: Dict[str, NotificationTemplates] = {lang: NotificationTemplates(lang, texts) for lang, texts in _TEXTS.items()}
+SUPPORTED_LANGUAGES = tuple(sorted(CATALOG))
+
+if NOTIFICATION_DEFAULT_LANGUAGE not in CATALOG:
+    raise ValueError(f"NOTIFICATION_DEFAULT_LANGUAGE={NOTIFICATION_DEFAULT_LANGUAGE!r} is not one of {SUPPORTED_LANGUAGES}")
+
+
+def resolve_language(code: Optional[str]) -> str:
+    """Catalog language for a stored language_code ("de", "pt-BR", "zh_Hans"...), else the default."""
+    if code:
+        base = code.replace("_", "-").split("-", 1)[0].strip().lower()
+        if base in CATALOG:
+            return base
+    return NOTIFICATION_DEFAULT_LANGUAGE
+
+
+def templates_for(code: Optional[str]) -> NotificationTemplates:
+    return CATALOG[resolve_language(code)]
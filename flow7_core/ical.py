@@ -0,0 +1,201 @@
+import re
+from datetime import date as PyDate, datetime, time as PyTime, timedelta, timezone
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+# Minimal iCalendar (RFC 5545) support for plan import/export: VEVENTs with a timed DTSTART and a
+# DTEND or DURATION on the same day. The parser works line by line on a file object, so memory
+# does not grow with the calendar's size; nested components (VALARM, ...) and other properties
+# are skipped.
+
+# longest unfolded content line kept; longer values are cut (and then fail plan validation)
+MAX_LINE_CHARS = 16384
+
+PRODID = "-//Flow7//Plans//EN"
+
+_DURATION_RE = re.compile(r"^\+?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+_PROPERTIES = {"UID", "SUMMARY", "DESCRIPTION", "DTSTART", "DTEND", "DURATION", "RRULE", "STATUS"}
+
+
+class IcsError(ValueError):
+    """An event that cannot become a plan; `reason` is a short machine-readable code."""
+
+    def __init__(self, reason: str, detail: str):
+        super().__init__(detail)
+        self.reason = reason
+
+
+def iter_lines(fileobj: BinaryIO) -> Iterator[Tuple[int, str]]:
+    """Yield (line number, unfolded content line); continuation lines start with a space or tab."""
+    current, start_no = None, 0
+    for no, raw in enumerate(fileobj, 1):
+        line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            if len(current) < MAX_LINE_CHARS:
+                current += line[1:]
+            continue
+        if current is not None:
+            yield start_no, current[:MAX_LINE_CHARS]
+        current, start_no = line, no
+    if current is not None:
+        yield start_no, current[:MAX_LINE_CHARS]
+
+
+def _split_property(line: str):
+    """'NAME;P1=V1;P2="a:b":value' -> (NAME, {P1: V1, P2: 'a:b'}, value)."""
+    in_quotes = False
+    for i, ch in enumerate(line):
+        if ch == '"':
+            in_quotes = not in_quotes
+        elif ch == ":" and not in_quotes:
+            head, value = line[:i], line[i + 1:]
+            break
+    else:
+        return None, {}, ""
+    name, *raw_params = head.split(";")
+    params = {}
+    for p in raw_params:
+        key, _, val = p.partition("=")
+        params[key.upper()] = val.strip('"')
+    return name.upper(), params, value
+
+
+def unescape_text(value: str) -> str:
+    out, i = [], 0
+    while i < len(value):
+        ch = value[i]
+        if ch == "\\" and i + 1 < len(value):
+            nxt = value[i + 1]
+            out.append("\n" if nxt in "nN" else nxt)
+            i += 2
+            continue
+        out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def escape_text(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n")
+
+
+def iter_events(fileobj: BinaryIO) -> Iterator[dict]:
+    """Yield the VEVENTs of a calendar as {"line", NAME: (params, value), ...} dicts."""
+    event, nested = None, 0
+    for no, line in iter_lines(fileobj):
+        name, params, value = _split_property(line)
+        if name == "BEGIN":
+            if event is not None:
+                nested += 1
+            elif value.upper() == "VEVENT":
+                event = {"line": no}
+        elif name == "END":
+            if nested:
+                nested -= 1
+            elif event is not None and value.upper() == "VEVENT":
+                yield event
+                event = None
+        elif event is not None and not nested and name in _PROPERTIES:
+            event[name] = (params, value)
+
+
+def _parse_datetime(params: dict, value: str, zone: ZoneInfo) -> datetime:
+    """DTSTART/DTEND value as a naive datetime in the user's zone."""
+    value = value.strip()
+    if params.get("VALUE", "").upper() == "DATE" or len(value) == 8:
+        raise IcsError("all_day", "all-day events are not supported")
+    try:
+        dt = datetime.strptime(value.rstrip("Zz"), "%Y%m%dT%H%M%S")
+    except ValueError:
+        raise IcsError("invalid", f"bad date-time {value!r}")
+    if value[-1:] in ("Z", "z"):
+        return dt.replace(tzinfo=timezone.utc).astimezone(zone).replace(tzinfo=None)
+    tzid = params.get("TZID")
+    if tzid:
+        try:
+            return dt.replace(tzinfo=ZoneInfo(tzid)).astimezone(zone).replace(tzinfo=None)
+        except Exception:
+            pass  # unknown TZID (e.g. Windows names): read it as the user's local time
+    return dt
+
+
+def _parse_duration(value: str) -> timedelta:
+    m = _DURATION_RE.match(value.strip())
+    if not m or not any(m.groups()):
+        raise IcsError("invalid", f"bad duration {value!r}")
+    weeks, days, hours, minutes, seconds = (int(g or 0) for g in m.groups())
+    return timedelta(weeks=weeks, days=days, hours=hours, minutes=minutes, seconds=seconds)
+
+
+def event_fields(event: dict, zone: ZoneInfo) -> dict:
+    """Plan fields of one event: date, "HH:MM" start/end in `zone`, title, description, uid.
+
+    Raises IcsError for events a plan cannot represent (all-day, multi-day, recurring, cancelled).
+    """
+    if "RRULE" in event:
+        raise IcsError("unsupported", "recurring events are not supported")
+    if event.get("STATUS", ({}, ""))[1].strip().upper() == "CANCELLED":
+        raise IcsError("unsupported", "cancelled event")
+    if "DTSTART" not in event:
+        raise IcsError("invalid", "missing DTSTART")
+    start = _parse_datetime(*event["DTSTART"], zone)
+    if "DTEND" in event:
+        end = _parse_datetime(*event["DTEND"], zone)
+    elif "DURATION" in event:
+        end = start + _parse_duration(event["DURATION"][1])
+    else:
+        end = start
+    if end.date() != start.date():
+        raise IcsError("multi_day", "events must start and end on the same day")
+    description = unescape_text(event["DESCRIPTION"][1]) if "DESCRIPTION" in event else None
+    return {
+        "uid": event.get("UID", ({}, None))[1],
+        "date": start.date(),
+        "start_time": start.strftime("%H:%M"),
+        "end_time": end.strftime("%H:%M"),
+        "title": unescape_text(event.get("SUMMARY", ({}, ""))[1]).strip(),
+        "description": description or None,
+    }
+
+
+def _fold(line: str) -> bytes:
+    """Encode a content line, folding it at 75 octets without splitting UTF-8 sequences."""
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return data + b"\r\n"
+    out, limit = [], 75
+    while data:
+        cut = min(limit, len(data))
+        while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        out.append(data[:cut])
+        data = data[cut:]
+        limit = 74  # continuation lines start with a space
+    return b"\r\n ".join(out) + b"\r\n"
+
+
+def _utc_stamp(day: PyDate, t: PyTime, zone: ZoneInfo) -> str:
+    return datetime.combine(day, t).replace(tzinfo=zone).astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def stream_ics(plans: Iterable, zone: ZoneInfo, name: Optional[str] = None) -> Iterator[bytes]:
+    """Serialize plans as one VCALENDAR; times are written in UTC so no VTIMEZONE is needed."""
+    header = ["BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODID}", "CALSCALE:GREGORIAN"]
+    if name:
+        header.append(f"X-WR-CALNAME:{escape_text(name)}")
+    yield b"".join(_fold(line) for line in header)
+    dtstamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    for plan in plans:
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:{plan.id}@flow7",
+            f"DTSTAMP:{dtstamp}",
+            f"DTSTART:{_utc_stamp(plan.date, plan.start_time, zone)}",
+        ]
+        if plan.end_time is not None:
+            lines.append(f"DTEND:{_utc_stamp(plan.date, plan.end_time, zone)}")
+        lines.append(f"SUMMARY:{escape_text(plan.title or '')}")
+        if plan.description:
+            lines.append(f"DESCRIPTION:{escape_text(plan.description)}")
+        lines.append("END:VEVENT")
+        yield b"".join(_fold(line) for line in lines)
+    yield _fold("END:VCALENDAR")
@@ -0,0 +1,164 @@
+import functools
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from flow7_core.config import IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_WAIT_SECONDS
+from flow7_core.metrics import IDEMPOTENCY_REPLAYS, IDEMPOTENCY_ENTRIES
+
+# endpoint kwargs that are not part of the client's request
+_NON_REQUEST_ARGS = {"db", "current_user", "request", "response", "idempotency_key"}
+
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+class _Record:
+    __slots__ = ("fingerprint", "expires", "done", "status_code", "body", "headers", "is_error")
+
+    def __init__(self, fingerprint: str, expires: float):
+        self.fingerprint = fingerprint
+        self.expires = expires
+        self.done = threading.Event()
+        self.status_code = None
+        self.body = None
+        self.headers = None
+        self.is_error = False
+
+
+class IdempotencyStore:
+    """Recent write responses keyed by (uid, Idempotency-Key).
+
+    Entries share one TTL, so insertion order is expiry order: expired entries are dropped from
+    the front on every access and the oldest entry goes first once `max_entries` is reached.
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL_SECONDS, max_entries: int = IDEMPOTENCY_MAX_ENTRIES, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._records: "OrderedDict[tuple, _Record]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._records)
+
+    def _evict(self, now: float) -> None:
+        while self._records:
+            record = next(iter(self._records.values()))
+            if record.expires > now and len(self._records) <= self.max_entries:
+                break
+            self._records.popitem(last=False)
+
+    def begin(self, key: tuple, fingerprint: str):
+        """Return (record, owner). owner=True means the caller must run the request and `finish` it."""
+        now = self.clock()
+        with self._lock:
+            self._evict(now)
+            record = self._records.get(key)
+            if record is None:
+                record = self._records[key] = _Record(fingerprint, now + self.ttl)
+                return record, True
+            return record, False
+
+    def finish(self, record: _Record, status_code: int, body, headers=None, is_error: bool = False) -> None:
+        record.status_code = status_code
+        record.body = body
+        record.headers = headers
+        record.is_error = is_error
+        record.done.set()
+
+    def abandon(self, key: tuple, record: _Record) -> None:
+        """Forget a request that failed in a way worth retrying (5xx, rate limit, crash)."""
+        with self._lock:
+            if self._records.get(key) is record:
+                del self._records[key]
+        record.done.set()
+
+
+store = IdempotencyStore()
+IDEMPOTENCY_ENTRIES.set_callback(lambda: len(store))
+
+
+def _fingerprint(name: str, kwargs: dict) -> str:
+    payload = {}
+    for k, v in kwargs.items():
+        if k in _NON_REQUEST_ARGS:
+            continue
+        payload[k] = jsonable_encoder(v)
+    raw = json.dumps([name, payload], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _replay(record: _Record):
+    IDEMPOTENCY_REPLAYS.inc()
+    if record.is_error:
+        raise HTTPException(status_code=record.status_code, detail=record.body, headers={**(record.headers or {}), REPLAY_HEADER: "true"})
+    if record.body is None:
+        return Response(status_code=record.status_code, headers={REPLAY_HEADER: "true"})
+    return JSONResponse(status_code=record.status_code, content=record.body, headers={REPLAY_HEADER: "true"})
+
+
+def idempotent(status_code: int, response_model=None):
+    """Decorator for write endpoints taking `current_user` and an `idempotency_key` header param.
+
+    With a key, the first request runs normally and its response (or 4xx error) is stored; retries
+    with the same key and the same request get the stored response without running the handler.
+    Reusing a key for a different request is rejected with 422. Pass the route's `response_model`
+    so replays are serialized exactly like the original response.
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key_header: Optional[str] = kwargs.get("idempotency_key")
+            user = kwargs.get("current_user")
+            if not key_header or user is None:
+                return fn(*args, **kwargs)
+
+            key = (user.uid, key_header)
+            fingerprint = _fingerprint(fn.__name__, kwargs)
+            record, owner = store.begin(key, fingerprint)
+            if not owner:
+                if record.fingerprint != fingerprint:
+                    raise HTTPException(status_code=422, detail="Idempotency-Key farklı bir istek için zaten kullanılmış.")
+                if not record.done.wait(IDEMPOTENCY_WAIT_SECONDS) or record.status_code is None:
+                    raise HTTPException(status_code=409, detail="Aynı Idempotency-Key ile bir istek hâlâ işleniyor.")
+                return _replay(record)
+
+            try:
+                result = fn(*args, **kwargs)
+            except HTTPException as e:
+                # deterministic client errors (403/404/409/...) are replayed too; 429 and 5xx are not
+                if 400 <= e.status_code < 500 and e.status_code != 429:
+                    store.finish(record, e.status_code, e.detail, getattr(e, "headers", None), is_error=True)
+                else:
+                    store.abandon(key, record)
+                raise
+            except BaseException:
+                store.abandon(key, record)
+                raise
+            if isinstance(result, Response):
+                # handlers returning raw responses are not replayable; let retries run them again
+                store.abandon(key, record)
+                return result
+            if result is None:
+                body = None
+            elif response_model is not None:
+                fields = getattr(response_model, "model_fields", None) or response_model.__fields__
+                source = result if isinstance(result, dict) else {name: getattr(result, name) for name in fields}
+                body = jsonable_encoder(response_model(**source))
+            else:
+                body = jsonable_encoder(result)
+            store.finish(record, status_code, body)
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,148 @@
+import atexit
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from flow7_core.metrics import LOG_RECORDS_DROPPED
+from flow7_core.config import LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_RATE_LIMIT, LOG_RATE_WINDOW_SECONDS
+
+# Logging setup for the "flow7" logger tree. Records are handed to a bounded queue and written
+# by a single listener thread, so request handlers and scheduler threads never block on stdout.
+
+ROOT_LOGGER_NAME = "flow7"
+
+# correlation fields (plan_id, uid, ...) bound for the current thread / task
+_context: contextvars.ContextVar[dict] = contextvars.ContextVar("flow7_log_context", default={})
+
+_configured = False
+_configure_lock = threading.Lock()
+_listener = None
+
+# attributes every LogRecord has; anything else was passed through `extra=`
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+@contextlib.contextmanager
+def log_context(**fields):
+    """Bind correlation fields (e.g. plan_id=..., uid=...) to every record logged inside the block."""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class _ContextFilter(logging.Filter):
+    def filter(self, record):
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Drop repeats of the same message template beyond `limit` per `window` seconds.
+
+    Keyed by (logger name, unformatted msg), so the number of keys is bounded by the call sites.
+    The first record let through after a suppressed stretch carries a `suppressed` count.
+    """
+
+    def __init__(self, limit: int = LOG_RATE_LIMIT, window: float = LOG_RATE_WINDOW_SECONDS):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._state = {}  # key -> [window_start, emitted, suppressed]
+
+    def filter(self, record):
+        if self.limit <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._state[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if state[1] < self.limit:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value if isinstance(value, (str, int, float, bool)) or value is None else str(value)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        extras = " ".join(f"{k}={v}" for k, v in vars(record).items() if k not in _RESERVED and not k.startswith("_"))
+        return f"{line} {extras}" if extras else line
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def configure_logging() -> logging.Logger:
+    """Attach the queue handler to the "flow7" logger once and start the writer thread."""
+    global _configured, _listener
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    if _configured:
+        return root
+    with _configure_lock:
+        if _configured:
+            return root
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+        q = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        handler = _DroppingQueueHandler(q)
+        handler.addFilter(_ContextFilter())
+        handler.addFilter(RateLimitFilter())
+        root.addHandler(handler)
+        root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+        root.propagate = False
+        _listener = logging.handlers.QueueListener(q, stream, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        _configured = True
+    return root
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Return a logger under the "flow7" tree, e.g. get_logger("scheduler") -> flow7.scheduler."""
+    configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
@@ -0,0 +1,275 @@
+# Minimal in-process metrics registry rendered in the Prometheus text exposition format.
+# The API, DB layer and scheduler threads record into module-level metrics; render() builds /metrics.
+import abc
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+_REGISTRY: List["_Metric"] = []
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric(abc.ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        with _REGISTRY_LOCK:
+            _REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    @abc.abstractmethod
+    def collect(self) -> List[str]:
+        """Sample lines of this metric (without HELP/TYPE)."""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.collect())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Gauge whose value is either set explicitly or read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, *args, callback: Optional[Callable[[], float]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_callback(self, callback: Optional[Callable[[], float]]) -> None:
+        self._callback = callback
+
+    def collect(self) -> List[str]:
+        if self._callback is not None:
+            try:
+                return [f"{self.name} {_format_value(self._callback())}"]
+            except Exception:
+                return []
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., sum, count]
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            if idx < len(self.buckets):
+                row[idx] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def time(self, **labels) -> "_Timer":
+        return _Timer(self, labels)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = []
+        for key, row in items:
+            cumulative = 0.0
+            for bound, n in zip(self.buckets, row):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {_format_value(row[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(row[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(row[-1])}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("_hist", "_labels", "_start")
+
+    def __init__(self, hist: Histogram, labels: Dict[str, str]):
+        self._hist = hist
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._hist.observe(time.perf_counter() - self._start, **self._labels)
+        return False
+
+
+def render() -> str:
+    with _REGISTRY_LOCK:
+        metrics = list(_REGISTRY)
+    lines: List[str] = []
+    for m in metrics:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# --- API ---
+HTTP_REQUESTS = Counter("flow7_http_requests_total", "HTTP requests by route template, method and status.", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("flow7_http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route"))
+
+# --- DB ---
+DB_QUERIES = Counter("flow7_db_queries_total", "SQL statements executed, by statement verb.", ("verb",))
+DB_QUERY_LATENCY = Histogram("flow7_db_query_duration_seconds", "SQL statement execution time, by statement verb.", ("verb",))
+DB_POOL_CHECKOUT_WAIT = Histogram("flow7_db_pool_checkout_wait_seconds", "Time spent waiting for a pooled DB connection.")
+DB_POOL_CHECKED_OUT = Gauge("flow7_db_pool_checked_out", "Connections currently checked out of the pool.")
+DB_READS_ROUTED = Counter("flow7_db_reads_routed_total", "Read sessions opened, by target (primary, replica, sticky).", ("target",))
+
+# --- Scheduler / notifications ---
+SCHEDULER_JOB_LAG = Histogram("flow7_scheduler_job_lag_seconds", "Dispatch fire time minus the plan's notify_at.", buckets=LAG_BUCKETS)
+SCHEDULER_QUEUE_DEPTH = Gauge("flow7_scheduler_queue_depth", "Jobs currently pending in the scheduler job store.")
+SCHEDULER_DISPATCHES = Counter("flow7_scheduler_dispatches_total", "Notification dispatch jobs by outcome.", ("outcome",))
+PLANS_IMPORTED = Counter("flow7_plans_imported_total", "iCalendar import events by outcome (imported, conflict, invalid, beyond_limit, ...).", ("outcome",))
+PLANS_ARCHIVED = Counter("flow7_plans_archived_total", "Plans moved from plans to plans_archive by retention compaction.")
+PUSH_SEND_LATENCY = Histogram("flow7_push_send_duration_seconds", "Latency of a single push provider call.", ("method",))
+PUSH_SEND_ERRORS = Counter("flow7_push_send_errors_total", "Failed push provider calls.", ("method",))
+PUSH_MESSAGES = Counter("flow7_push_messages_total", "Push messages by per-token delivery result.", ("result",))
+NOTIFICATION_RENDERS = Counter("flow7_notification_renders_total", "Notification messages rendered, by language (one per recipient group of a send).", ("language",))
+
+# --- Sharded dispatch ---
+DISPATCH_SHARDS_HELD = Gauge("flow7_dispatch_shards_held", "Dispatch shards currently leased by this process.")
+DISPATCH_WORKERS = Gauge("flow7_dispatch_workers", "Live dispatcher processes seen at this process's last rebalance.")
+DISPATCH_POLL_LATENCY = Histogram("flow7_dispatch_poll_duration_seconds", "Duration of one dispatcher poll (leases, due query and dispatch).")
+
+# --- Devices ---
+DEVICE_REGISTRATIONS = Counter("flow7_device_registrations_total", "Device token registrations by outcome (created, moved, refreshed, unchanged).", ("outcome",))
+
+# --- Rate limiting ---
+RATE_LIMITED = Counter("flow7_rate_limited_total", "Requests rejected (or work skipped) by the rate limiter.", ("scope", "tier"))
+RATE_LIMIT_KEYS = Gauge("flow7_rate_limit_active_keys", "Token buckets currently held by the in-memory rate limiter.")
+
+# --- Idempotency ---
+IDEMPOTENCY_REPLAYS = Counter("flow7_idempotency_replays_total", "Write requests answered from the idempotency store.")
+IDEMPOTENCY_ENTRIES = Gauge("flow7_idempotency_entries", "Responses currently held in the idempotency store.")
+
+# --- Plan change events ---
+EVENT_STREAMS = Gauge("flow7_event_streams", "Open plan event (SSE) streams in this process.")
+EVENTS_PUBLISHED = Counter("flow7_events_published_total", "Plan change events published after commit.")
+EVENTS_DROPPED = Counter("flow7_events_dropped_total", "Plan change events dropped (slow stream or unreachable stand-in).")
+
+# --- In-memory user state ---
+STATE_ENTRIES = Gauge("flow7_state_entries", "Entries currently held by each bounded in-memory state store.", ("store",))
+STATE_EVICTIONS = Counter("flow7_state_evictions_total", "Entries removed from in-memory state stores, by reason (expired, lru).", ("store", "reason"))
+
+# --- Logging ---
+LOG_RECORDS_DROPPED = Counter("flow7_log_records_dropped_total", "Log records dropped because the log queue was full.")
+
+
+def _statement_verb(statement: str) -> str:
+    head = statement.lstrip().split(None, 1)
+    return head[0].upper() if head else "UNKNOWN"
+
+
+def instrument_engine(engine, track_pool: bool = True) -> None:
+    """Record query counts/durations via SQLAlchemy cursor events and time pool checkouts.
+
+    Only the engine instrumented with track_pool=True feeds the checked-out connections gauge.
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("flow7_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("flow7_query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        verb = _statement_verb(statement)
+        DB_QUERIES.inc(verb=verb)
+        DB_QUERY_LATENCY.observe(elapsed, verb=verb)
+
+    _instrument_pool(engine, track_pool)
+    # dispose() replaces engine.pool with a fresh one; instrument that one too
+    event.listen(engine, "engine_disposed", lambda disposed: _instrument_pool(disposed, track_pool))
+
+
+def _instrument_pool(engine, track_pool: bool) -> None:
+    # The pool has no "checkout started" event, so wrap its connect() to measure the wait
+    pool = engine.pool
+    pool_connect = pool.connect
+
+    def _timed_connect():
+        start = time.perf_counter()
+        try:
+            return pool_connect()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+    pool.connect = _timed_connect
+    if track_pool and hasattr(pool, "checkedout"):
+        # read through the engine so the gauge follows a pool swapped in by dispose()
+        DB_POOL_CHECKED_OUT.set_callback(lambda: engine.pool.checkedout())
@@ -1,7 +1,18 @@
+import zlib
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Date, Time, Boolean, DateTime, Text
+from sqlalchemy import Column, Integer, String, Date, Time, Boolean, DateTime, Text, Index, LargeBinary
 from sqlalchemy.dialects.sqlite import DATETIME
 from .db import Base
+from .config import DISPATCH_SHARDS
+
+
+def dispatch_shard_for(user_id: str) -> int:
+    """Notification dispatch shard of a user's plans (stable across processes and restarts)."""
+    return zlib.crc32(user_id.encode("utf-8")) % DISPATCH_SHARDS
+
+
+def _default_dispatch_shard(context) -> int:
+    return dispatch_shard_for(context.get_current_parameters()["user_id"])
 
 
 class PlanORM(Base):
@@ -13,11 +24,56 @@ class PlanORM(Base):
     end_time = Column(Time, nullable=True)
     title = Column(String, nullable=False)
     description = Column(Text, nullable=True)
-    notified = Column(Boolean, default=False, nullable=False)
-    notify_at = Column(DateTime, nullable=True)  # UTC
+    notified = Column(Boolean, default=False, nullable=False)  # True once no reminder is pending
+    notify_at = Column(DateTime, nullable=True)  # UTC, time of the next pending reminder
+    # bitmasks over flow7_core.reminders.REMINDER_SLOTS; reminder_mask NULL = the user's default
+    reminder_mask = Column(Integer, nullable=True)
+    notified_mask = Column(Integer, nullable=True, default=0)
+    dispatch_shard = Column(Integer, nullable=True, default=_default_dispatch_shard)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # keyset used by paginated listing and export: (date, start_time, id) per user
+        Index("ix_plans_user_date_start_id", "user_id", "date", "start_time", "id"),
+        # sharded dispatch: due pending plans of a set of shards
+        Index("ix_plans_dispatch", "dispatch_shard", "notified", "notify_at"),
+        # look-ahead sweep: pending plans by date
+        Index("ix_plans_pending_date", "notified", "date"),
+    )
+
+
+class PlanArchiveORM(Base):
+    """Notified plans older than PLAN_RETENTION_DAYS, moved out of `plans` by flow7_core.retention.
+
+    Same columns as `plans` so range reads can UNION ALL both tables; only the listing keyset is indexed.
+    """
+    __tablename__ = "plans_archive"
+    id = Column(String, primary_key=True)
+    user_id = Column(String, nullable=False)
+    date = Column(Date, nullable=False)
+    start_time = Column(Time, nullable=False)
+    end_time = Column(Time, nullable=True)
+    title = Column(String, nullable=False)
+    description = Column(Text, nullable=True)
+    notified = Column(Boolean, default=True, nullable=False)
+    notify_at = Column(DateTime, nullable=True)
+    reminder_mask = Column(Integer, nullable=True)
+    notified_mask = Column(Integer, nullable=True)
+    dispatch_shard = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_plans_archive_user_date_start_id", "user_id", "date", "start_time", "id"),)
+
+
+class PlanOccupancy(Base):
+    """Per-user, per-day minute bitmap of time covered by plans (see flow7_core.occupancy)."""
+    __tablename__ = "plan_occupancy"
+    user_id = Column(String, primary_key=True)
+    date = Column(Date, primary_key=True)
+    bitmap = Column(LargeBinary, nullable=False)  # 1440 bits, little-endian; bit i = minute i
+
 
 class UserSettings(Base):
     __tablename__ = "user_settings"
@@ -25,13 +81,14 @@ class UserSettings(Base):
     language_code = Column(String, default="tr")
     theme = Column(String, default="system")
     notifications_enabled = Column(Boolean, default=True)
+    reminder_mask = Column(Integer, nullable=True)  # default reminders for new plans; NULL = DEFAULT_REMINDERS
     timezone = Column(String, default="UTC")
     country = Column(String, nullable=True)
     city = Column(String, nullable=True)
     username = Column(String, nullable=True)
     # Subscription persistence
     subscription_level = Column(String, default="FREE")
-    subscription_expires_at = Column(DateTime, nullable=True)
+    subscription_expires_at = Column(DateTime, nullable=True, index=True)
     subscription_score = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -44,3 +101,41 @@ class DeviceToken(Base):
     token = Column(String, nullable=False, unique=True)
     platform = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # refreshed by PUT /user/devices/ at most once per DEVICE_LAST_SEEN_RESOLUTION_SECONDS
+    last_seen_at = Column(DateTime, nullable=True)
+
+
+class PlanDailyStats(Base):
+    """Per-user, per-day plan count and planned minutes, maintained incrementally (flow7_core.stats).
+
+    Covers archived plans too: retention moves rows between tables without touching the stats.
+    """
+    __tablename__ = "plan_daily_stats"
+    user_id = Column(String, primary_key=True)
+    date = Column(Date, primary_key=True)
+    plan_count = Column(Integer, nullable=False, default=0)
+    planned_minutes = Column(Integer, nullable=False, default=0)
+
+
+class PlanHourlyStats(Base):
+    """Planned minutes per user, day and hour of day (0-23); feeds the busiest time slots."""
+    __tablename__ = "plan_hourly_stats"
+    user_id = Column(String, primary_key=True)
+    date = Column(Date, primary_key=True)
+    hour = Column(Integer, primary_key=True)
+    planned_minutes = Column(Integer, nullable=False, default=0)
+
+
+class DispatchLease(Base):
+    """Ownership of one notification dispatch shard (flow7_core.dispatch); one row per shard."""
+    __tablename__ = "dispatch_leases"
+    shard = Column(Integer, primary_key=True)
+    owner = Column(String, nullable=True)
+    expires_at = Column(DateTime, nullable=True)  # UTC
+
+
+class DispatchWorker(Base):
+    """Dispatcher processes; those with a recent heartbeat share the shards between them."""
+    __tablename__ = "dispatch_workers"
+    worker_id = Column(String, primary_key=True)
+    heartbeat_at = Column(DateTime, nullable=False)  # UTC
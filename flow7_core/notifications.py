@@ -1,19 +1,27 @@
-from datetime import datetime, date as PyDate, time as PyTime, timezone
+from datetime import time as PyTime
 from zoneinfo import ZoneInfo
-from typing import Optional
-import os
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+import threading
 import time as time_module
-from flow7_core.db import SessionLocal
-from flow7_core.models import UserSettings, DeviceToken
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import select
-from flow7_core.state import USER_SUBSCRIPTIONS
-from flow7_core.config import FIREBASE_ADMIN_AVAILABLE
+from flow7_core.db import SessionLocal
+from flow7_core.models import UserSettings
+from flow7_core.state import USER_SUBSCRIPTIONS, SESSION_TIMEZONES
+from flow7_core.config import FIREBASE_SEND_RETRIES, FIREBASE_SEND_BACKOFF, PUSH_BATCH_SIZE, PUSH_CONCURRENCY
+from flow7_core.metrics import PUSH_SEND_LATENCY, PUSH_SEND_ERRORS, PUSH_MESSAGES, NOTIFICATION_RENDERS
+from flow7_core.log import get_logger
+from flow7_core.push import get_transport, LogTransport, PushResult, UNAVAILABLE, UNREGISTERED
+from flow7_core.devices import user_tokens, prune_tokens
+from flow7_core.i18n import CATALOG, NotificationTemplates, resolve_language
+
+logger = get_logger("notifications")
 
-# lazy import firebase messaging if available
-try:
-    from firebase_admin import messaging
-except Exception:
-    messaging = None
+# shared pool for sending token batches of one message in parallel (created on first use)
+_send_pool = None
+_send_pool_lock = threading.Lock()
+# uids per language_code query when a bulk send resolves its recipients' languages
+LANGUAGE_LOOKUP_BATCH = 500
 
 
 TIME_FORMAT = "%H:%M"
@@ -30,7 +38,13 @@ def time_to_str(t: Optional[PyTime]) -> Optional[str]:
 
 
 def _get_user_zoneinfo(uid: str) -> ZoneInfo:
-    """Resolve user's effective ZoneInfo: DB -> in-memory fallback -> default"""
+    """Resolve user's effective ZoneInfo: session timezone -> DB -> in-memory fallback -> default"""
+    session_tz = SESSION_TIMEZONES.get(uid)
+    if session_tz:
+        try:
+            return ZoneInfo(session_tz)
+        except Exception:
+            pass
     try:
         db = SessionLocal()
         try:
@@ -52,101 +66,189 @@ def _get_user_zoneinfo(uid: str) -> ZoneInfo:
         return ZoneInfo("Europe/Istanbul")
 
 
-def send_notification_to_user(uid: str, payload: dict):
-    """Format notification body and send via firebase-admin when available; otherwise log."""
+def _send_batch(transport, uid: str, tokens, title: str, body: str, data: dict) -> PushResult:
+    """Send one token batch, retrying throttled/transient per-token failures with backoff.
+
+    Waits max(provider Retry-After, FIREBASE_SEND_BACKOFF * 2^attempt) between attempts.
+    Permanent failures (e.g. unregistered tokens) are never retried.
+    """
+    pending = list(tokens)
+    delivered = 0
+    errors = {}
+    for attempt in range(FIREBASE_SEND_RETRIES + 1):
+        try:
+            with PUSH_SEND_LATENCY.time(method=transport.name):
+                result = transport.send_multicast(pending, title, body, data)
+        except Exception as e:
+            PUSH_SEND_ERRORS.inc(method=transport.name)
+            logger.warning("notify: %s send failed: %s", transport.name, e, extra={"uid": uid})
+            result = PushResult(errors={t: UNAVAILABLE for t in pending})
+        delivered += result.success_count
+        if result.failure_count:
+            PUSH_SEND_ERRORS.inc(method=transport.name)
+        for t in pending:
+            if t in result.errors:
+                errors[t] = result.errors[t]
+            else:
+                errors.pop(t, None)
+        pending = result.retryable_tokens()
+        if not pending or attempt == FIREBASE_SEND_RETRIES:
+            break
+        sleep_time = max(result.retry_after or 0.0, FIREBASE_SEND_BACKOFF * (2 ** attempt))
+        logger.info("notify: %d token(s) failed transiently (attempt %d/%d); retrying in %ss", len(pending), attempt + 1, FIREBASE_SEND_RETRIES + 1, sleep_time, extra={"uid": uid})
+        time_module.sleep(sleep_time)
+    return PushResult(success_count=delivered, errors=errors)
+
+
+def _recipients(uids) -> dict:
+    return {"uid": uids[0]} if len(uids) == 1 else {"recipients": len(uids)}
+
+
+def _deliver(uids, tokens, title: str, body: str, data: dict) -> PushResult:
+    """Split tokens (of one or more users) into provider-sized batches and send them (in parallel when there are several)."""
+    global _send_pool
+    transport = get_transport()
+    who = _recipients(uids)
+    if isinstance(transport, LogTransport):
+        logger.info("notify: no push provider configured; notification logged only", extra={**who, "tokens": len(tokens), "title": title, "body": body})
+        return PushResult(success_count=len(tokens))
+
+    label = uids[0] if len(uids) == 1 else f"{len(uids)} users"
+    batches = [tokens[i:i + PUSH_BATCH_SIZE] for i in range(0, len(tokens), PUSH_BATCH_SIZE)]
+    if len(batches) > 1 and PUSH_CONCURRENCY > 1:
+        with _send_pool_lock:
+            if _send_pool is None:
+                _send_pool = ThreadPoolExecutor(max_workers=PUSH_CONCURRENCY, thread_name_prefix="flow7-push")
+        results = list(_send_pool.map(lambda b: _send_batch(transport, label, b, title, body, data), batches))
+    else:
+        results = [_send_batch(transport, label, b, title, body, data) for b in batches]
+
+    total = PushResult(success_count=sum(r.success_count for r in results), errors={t: c for r in results for t, c in r.errors.items()})
+    unregistered = [t for t, code in total.errors.items() if code == UNREGISTERED]
+    if unregistered:
+        try:
+            prune_tokens(uids, unregistered)
+        except Exception:
+            logger.exception("notify: failed to prune unregistered tokens", extra=who)
+    PUSH_MESSAGES.inc(total.success_count, result="success")
+    PUSH_MESSAGES.inc(total.failure_count, result="failure")
+    logger.info("notify: delivery result", extra={**who, "transport": transport.name, "success": total.success_count, "failure": total.failure_count})
+    return total
+
+
+def _times_line(payload: dict) -> str:
+    """"HH:MM - HH:MM" (or just the start); payload times are already the plan's local wall-clock times."""
+    start_display = payload.get("start_time", "")
+    end_display = payload.get("end_time", "")
+    if start_display and end_display:
+        return f"{start_display} - {end_display}"
+    return start_display
+
+
+def _render_plan_body(payload: dict, templates: NotificationTemplates) -> str:
+    title = payload.get("title", "Flow7")
+    description = payload.get("description", "") or ""
+    body_lines = [title]
+    if description:
+        body_lines.append(description)
+    times_line = _times_line(payload)
+    if times_line:
+        body_lines.append(times_line)
+    body_lines.append(templates.reminder_label(payload.get("reminder", "start")))
+    return "\n".join(body_lines)
+
+
+def _render_digest_body(payloads) -> str:
+    """One line per plan: "HH:MM - HH:MM title"."""
+    lines = []
+    for payload in payloads:
+        times_line = _times_line(payload)
+        title = payload.get("title", "Flow7")
+        lines.append(f"{times_line} {title}" if times_line else title)
+    return "\n".join(lines)
+
+
+def _render(payloads, templates: NotificationTemplates) -> Tuple[str, str, dict]:
+    """(title, body, data) of a plan notification (one payload) or a digest (several)."""
+    if len(payloads) == 1:
+        payload = payloads[0]
+        data = {"type": "plan_notification", "date": payload.get("date", ""), "start_time": payload.get("start_time", ""),
+                "end_time": payload.get("end_time", ""), "reminder": payload.get("reminder", "start")}
+        return payload.get("title", "Flow7"), _render_plan_body(payload, templates), data
+    # bounds of the whole group, whatever order the payloads come in (ISO dates and HH:MM sort as text)
+    first = min(payloads, key=lambda p: (p.get("date", ""), p.get("start_time", "")))
+    last = max(payloads, key=lambda p: (p.get("date", ""), p.get("end_time") or p.get("start_time", "")))
+    data = {"type": "plan_digest", "count": str(len(payloads)), "date": first.get("date", ""), "start_time": first.get("start_time", ""),
+            "end_date": last.get("date", ""), "end_time": last.get("end_time") or last.get("start_time", "")}
+    return templates.digest_title(count=len(payloads)), _render_digest_body(payloads), data
+
+
+def _user_languages(uids) -> Dict[str, str]:
+    """Catalog language per uid: user_settings.language_code, else the in-memory fallback settings, else the default."""
+    uids = list(uids)
+    codes = {}
     try:
         db = SessionLocal()
         try:
-            rows = db.execute(select(DeviceToken.token).where(DeviceToken.uid == uid)).scalars().all()
+            for i in range(0, len(uids), LANGUAGE_LOOKUP_BATCH):
+                rows = db.execute(select(UserSettings.uid, UserSettings.language_code).where(
+                    UserSettings.uid.in_(uids[i:i + LANGUAGE_LOOKUP_BATCH])))
+                codes.update((uid, code) for uid, code in rows)
         finally:
             db.close()
-
-        if not rows:
-            print(f"[NOTIFY] no device tokens for uid={uid}, payload={payload}")
-            return
-
+    except Exception as e:
+        logger.warning("notify: language lookup failed: %s", e)
+    return {uid: resolve_language(codes.get(uid) or USER_SUBSCRIPTIONS.get(uid, {}).get("language_code")) for uid in uids}
+
+
+def _payload_key(payloads) -> tuple:
+    return tuple(tuple(sorted(p.items())) for p in payloads)
+
+
+def send_notifications(messages: Iterable[Tuple[str, Sequence[dict]]]) -> int:
+    """Send (uid, payloads) messages: one payload is a plan notification, several a digest.
+
+    Recipients are grouped by (language, payloads); each group's message is rendered once from the
+    language's templates (flow7_core.i18n) and multicast to the device tokens of all its users.
+    Returns the number of messages rendered.
+    """
+    messages = [(uid, list(payloads)) for uid, payloads in messages if payloads]
+    if not messages:
+        return 0
+    languages = _user_languages({uid for uid, _ in messages})
+    groups = {}
+    for uid, payloads in messages:
+        key = (languages[uid], _payload_key(payloads))
+        if key not in groups:
+            groups[key] = (payloads, {})
+        groups[key][1][uid] = None  # ordered set of recipients
+
+    rendered = 0
+    for (language, _), (payloads, recipients) in groups.items():
+        uids = list(recipients)
         try:
-            tz = _get_user_zoneinfo(uid)
-        except Exception:
-            tz = ZoneInfo("UTC")
+            tokens = []
+            for uid in uids:
+                rows = user_tokens(uid)
+                if not rows:
+                    logger.info("notify: no device tokens", extra={"uid": uid})
+                tokens.extend(rows)
+            if not tokens:
+                continue
+            title, body, data = _render(payloads, CATALOG[language])
+            rendered += 1
+            NOTIFICATION_RENDERS.inc(language=language)
+            _deliver(uids, tokens, title, body, data)
+        except Exception as e:
+            logger.error("notify: send error: %s", e, extra=_recipients(uids))
+    return rendered
 
-        title = payload.get("title", "Flow7")
-        description = payload.get("description", "") or ""
 
-        start_display = payload.get("start_time", "")
-        end_display = payload.get("end_time", "")
-        try:
-            date_str = payload.get("date")
-            if date_str and start_display:
-                d = PyDate.fromisoformat(date_str)
-                st = PyTime.fromisoformat(start_display)
-                local_dt = datetime.combine(d, st).replace(tzinfo=tz)
-                start_display = local_dt.strftime(TIME_FORMAT)
-            if date_str and end_display:
-                et = PyTime.fromisoformat(end_display)
-                end_local = datetime.combine(PyDate.fromisoformat(date_str), et).replace(tzinfo=tz)
-                end_display = end_local.strftime(TIME_FORMAT)
-        except Exception:
-            pass
+def send_notification_to_user(uid: str, payload: dict):
+    """Render the notification in the user's language and send it through the configured push transport (see flow7_core.push)."""
+    send_notifications([(uid, [payload])])
 
-        body_lines = [title]
-        if description:
-            body_lines.append(description)
-        times_line = ""
-        if start_display and end_display:
-            times_line = f"{start_display} - {end_display}"
-        elif start_display:
-            times_line = f"{start_display}"
-        if times_line:
-            body_lines.append(times_line)
-        body = "\n".join(body_lines)
-
-        FIREBASE_RETRIES = int(os.getenv("FIREBASE_SEND_RETRIES", "3"))
-        FIREBASE_BACKOFF = float(os.getenv("FIREBASE_SEND_BACKOFF", "0.5"))
-
-        if FIREBASE_ADMIN_AVAILABLE and messaging is not None:
-            try:
-                tokens = list(rows)
-                data_payload = {"type": "plan_notification", "date": payload.get("date", ""), "start_time": payload.get("start_time", ""), "end_time": payload.get("end_time", "")}
-
-                if hasattr(messaging, "send_multicast") and hasattr(messaging, "MulticastMessage"):
-                    try:
-                        message = messaging.MulticastMessage(
-                            notification=messaging.Notification(title=title, body=body),
-                            data=data_payload,
-                            tokens=tokens,
-                        )
-                        response = messaging.send_multicast(message)
-                        succ = getattr(response, "success_count", None)
-                        fail = getattr(response, "failure_count", None)
-                        print(f"[NOTIFY] multicast result uid={uid}: success={succ} fail={fail}")
-                        return
-                    except Exception as e:
-                        print(f"[NOTIFY] multicast send failed: {e} -- falling back to per-token send")
-
-                for token in tokens:
-                    sent = False
-                    last_exc = None
-                    for attempt in range(1, FIREBASE_RETRIES + 1):
-                        try:
-                            if hasattr(messaging, "Message"):
-                                msg = messaging.Message(notification=messaging.Notification(title=title, body=body), data=data_payload, token=token)
-                                res = messaging.send(msg)
-                            else:
-                                res = messaging.send(messaging.Notification(title=title, body=body), token=token)
-                            sent = True
-                            break
-                        except Exception as e:
-                            last_exc = e
-                            sleep_time = FIREBASE_BACKOFF * (2 ** (attempt - 1))
-                            print(f"[NOTIFY] token send attempt {attempt}/{FIREBASE_RETRIES} failed for token={token}: {e}; retrying in {sleep_time}s")
-                            time_module.sleep(sleep_time)
-                    if not sent:
-                        print(f"[NOTIFY] failed to send to token {token} after {FIREBASE_RETRIES} attempts: {last_exc}")
-                return
-            except Exception as e:
-                print(f"[NOTIFY] firebase-admin send error (outer): {e} -- falling back to log")
-
-        print(f"[NOTIFY-LOG] uid={uid} tokens={len(rows)} title={title} body={body} payload={payload}")
-    except Exception as e:
-        print(f"[NOTIFY] send error for uid={uid}: {e}")
+
+def send_digest_to_user(uid: str, payloads):
+    """Send several due plans of one user as a single notification (see scheduler coalescing)."""
+    send_notifications([(uid, payloads)])
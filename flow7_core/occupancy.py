@@ -0,0 +1,151 @@
+from datetime import date as PyDate, time as PyTime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+
+from flow7_core.models import PlanORM, PlanOccupancy
+
+# Per-user, per-day occupancy at minute resolution: bit i of a day's bitmap is set when minute i
+# (00:00 + i) is covered by a plan. Plans are [start_time, end_time) within one day.
+#
+# The stored bitmaps serve reads (free slots); conflict checks always query the plans themselves.
+# Plan writes lock the touched day rows first (lock_days), so two writers of the same user and day
+# are serialized: the second one's conflict query and bitmap rebuild see the first one's plans.
+MINUTES_PER_DAY = 24 * 60
+BITMAP_BYTES = MINUTES_PER_DAY // 8
+FULL_DAY = (1 << MINUTES_PER_DAY) - 1
+
+
+def _minute(t: PyTime) -> int:
+    return t.hour * 60 + t.minute
+
+
+def span_mask(start_minute: int, end_minute: int) -> int:
+    """Bits for minutes [start_minute, end_minute)."""
+    if end_minute <= start_minute:
+        return 0
+    return ((1 << (end_minute - start_minute)) - 1) << start_minute
+
+
+def plan_mask(start_time: PyTime, end_time: Optional[PyTime]) -> int:
+    if end_time is None:
+        return 0
+    return span_mask(_minute(start_time), _minute(end_time))
+
+
+def to_bytes(bitmap: int) -> bytes:
+    return bitmap.to_bytes(BITMAP_BYTES, "little")
+
+
+def from_bytes(raw: bytes) -> int:
+    return int.from_bytes(raw, "little")
+
+
+def plan_bitmaps(db: Session, uid: str, days: Iterable[PyDate]) -> Dict[PyDate, int]:
+    """Bitmaps of `days` computed from the user's plans (as visible to the caller's transaction)."""
+    days = list(days)
+    bitmaps = {d: 0 for d in days}
+    if not days:
+        return bitmaps
+    rows = db.execute(select(PlanORM.date, PlanORM.start_time, PlanORM.end_time).where(
+        PlanORM.user_id == uid,
+        PlanORM.date.in_(days),
+    ))
+    for d, st, et in rows:
+        bitmaps[d] |= plan_mask(st, et)
+    return bitmaps
+
+
+def _insert_missing(db: Session, uid: str, days: List[PyDate]) -> None:
+    """Create empty rows for `days` that have none, without failing on a concurrent insert."""
+    rows = [{"user_id": uid, "date": d, "bitmap": to_bytes(0)} for d in days]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        db.execute(insert(PlanOccupancy).on_conflict_do_nothing(index_elements=[PlanOccupancy.user_id, PlanOccupancy.date]), rows)
+        return
+    present = set(db.execute(select(PlanOccupancy.date).where(PlanOccupancy.user_id == uid, PlanOccupancy.date.in_(days))).scalars())
+    db.add_all(PlanOccupancy(**r) for r in rows if r["date"] not in present)
+    db.flush()
+
+
+def lock_days(db: Session, uid: str, days: Iterable[PyDate]) -> None:
+    """Lock the user's occupancy rows of `days` until the caller's transaction ends.
+
+    Call before checking a plan write for conflicts. Rows are created when missing and locked in
+    date order (no deadlocks between writers of several days). SQLite ignores FOR UPDATE; its
+    writers are already serialized by the database lock.
+    """
+    days = sorted({d for d in days if d is not None})
+    if not days:
+        return
+    _insert_missing(db, uid, days)
+    db.execute(select(PlanOccupancy.date).where(
+        PlanOccupancy.user_id == uid,
+        PlanOccupancy.date.in_(days),
+    ).order_by(PlanOccupancy.date).with_for_update()).all()
+
+
+def refresh_days(db: Session, uid: str, days: Iterable[PyDate]) -> None:
+    """Recompute the bitmaps of `days` from the user's plans inside the caller's transaction.
+
+    Called by every plan write after its flush, so the bitmap commits together with the plans.
+    Rebuilding the (few) touched days instead of flipping bits keeps overlapping legacy plans
+    correct when one of them is deleted; the day rows are locked first (lock_days), so a concurrent
+    writer cannot overwrite the result with a bitmap built from an older snapshot.
+    """
+    days = {d for d in days if d is not None}
+    if not days:
+        return
+    db.flush()
+    lock_days(db, uid, days)
+    table = PlanOccupancy.__table__
+    db.execute(
+        update(table).where(table.c.user_id == uid, table.c.date == bindparam("b_date")).values(bitmap=bindparam("b_bitmap")),
+        [{"b_date": d, "b_bitmap": to_bytes(bitmap)} for d, bitmap in plan_bitmaps(db, uid, days).items()],
+    )
+
+
+def load_range(db: Session, uid: str, start_date: PyDate, end_date: PyDate) -> Dict[PyDate, int]:
+    """Bitmaps for every day of a range; days without a stored row are built from their plans."""
+    bitmaps = {d: from_bytes(raw) for d, raw in db.execute(select(PlanOccupancy.date, PlanOccupancy.bitmap).where(
+        PlanOccupancy.user_id == uid,
+        PlanOccupancy.date.between(start_date, end_date),
+    ))}
+    missing = []
+    d = start_date
+    while d <= end_date:
+        if d not in bitmaps:
+            missing.append(d)
+        d += timedelta(days=1)
+    if missing:
+        bitmaps.update(plan_bitmaps(db, uid, missing))
+    return bitmaps
+
+
+def free_windows(bitmap: int, duration: int, earliest: int = 0, latest: int = MINUTES_PER_DAY) -> List[Tuple[int, int]]:
+    """Maximal free [start, end) minute windows inside [earliest, latest) at least `duration` long."""
+    free = ~bitmap & span_mask(earliest, latest)
+    # fits: bit i set iff minutes i .. i+duration-1 are all free (log2(duration) shift-ands)
+    fits, length = free, 1
+    while length < duration and fits:
+        step = min(length, duration - length)
+        fits &= fits >> step
+        length += step
+    if not fits:
+        return []
+    windows = []
+    starts = free & ~(free << 1)
+    ends = free & ~(free >> 1)
+    while starts:
+        s = (starts & -starts).bit_length() - 1
+        later_ends = ends >> s << s
+        e = (later_ends & -later_ends).bit_length()  # one past the run's last free minute
+        if e - s >= duration:
+            windows.append((s, e))
+        starts &= starts - 1
+    return windows
@@ -0,0 +1,226 @@
+import abc
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+from flow7_core.config import PUSH_TRANSPORT, PUSH_STANDIN_URL, PUSH_HTTP_TIMEOUT, firebase_available, init_firebase
+
+# Pluggable push delivery. send_notification_to_user renders the message once and hands the token
+# list to the active transport: firebase-admin in production, the local HTTP stand-in
+# (flow7_core.push_standin) or the in-memory fake for offline benchmarking, or log-only.
+
+# per-token error codes shared by every transport
+UNREGISTERED = "unregistered"        # token no longer valid; never retry
+INVALID_ARGUMENT = "invalid_argument"
+THROTTLED = "throttled"              # provider returned 429 / quota exceeded; retry after a delay
+UNAVAILABLE = "unavailable"          # transient provider failure; retry
+INTERNAL = "internal"
+
+RETRYABLE_ERRORS = {THROTTLED, UNAVAILABLE, INTERNAL}
+
+
+class PushResult:
+    """Outcome of one provider call: per-token errors plus an optional provider retry hint."""
+
+    __slots__ = ("success_count", "failure_count", "errors", "retry_after")
+
+    def __init__(self, success_count: int = 0, errors: Optional[Dict[str, str]] = None, retry_after: Optional[float] = None):
+        self.errors = errors or {}
+        self.success_count = success_count
+        self.failure_count = len(self.errors)
+        self.retry_after = retry_after
+
+    def retryable_tokens(self) -> List[str]:
+        return [t for t, code in self.errors.items() if code in RETRYABLE_ERRORS]
+
+
+class PushTransport(abc.ABC):
+    name = "base"
+
+    @abc.abstractmethod
+    def send_multicast(self, tokens: List[str], title: str, body: str, data: Dict[str, str]) -> PushResult:
+        ...
+
+
+class LogTransport(PushTransport):
+    """No provider configured: delivery is only logged by the caller."""
+
+    name = "log"
+
+    def send_multicast(self, tokens, title, body, data):
+        return PushResult(success_count=len(tokens))
+
+
+class FirebaseTransport(PushTransport):
+    name = "firebase"
+
+    # firebase_admin.messaging exception class name -> shared error code
+    _ERROR_CODES = {
+        "UnregisteredError": UNREGISTERED,
+        "SenderIdMismatchError": UNREGISTERED,
+        "InvalidArgumentError": INVALID_ARGUMENT,
+        "QuotaExceededError": THROTTLED,
+        "UnavailableError": UNAVAILABLE,
+        "InternalError": INTERNAL,
+    }
+
+    def __init__(self, messaging_module=None):
+        if messaging_module is None:
+            init_firebase()
+            from firebase_admin import messaging as messaging_module
+        self.messaging = messaging_module
+
+    def _code(self, exc) -> str:
+        return self._ERROR_CODES.get(type(exc).__name__, INTERNAL)
+
+    def send_multicast(self, tokens, title, body, data):
+        m = self.messaging
+        message = m.MulticastMessage(notification=m.Notification(title=title, body=body), data=data, tokens=list(tokens))
+        # send_multicast was removed in newer firebase-admin releases in favour of send_each_for_multicast
+        send = getattr(m, "send_each_for_multicast", None) or getattr(m, "send_multicast")
+        response = send(message)
+        errors = {}
+        for token, item in zip(tokens, getattr(response, "responses", None) or []):
+            if not getattr(item, "success", True):
+                errors[token] = self._code(getattr(item, "exception", None))
+        return PushResult(success_count=getattr(response, "success_count", len(tokens) - len(errors)), errors=errors)
+
+
+class FaultProfile:
+    """Injected provider behaviour for the fake and the HTTP stand-in.
+
+    latency_ms/jitter_ms delay every call, throttle_rate is the chance a whole call is answered with
+    429 + Retry-After, error_rate the chance a single token fails transiently, and token_errors
+    pins an error code to specific tokens (or token prefixes ending in '*').
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, throttle_rate: float = 0.0, retry_after: float = 1.0,
+                 error_rate: float = 0.0, token_errors: Optional[Dict[str, str]] = None, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.token_errors = dict(token_errors or {})
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        with self._lock:
+            jitter = self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000.0
+
+    def throttled(self) -> bool:
+        if not self.throttle_rate:
+            return False
+        with self._lock:
+            return self._rng.random() < self.throttle_rate
+
+    def token_error(self, token: str) -> Optional[str]:
+        code = self.token_errors.get(token)
+        if code is None:
+            for pattern, pcode in self.token_errors.items():
+                if pattern.endswith("*") and token.startswith(pattern[:-1]):
+                    code = pcode
+                    break
+        if code is None and self.error_rate:
+            with self._lock:
+                if self._rng.random() < self.error_rate:
+                    code = UNAVAILABLE
+        return code
+
+    def apply(self, tokens: List[str]) -> PushResult:
+        """Simulate one provider call (blocking for the configured latency)."""
+        delay = self.delay()
+        if delay:
+            time.sleep(delay)
+        if self.throttled():
+            return PushResult(errors={t: THROTTLED for t in tokens}, retry_after=self.retry_after)
+        errors = {}
+        for t in tokens:
+            code = self.token_error(t)
+            if code:
+                errors[t] = code
+        return PushResult(success_count=len(tokens) - len(errors), errors=errors)
+
+
+class InMemoryTransport(PushTransport):
+    """Fake provider that records delivered messages; behaviour is driven by a FaultProfile."""
+
+    name = "memory"
+
+    def __init__(self, faults: Optional[FaultProfile] = None, keep_messages: bool = True):
+        self.faults = faults or FaultProfile()
+        self.keep_messages = keep_messages
+        self.calls = 0
+        self.delivered = 0
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def send_multicast(self, tokens, title, body, data):
+        result = self.faults.apply(tokens)
+        with self._lock:
+            self.calls += 1
+            self.delivered += result.success_count
+            if self.keep_messages:
+                for t in tokens:
+                    if t not in result.errors:
+                        self.messages.append({"token": t, "title": title, "body": body, "data": dict(data)})
+        return result
+
+
+class HttpStandInTransport(PushTransport):
+    """Client for the local FCM stand-in server (python -m flow7_core.push_standin)."""
+
+    name = "http"
+
+    def __init__(self, base_url: str = PUSH_STANDIN_URL, timeout: float = PUSH_HTTP_TIMEOUT):
+        import httpx
+
+        self.base_url = base_url.rstrip("/")
+        # one pooled client per transport: keep-alive connections are reused across sends
+        self.client = httpx.Client(base_url=self.base_url, timeout=timeout)
+
+    def send_multicast(self, tokens, title, body, data):
+        r = self.client.post("/v1/send_multicast", json={"tokens": list(tokens), "title": title, "body": body, "data": data})
+        if r.status_code == 429:
+            retry_after = float(r.headers.get("retry-after") or 1.0)
+            return PushResult(errors={t: THROTTLED for t in tokens}, retry_after=retry_after)
+        if r.status_code >= 500:
+            return PushResult(errors={t: UNAVAILABLE for t in tokens})
+        r.raise_for_status()
+        payload = r.json()
+        return PushResult(success_count=payload.get("success_count", 0), errors=payload.get("errors") or {})
+
+
+_transport: Optional[PushTransport] = None
+_transport_lock = threading.Lock()
+
+
+def _build_transport(kind: str) -> PushTransport:
+    if kind == "auto":
+        kind = "firebase" if firebase_available() else "log"
+    if kind == "firebase":
+        return FirebaseTransport()
+    if kind == "http":
+        return HttpStandInTransport()
+    if kind == "memory":
+        return InMemoryTransport()
+    return LogTransport()
+
+
+def get_transport() -> PushTransport:
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = _build_transport(PUSH_TRANSPORT)
+    return _transport
+
+
+def set_transport(transport: Optional[PushTransport]) -> None:
+    """Swap the active transport (benchmarks, stand-in runs). None re-reads PUSH_TRANSPORT."""
+    global _transport
+    with _transport_lock:
+        _transport = transport
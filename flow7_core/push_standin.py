@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import threading
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+
+from flow7_core.push import FaultProfile
+
+# Local FCM stand-in for offline send-path benchmarking. Point the API at it with
+#   PUSH_TRANSPORT=http PUSH_STANDIN_URL=http://127.0.0.1:8787
+# and start it with e.g.
+#   python -m flow7_core.push_standin --latency-ms 40 --throttle-rate 0.05 --token-error 'bad-*=unregistered'
+# Latency is awaited (not slept) so the server itself sustains many concurrent senders.
+
+app = FastAPI(title="Flow7 FCM stand-in")
+faults = FaultProfile()
+_stats = {"calls": 0, "throttled_calls": 0, "tokens": 0, "delivered": 0, "failed": 0}
+_stats_lock = threading.Lock()
+
+
+class MulticastRequest(BaseModel):
+    tokens: List[str]
+    title: str = ""
+    body: str = ""
+    data: Dict[str, str] = Field(default_factory=dict)
+
+
+class FaultUpdate(BaseModel):
+    latency_ms: Optional[float] = None
+    jitter_ms: Optional[float] = None
+    throttle_rate: Optional[float] = None
+    retry_after: Optional[float] = None
+    error_rate: Optional[float] = None
+    token_errors: Optional[Dict[str, str]] = None
+
+
+@app.post("/v1/send_multicast")
+async def send_multicast(req: MulticastRequest):
+    delay = faults.delay()
+    if delay:
+        await asyncio.sleep(delay)
+    with _stats_lock:
+        _stats["calls"] += 1
+        _stats["tokens"] += len(req.tokens)
+    if faults.throttled():
+        with _stats_lock:
+            _stats["throttled_calls"] += 1
+        return JSONResponse(status_code=429, content={"error": "quota exceeded"}, headers={"Retry-After": str(faults.retry_after)})
+    errors = {}
+    for t in req.tokens:
+        code = faults.token_error(t)
+        if code:
+            errors[t] = code
+    with _stats_lock:
+        _stats["delivered"] += len(req.tokens) - len(errors)
+        _stats["failed"] += len(errors)
+    return {"success_count": len(req.tokens) - len(errors), "failure_count": len(errors), "errors": errors}
+
+
+@app.get("/v1/stats")
+def get_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+@app.put("/v1/faults")
+def update_faults(update: FaultUpdate):
+    """Reconfigure injected behaviour at runtime (between benchmark phases)."""
+    for key, value in update.dict(exclude_none=True).items():
+        setattr(faults, key, value)
+    return {k: getattr(faults, k) for k in ("latency_ms", "jitter_ms", "throttle_rate", "retry_after", "error_rate", "token_errors")}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local FCM stand-in server")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8787)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--throttle-rate", type=float, default=0.0, help="probability a call is answered with 429")
+    ap.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="probability a single token fails transiently")
+    ap.add_argument("--token-error", action="append", default=[], metavar="TOKEN=CODE",
+                    help="pin an error code to a token or 'prefix*' (repeatable)")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+
+    global faults
+    token_errors = dict(item.split("=", 1) for item in args.token_error)
+    faults = FaultProfile(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, throttle_rate=args.throttle_rate,
+                          retry_after=args.retry_after, error_rate=args.error_rate, token_errors=token_errors, seed=args.seed)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import abc
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+
+from flow7_core.config import (
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_PER_MINUTE,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_MAX_KEYS,
+    RATE_LIMIT_TIER_MULTIPLIERS,
+)
+from flow7_core.metrics import RATE_LIMITED, RATE_LIMIT_KEYS
+
+
+class RateLimitBackend(abc.ABC):
+    """Token-bucket store. A shared implementation (e.g. for several API processes) only needs `take`."""
+
+    @abc.abstractmethod
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        """Try to remove `cost` tokens from `key`'s bucket refilled at `rate` tokens/s up to `burst`.
+
+        Returns (allowed, retry_after_seconds).
+        """
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Per-process buckets: two floats per active key, least recently used keys evicted past max_keys.
+
+    An evicted bucket is recreated full, which is also what an idle bucket would have refilled to.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: "OrderedDict[str, _Bucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key, rate, burst, cost=1.0):
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = _Bucket(burst, now)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+                bucket.updated = now
+            if bucket.tokens >= cost:
+                bucket.tokens -= cost
+                return True, 0.0
+            return False, (cost - bucket.tokens) / rate if rate > 0 else float("inf")
+
+
+_backend: RateLimitBackend = InMemoryRateLimitBackend()
+RATE_LIMIT_KEYS.set_callback(lambda: len(_backend) if hasattr(_backend, "__len__") else 0)
+
+
+def set_backend(backend: RateLimitBackend) -> None:
+    global _backend
+    _backend = backend
+
+
+def get_backend() -> RateLimitBackend:
+    return _backend
+
+
+def tier_multiplier(tier: Optional[str]) -> float:
+    """Scale of the tier's limits relative to FREE (RATE_LIMIT_TIER_MULTIPLIERS)."""
+    return RATE_LIMIT_TIER_MULTIPLIERS.get(tier or "FREE", RATE_LIMIT_TIER_MULTIPLIERS["FREE"])
+
+
+def check_rate_limit(uid: str, tier: Optional[str], scope: str = "api", cost: float = 1.0) -> Tuple[bool, float]:
+    if not RATE_LIMIT_ENABLED:
+        return True, 0.0
+    scale = tier_multiplier(tier)
+    rate = RATE_LIMIT_PER_MINUTE * scale / 60.0
+    burst = RATE_LIMIT_BURST * scale
+    allowed, retry_after = _backend.take(f"{scope}:{uid}", rate, burst, cost)
+    if not allowed:
+        RATE_LIMITED.inc(scope=scope, tier=tier or "FREE")
+    return allowed, retry_after
+
+
+def enforce_rate_limit(uid: str, tier: Optional[str], scope: str = "api", cost: float = 1.0) -> None:
+    """Raise 429 with Retry-After when the caller's bucket is empty."""
+    allowed, retry_after = check_rate_limit(uid, tier, scope, cost)
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail="Çok fazla istek. Lütfen daha sonra tekrar deneyin.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
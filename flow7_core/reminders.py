@@ -0,0 +1,76 @@
+from datetime import date as PyDate, datetime, time as PyTime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from flow7_core.config import DEFAULT_REMINDERS
+
+# Reminder offsets. A plan can be reminded at any subset of REMINDER_SLOTS, stored as a bitmask
+# (bit i = slot i) in plans.reminder_mask, or user_settings.reminder_mask for plans without their
+# own choice. plans.notified_mask has a bit set for each reminder already sent or skipped. A plan
+# still has one scheduler job and one notify_at: the time of its next pending reminder. After each
+# dispatch the job is re-armed for the following one, so more reminders do not add job-store rows.
+
+# (name, anchor, minutes relative to the anchor); append new slots only, bit positions are stored
+REMINDER_SLOTS = (
+    ("start", "start", 0),
+    ("start-5m", "start", -5),
+    ("start-10m", "start", -10),
+    ("start-15m", "start", -15),
+    ("start-30m", "start", -30),
+    ("start-1h", "start", -60),
+    ("start-2h", "start", -120),
+    ("start-1d", "start", -1440),
+    ("end", "end", 0),
+)
+
+_SLOT_BITS = {name: 1 << i for i, (name, _, _) in enumerate(REMINDER_SLOTS)}
+ALL_REMINDERS_MASK = (1 << len(REMINDER_SLOTS)) - 1
+
+
+def mask_from_names(names: Iterable[str]) -> int:
+    """Bitmask for reminder names; raises ValueError for an unknown name."""
+    mask = 0
+    for name in names:
+        try:
+            mask |= _SLOT_BITS[name.strip()]
+        except KeyError:
+            raise ValueError(f"unknown reminder {name!r}")
+    return mask
+
+
+def names_from_mask(mask: int) -> List[str]:
+    return [name for name, bit in _SLOT_BITS.items() if mask & bit]
+
+
+DEFAULT_REMINDER_MASK = mask_from_names(n for n in DEFAULT_REMINDERS.split(",") if n.strip())
+
+
+def effective_mask(plan_mask: Optional[int], user_mask: Optional[int] = None) -> int:
+    if plan_mask is not None:
+        return plan_mask
+    return user_mask if user_mask is not None else DEFAULT_REMINDER_MASK
+
+
+def reminder_times(day: PyDate, start_time: PyTime, end_time: Optional[PyTime], mask: int, zone) -> List[Tuple[int, datetime]]:
+    """(bit, UTC time) of every reminder in `mask`, earliest first; "end" is skipped for plans without an end."""
+    out = []
+    for i, (_, anchor, minutes) in enumerate(REMINDER_SLOTS):
+        bit = 1 << i
+        if not mask & bit:
+            continue
+        anchor_time = start_time if anchor == "start" else end_time
+        if anchor_time is None:
+            continue
+        local = datetime.combine(day, anchor_time).replace(tzinfo=zone)
+        out.append((bit, (local + timedelta(minutes=minutes)).astimezone(timezone.utc)))
+    out.sort(key=lambda item: (item[1], item[0]))
+    return out
+
+
+def pending_reminders(plan, mask: int, zone) -> List[Tuple[int, datetime]]:
+    """Reminders of `plan` not yet sent or skipped, earliest first."""
+    done = plan.notified_mask or 0
+    return [(bit, when) for bit, when in reminder_times(plan.date, plan.start_time, plan.end_time, mask, zone) if not done & bit]
+
+
+def reminder_name(bit: int) -> str:
+    return REMINDER_SLOTS[bit.bit_length() - 1][0]
@@ -0,0 +1,85 @@
+from datetime import date as PyDate, datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from flow7_core.config import PLAN_RETENTION_DAYS, PLAN_ARCHIVE_BATCH_SIZE
+from flow7_core.db import SessionLocal
+from flow7_core.models import PlanORM, PlanArchiveORM
+from flow7_core.metrics import PLANS_ARCHIVED
+from flow7_core.log import get_logger
+
+logger = get_logger("retention")
+
+# columns shared by plans and plans_archive, in table order
+PLAN_COLUMNS = [c.name for c in PlanORM.__table__.columns]
+
+
+def archive_cutoff(today: Optional[PyDate] = None) -> Optional[PyDate]:
+    """Plans dated before this day may live in plans_archive; None when retention is disabled."""
+    if PLAN_RETENTION_DAYS <= 0:
+        return None
+    return (today or datetime.now(timezone.utc).date()) - timedelta(days=PLAN_RETENTION_DAYS)
+
+
+def range_reaches_archive(start_date: Optional[PyDate]) -> bool:
+    """Whether a read starting at `start_date` (None = unbounded) must also look at plans_archive."""
+    cutoff = archive_cutoff()
+    return cutoff is not None and (start_date is None or start_date < cutoff)
+
+
+def restore_plan(db: Session, plan_id: str) -> Optional[PlanORM]:
+    """Move an archived plan back into plans inside the caller's transaction (before it is edited).
+
+    Returns the live plan, or None when plans_archive has no such id. Compaction archives it again
+    once it is notified and still older than the cutoff.
+    """
+    archived = PlanArchiveORM.__table__
+    moved = db.execute(insert(PlanORM).from_select(
+        PLAN_COLUMNS,
+        select(*[archived.c[name] for name in PLAN_COLUMNS]).where(archived.c.id == plan_id),
+    )).rowcount
+    if not moved:
+        return None
+    db.execute(delete(PlanArchiveORM).where(PlanArchiveORM.id == plan_id).execution_options(synchronize_session=False))
+    return db.get(PlanORM, plan_id)
+
+
+def compact_plans(today: Optional[PyDate] = None) -> int:
+    """Move notified plans dated before the retention cutoff into plans_archive, in batches.
+
+    Each batch is copied and deleted in one transaction, so readers see a plan in exactly one
+    table. Runs periodically from the scheduler; returns the number of archived plans.
+    """
+    cutoff = archive_cutoff(today)
+    if cutoff is None:
+        return 0
+    total = 0
+    db = SessionLocal()
+    try:
+        while True:
+            ids = db.execute(select(PlanORM.id).where(
+                PlanORM.date < cutoff,
+                PlanORM.notified == True,
+            ).limit(PLAN_ARCHIVE_BATCH_SIZE)).scalars().all()
+            if not ids:
+                break
+            db.execute(insert(PlanArchiveORM).from_select(
+                PLAN_COLUMNS,
+                select(*[PlanORM.__table__.c[name] for name in PLAN_COLUMNS]).where(PlanORM.id.in_(ids)),
+            ))
+            db.execute(delete(PlanORM).where(PlanORM.id.in_(ids)).execution_options(synchronize_session=False))
+            db.commit()
+            total += len(ids)
+            PLANS_ARCHIVED.inc(len(ids))
+            if len(ids) < PLAN_ARCHIVE_BATCH_SIZE:
+                break
+    except Exception:
+        db.rollback()
+        logger.exception("plan compaction failed")
+    finally:
+        db.close()
+    if total:
+        logger.info("plan compaction: archived old notified plans", extra={"archived": total, "cutoff": cutoff.isoformat()})
+    return total
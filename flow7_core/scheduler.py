@@ -1,144 +1,305 @@
 from datetime import datetime, timedelta, timezone
+import importlib.util
 import threading
 import os
 from typing import Optional
 
 from flow7_core.db import SessionLocal
-from flow7_core.models import PlanORM
-from sqlalchemy import select
+from flow7_core.models import PlanORM, UserSettings
+from sqlalchemy import exists, select, update
 from sqlalchemy.orm import Session
-from flow7_core.config import DATABASE_URL
-from flow7_core.notifications import send_notification_to_user, _get_user_zoneinfo
+from flow7_core.config import DATABASE_URL, NOTIFY_COALESCE_WINDOW_SECONDS, SUBSCRIPTION_SWEEP_INTERVAL_SECONDS, PLAN_RETENTION_DAYS, PLAN_ARCHIVE_INTERVAL_SECONDS, STATE_PURGE_INTERVAL_SECONDS, SCHEDULE_LOOKAHEAD_DAYS, SCHEDULE_SWEEP_INTERVAL_SECONDS, DISPATCH_MODE, DISPATCH_POLL_SECONDS
+from flow7_core.notifications import send_notification_to_user, send_digest_to_user, _get_user_zoneinfo
+from flow7_core.metrics import SCHEDULER_JOB_LAG, SCHEDULER_QUEUE_DEPTH, SCHEDULER_DISPATCHES
+from flow7_core.log import get_logger, log_context
+from flow7_core.state import SESSION_TIMEZONES, purge_expired_state
+from flow7_core.reminders import effective_mask, pending_reminders, reminder_name
 
-# APScheduler imports
-APScheduler_AVAILABLE = False
-try:
-    from apscheduler.schedulers.background import BackgroundScheduler
-    from apscheduler.schedulers.blocking import BlockingScheduler
-    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
-    APScheduler_AVAILABLE = True
-except Exception:
-    APScheduler_AVAILABLE = False
+logger = get_logger("scheduler")
+
+# APScheduler is only imported by start_scheduler(); importing this module stays cheap
+APScheduler_AVAILABLE = importlib.util.find_spec("apscheduler") is not None
 
-# internal scheduler handle
+# internal scheduler handle and its persistent job store
 _scheduler = None
+_jobstore = None
+# ShardDispatcher of this process when DISPATCH_MODE is "sharded", its poll thread and stop flag
+_dispatcher = None
+_dispatcher_thread = None
+_dispatcher_stop = None
 
 GRACE_WINDOW = timedelta(hours=24)  # how old a missed job can be to still run immediately
+RESCHEDULE_WRITE_BATCH = 500  # plans per UPDATE when reschedule marks expired plans notified
+
+_USER_LOCKS = [threading.Lock() for _ in range(64)]
+
+_MISSING = object()
+
+
+def _utcnow() -> datetime:
+    """Aware UTC now for scheduling decisions; the soak harness (benchmarks/soak_scheduler.py) swaps in a simulated clock."""
+    return datetime.now(timezone.utc)
 
 
 def _dispatch_notification_job(plan_id: str):
     # wrapper to be used by APScheduler; mirrors previous dispatch_notification_job
+    with log_context(plan_id=plan_id):
+        _dispatch_plan(plan_id)
+
+
+def _plan_payload(plan: PlanORM, reminder_bit: Optional[int] = None) -> dict:
+    return {
+        "title": plan.title,
+        "description": plan.description or "",
+        "start_time": plan.start_time.strftime("%H:%M") if plan.start_time else "",
+        "end_time": plan.end_time.strftime("%H:%M") if plan.end_time else "",
+        "date": plan.date.isoformat(),
+        "reminder": reminder_name(reminder_bit) if reminder_bit else "start",
+    }
+
+
+def _as_naive_utc(dt: datetime) -> datetime:
+    """notify_at is stored without tzinfo; compare against naive UTC values in queries."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _user_lock(uid: str) -> threading.Lock:
+    # striped locks: jobs of the same user firing together are serialized, memory stays O(1)
+    return _USER_LOCKS[hash(uid) % len(_USER_LOCKS)]
+
+
+def _user_reminder_mask(db: Session, uid: str) -> Optional[int]:
+    s = db.get(UserSettings, uid)
+    return s.reminder_mask if s is not None else None
+
+
+def _plan_reminder_mask(db: Session, plan: PlanORM) -> int:
+    if plan.reminder_mask is not None:
+        return plan.reminder_mask
+    return effective_mask(None, _user_reminder_mask(db, plan.user_id))
+
+
+def _reminder_state(plan: PlanORM, mask: int, zone, until: datetime):
+    """(bits of the pending reminders due by `until`, the latest of them, UTC time of the next later one)."""
+    due, last, next_at = 0, None, None
+    for bit, when in pending_reminders(plan, mask, zone):
+        if when <= until:
+            due |= bit
+            last = bit
+        elif next_at is None:
+            next_at = when
+    return due, last, next_at
+
+
+def _add_plan_job(plan_id: str, run_date: datetime, misfire_grace_time: int = 60) -> bool:
+    """(Re)arm the plan's single job; False when the scheduler is not running or refused the job.
+
+    In sharded mode there are no per-plan jobs: the persisted notify_at is what the dispatcher
+    threads (and any `python -m flow7_core.dispatch` processes) poll.
+    """
+    if DISPATCH_MODE == "sharded":
+        return True
+    if _scheduler is None:
+        return False
+    try:
+        _scheduler.add_job(
+            func=_dispatch_notification_job,
+            trigger="date",
+            run_date=run_date,
+            id=f"plan_{plan_id}",
+            args=[plan_id],
+            replace_existing=True,
+            misfire_grace_time=misfire_grace_time,
+        )
+        return True
+    except Exception as e:
+        logger.warning("schedule: failed to add job to scheduler: %s", e, extra={"plan_id": plan_id})
+        return False
+
+
+def _coalesce_group(db: Session, plan: PlanORM):
+    """Other pending plans of the same user whose notify_at falls in [anchor, anchor + window].
+
+    Only later reminders are pulled forward (by at most the window); earlier ones already had
+    their own job, so nothing is ever sent late because of coalescing.
+    """
+    if NOTIFY_COALESCE_WINDOW_SECONDS <= 0 or plan.notify_at is None:
+        return []
+    anchor = _as_naive_utc(plan.notify_at)
+    window = timedelta(seconds=NOTIFY_COALESCE_WINDOW_SECONDS)
+    return db.execute(select(PlanORM).where(
+        PlanORM.user_id == plan.user_id,
+        PlanORM.id != plan.id,
+        PlanORM.notified == False,
+        PlanORM.notify_at >= anchor,
+        PlanORM.notify_at <= anchor + window,
+    ).order_by(PlanORM.date, PlanORM.start_time)).scalars().all()
+
+
+def _dispatch_plan(plan_id: str):
+    """Send the plan's due reminder(s), mark them in notified_mask and re-arm the job for the next one.
+
+    Reminders missed while the job was late are marked without a message of their own; only the
+    latest due one is sent.
+    """
     try:
         db = SessionLocal()
         try:
             plan = db.get(PlanORM, plan_id)
             if not plan:
-                print(f"[DISPATCH] plan {plan_id} not found; skipping")
+                SCHEDULER_DISPATCHES.inc(outcome="missing")
+                logger.info("dispatch: plan not found; skipping")
                 return
-            if plan.notified:
-                print(f"[DISPATCH] plan {plan_id} already notified; skipping")
-                return
-
-            # notifications enabled check
-            try:
-                s = db.get(plan.__class__.__module__ and None, plan.user_id)
-            except Exception:
-                s = None
-            # Use best-effort: rely on send_notification_to_user to honor user prefs if needed
-
-            payload = {
-                "title": plan.title,
-                "description": plan.description or "",
-                "start_time": plan.start_time.strftime("%H:%M") if plan.start_time else "",
-                "end_time": plan.end_time.strftime("%H:%M") if plan.end_time else "",
-                "date": plan.date.isoformat(),
-            }
-
-            try:
-                send_notification_to_user(plan.user_id, payload)
-            except Exception as e:
-                print(f"[DISPATCH] failed to send notification for plan {plan_id}: {e}")
-
-            plan.notified = True
-            db.add(plan)
-            db.commit()
-            print(f"[DISPATCH] finished job for plan {plan_id}")
+            rearm = []
+            with _user_lock(plan.user_id):
+                # another job of this user may have sent a digest including this plan meanwhile
+                db.refresh(plan)
+                now = _utcnow()
+                zone = _get_user_zoneinfo(plan.user_id)
+                settings = db.get(UserSettings, plan.user_id)
+                user_mask = settings.reminder_mask if settings is not None else None
+                due, last, next_at = _reminder_state(plan, effective_mask(plan.reminder_mask, user_mask), zone, now)
+                if plan.notified or not due:
+                    SCHEDULER_DISPATCHES.inc(outcome="duplicate")
+                    logger.info("dispatch: no reminder due; skipping")
+                    if not plan.notified:
+                        # keep notify_at on the next pending reminder, so it is not found due again
+                        plan.notify_at = next_at
+                        plan.notified = next_at is None
+                        db.commit()
+                        if next_at is not None:
+                            _add_plan_job(plan.id, next_at)
+                    return
+                if plan.notify_at is not None:
+                    na = plan.notify_at if plan.notify_at.tzinfo else plan.notify_at.replace(tzinfo=timezone.utc)
+                    SCHEDULER_JOB_LAG.observe((_utcnow() - na).total_seconds())
+
+                # coalesced plans contribute the reminders due within the window after this one
+                states = [(plan, due, last, next_at)]
+                until = now + timedelta(seconds=NOTIFY_COALESCE_WINDOW_SECONDS)
+                for p in _coalesce_group(db, plan):
+                    p_due, p_last, p_next = _reminder_state(p, effective_mask(p.reminder_mask, user_mask), zone, until)
+                    if p_due:
+                        states.append((p, p_due, p_last, p_next))
+
+                if settings is not None and settings.notifications_enabled is False:
+                    # opted out: due reminders are consumed without a message, so opting back in sends nothing late
+                    SCHEDULER_DISPATCHES.inc(outcome="disabled")
+                    logger.info("dispatch: notifications disabled for user; not sending")
+                else:
+                    try:
+                        if len(states) == 1:
+                            send_notification_to_user(plan.user_id, _plan_payload(plan, last))
+                        else:
+                            ordered = sorted(states, key=lambda st: (st[0].date, st[0].start_time))
+                            send_digest_to_user(plan.user_id, [_plan_payload(p, p_last) for p, _, p_last, _ in ordered])
+                        SCHEDULER_DISPATCHES.inc(outcome="sent")
+                        if len(states) > 1:
+                            SCHEDULER_DISPATCHES.inc(len(states) - 1, outcome="coalesced")
+                    except Exception as e:
+                        SCHEDULER_DISPATCHES.inc(outcome="error")
+                        logger.warning("dispatch: failed to send notification: %s", e)
+
+                for p, p_due, _, p_next in states:
+                    p.notified_mask = (p.notified_mask or 0) | p_due
+                    if p_next is None:
+                        p.notified = True
+                    else:
+                        p.notify_at = p_next
+                        rearm.append((p.id, p_next))
+                    db.add(p)
+                db.commit()
+            # one job per plan: move it to the next reminder; coalesced plans without one lose theirs
+            armed = {plan_id_ for plan_id_, _ in rearm}
+            for plan_id_, run_date in rearm:
+                _add_plan_job(plan_id_, run_date)
+            for p, _, _, _ in states[1:]:
+                if p.id not in armed:
+                    cancel_scheduled_plan(p.id)
+            logger.info("dispatch: finished job", extra={"uid": plan.user_id, "coalesced": len(states) - 1, "rearmed": len(rearm)})
         finally:
             db.close()
     except Exception:
-        import traceback
-        traceback.print_exc()
+        logger.exception("dispatch: unexpected error")
 
 
-def schedule_notification_for_plan(plan: PlanORM):
-    """Schedule a single-run job and persist plan.notify_at (UTC)."""
-    try:
-        if not APScheduler_AVAILABLE:
-            # compute and persist
-            user_zone = _get_user_zoneinfo(plan.user_id)
-            try:
-                local_dt = datetime.combine(plan.date, plan.start_time).replace(tzinfo=user_zone)
-                notify_dt_utc = local_dt.astimezone(timezone.utc)
-            except Exception:
-                notify_dt_utc = datetime.combine(plan.date, plan.start_time).replace(tzinfo=timezone.utc)
-            try:
-                db = SessionLocal()
-                try:
-                    p = db.get(PlanORM, plan.id)
-                    if p:
-                        p.notify_at = notify_dt_utc
-                        db.add(p)
-                        db.commit()
-                finally:
-                    db.close()
-            except Exception:
-                pass
-            print(f"[SCHEDULE-LOG] plan {plan.id} would be scheduled at utc={notify_dt_utc.isoformat()} (APScheduler not available)")
-            return
+def _next_reminder_at(db: Session, plan: PlanORM, zone, now: datetime, user_mask=_MISSING) -> Optional[datetime]:
+    mask = _plan_reminder_mask(db, plan) if user_mask is _MISSING else effective_mask(plan.reminder_mask, user_mask)
+    return next((when for _, when in pending_reminders(plan, mask, zone) if when > now), None)
 
-        user_zone = _get_user_zoneinfo(plan.user_id)
-        try:
-            local_dt = datetime.combine(plan.date, plan.start_time).replace(tzinfo=user_zone)
-            notify_dt_utc = local_dt.astimezone(timezone.utc)
-        except Exception:
-            notify_dt_utc = datetime.combine(plan.date, plan.start_time).replace(tzinfo=timezone.utc)
 
+def schedule_notification_for_plan(plan: PlanORM) -> Optional[datetime]:
+    """Arm the plan's job at its next pending reminder and persist plan.notify_at (UTC).
+
+    Returns that time, or None when none of the plan's reminders lies in the future.
+    """
+    try:
+        now = _utcnow()
+        user_zone = _get_user_zoneinfo(plan.user_id)
+        notify_dt_utc = None
         try:
             db = SessionLocal()
             try:
                 p = db.get(PlanORM, plan.id)
                 if p:
-                    p.notify_at = notify_dt_utc
-                    db.add(p)
-                    db.commit()
-                    db.refresh(p)
+                    notify_dt_utc = _next_reminder_at(db, p, user_zone, now)
+                    if notify_dt_utc is not None:
+                        p.notify_at = notify_dt_utc
+                        db.add(p)
+                        db.commit()
             finally:
                 db.close()
         except Exception as e:
-            print(f"[SCHEDULE] warning: failed to persist notify_at for plan {plan.id}: {e}")
-
-        job_id = f"plan_{plan.id}"
-        global _scheduler
-        if _scheduler is not None:
-            try:
-                _scheduler.add_job(
-                    func=_dispatch_notification_job,
-                    trigger="date",
-                    run_date=notify_dt_utc,
-                    id=job_id,
-                    args=[plan.id],
-                    replace_existing=True,
-                    misfire_grace_time=60,
-                )
-                print(f"[SCHEDULE] scheduled job {job_id} at {notify_dt_utc.isoformat()}")
-                return
-            except Exception as e:
-                print(f"[SCHEDULE] failed to add job to scheduler: {e}")
+            logger.warning("schedule: failed to persist notify_at: %s", e, extra={"plan_id": plan.id})
 
-        print(f"[SCHEDULE-LOG] plan {plan.id} would be scheduled at utc={notify_dt_utc.isoformat()}")
+        if notify_dt_utc is None:
+            logger.debug("schedule: no upcoming reminder", extra={"plan_id": plan.id})
+            return None
+        if not APScheduler_AVAILABLE:
+            logger.debug("schedule: APScheduler not available; notify_at persisted only", extra={"plan_id": plan.id, "notify_at": notify_dt_utc.isoformat()})
+        elif _add_plan_job(plan.id, notify_dt_utc):
+            logger.debug("schedule: scheduled job", extra={"plan_id": plan.id, "notify_at": notify_dt_utc.isoformat()})
+        else:
+            logger.debug("schedule: scheduler not running; notify_at persisted only", extra={"plan_id": plan.id, "notify_at": notify_dt_utc.isoformat()})
+        return notify_dt_utc
     except Exception:
-        import traceback
-        traceback.print_exc()
+        logger.exception("schedule: unexpected error", extra={"plan_id": plan.id})
+        return None
+
+
+def schedule_notifications_for_plans(plans) -> int:
+    """Bulk schedule_notification_for_plan: notify_at of all plans in one UPDATE, then one job each.
+
+    Plans without a future reminder are skipped. Returns the number of scheduled plans.
+    """
+    now_utc = _utcnow()
+    users = {}
+    pending = []
+    db = SessionLocal()
+    try:
+        for plan in plans:
+            if plan.user_id not in users:
+                users[plan.user_id] = (_get_user_zoneinfo(plan.user_id), _user_reminder_mask(db, plan.user_id))
+            zone, user_mask = users[plan.user_id]
+            notify_dt_utc = _next_reminder_at(db, plan, zone, now_utc, user_mask)
+            if notify_dt_utc is not None:
+                pending.append((plan.id, notify_dt_utc))
+        if not pending:
+            return 0
+        db.execute(update(PlanORM), [{"id": plan_id, "notify_at": notify_at} for plan_id, notify_at in pending])
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning("schedule: failed to persist notify_at in bulk: %s", e, extra={"plans": len(pending)})
+    finally:
+        db.close()
+
+    for plan_id, notify_at in pending:
+        _add_plan_job(plan_id, notify_at)
+    logger.debug("schedule: bulk scheduled", extra={"plans": len(pending)})
+    return len(pending)
 
 
 def cancel_scheduled_plan(plan_id: str):
@@ -147,139 +308,288 @@ def cancel_scheduled_plan(plan_id: str):
     if _scheduler is not None:
         try:
             _scheduler.remove_job(job_id)
-            print(f"[CANCEL] removed job {job_id}")
+            logger.debug("cancel: removed job", extra={"plan_id": plan_id})
             return
         except Exception:
             pass
-    print(f"[CANCEL-LOG] would cancel job {job_id} (scheduler not available or job missing)")
+    logger.debug("cancel: no job to remove (scheduler not available or job missing)", extra={"plan_id": plan_id})
 
 
-def init_and_reschedule():
-    """Initialize scheduler and reschedule pending plans. To be called from app startup."""
-    global _scheduler
+def _ensure_aware_utc(dt):
+    """Return a timezone-aware datetime in UTC. If dt is naive, assume UTC and attach tzinfo.
+    If dt already has tzinfo, convert to UTC.
+    """
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        try:
+            return dt.replace(tzinfo=timezone.utc)
+        except Exception:
+            return datetime.fromtimestamp(dt.timestamp(), tz=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def _job_count(jobstore) -> int:
+    """Rows in the persistent job store; a COUNT(*) instead of get_jobs(), which unpickles every job."""
+    from sqlalchemy import func
+
+    with jobstore.engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(jobstore.jobs_t)).scalar()
+
+
+def _armed_plan_ids(jobstore) -> set:
+    """Plan ids that already have a job in the persistent store (read from the id column, nothing unpickled)."""
+    with jobstore.engine.connect() as conn:
+        rows = conn.execute(select(jobstore.jobs_t.c.id).where(jobstore.jobs_t.c.id.like("plan_%")))
+        return {job_id[len("plan_"):] for job_id, in rows}
+
+
+def _start_dispatcher(jobstore) -> None:
+    """Run this process's ShardDispatcher on its own thread (sharded mode).
+
+    The poll loop is not an APScheduler job: a bound ShardDispatcher.poll cannot be pickled into the
+    persistent job store. Poll rows left there by earlier versions or crashed workers are removed.
+    """
+    global _dispatcher, _dispatcher_thread, _dispatcher_stop
+    try:
+        with jobstore.engine.begin() as conn:
+            conn.execute(jobstore.jobs_t.delete().where(jobstore.jobs_t.c.id.like("dispatch_poll_%")))
+    except Exception as e:
+        logger.warning("failed to remove stale dispatch poll jobs: %s", e)
+    try:
+        from flow7_core.dispatch import ShardDispatcher, run_forever
+        _dispatcher = ShardDispatcher()
+        _dispatcher_stop = threading.Event()
+        _dispatcher_thread = threading.Thread(target=run_forever, args=(_dispatcher, _dispatcher_stop), name="flow7-dispatcher", daemon=True)
+        _dispatcher_thread.start()
+        logger.info("sharded dispatch enabled", extra={"worker_id": _dispatcher.worker_id})
+    except Exception as e:
+        _dispatcher = None
+        logger.error("failed to start dispatcher: %s", e)
+
+
+def start_scheduler():
+    """Start the background scheduler with its periodic jobs; fast enough for the startup hook."""
+    global _scheduler, _jobstore
     if not APScheduler_AVAILABLE:
-        print("[SCHEDULER] APScheduler not available; scheduler disabled")
+        logger.warning("APScheduler not available; scheduler disabled")
         _scheduler = None
         return None
 
     if _scheduler is not None:
         return _scheduler
 
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+
     jobstores = {"default": SQLAlchemyJobStore(url=DATABASE_URL)}
     sched = BackgroundScheduler(jobstores=jobstores, timezone=timezone.utc)
     _scheduler = sched
+    _jobstore = jobstores["default"]
+    SCHEDULER_QUEUE_DEPTH.set_callback(lambda: _job_count(jobstores["default"]))
     try:
         sched.start()
-        print("[SCHEDULER] background scheduler started")
+        logger.info("background scheduler started")
     except Exception as e:
-        print(f"[SCHEDULER] failed to start scheduler: {e}")
+        logger.error("failed to start scheduler: %s", e)
 
-    def _ensure_aware_utc(dt):
-        """Return a timezone-aware datetime in UTC. If dt is naive, assume UTC and attach tzinfo.
-        If dt already has tzinfo, convert to UTC.
-        """
-        if dt is None:
-            return None
-        if dt.tzinfo is None:
+    # periodic downgrade of expired subscriptions (also run once right away)
+    try:
+        from flow7_core.subscriptions import sweep_expired_subscriptions
+        sched.add_job(
+            func=sweep_expired_subscriptions,
+            trigger="interval",
+            seconds=SUBSCRIPTION_SWEEP_INTERVAL_SECONDS,
+            id="subscription_sweeper",
+            replace_existing=True,
+            next_run_time=datetime.now(timezone.utc),
+            coalesce=True,
+            max_instances=1,
+        )
+    except Exception as e:
+        logger.error("failed to add subscription sweeper job: %s", e)
+
+    if PLAN_RETENTION_DAYS > 0:
+        try:
+            from flow7_core.retention import compact_plans
+            sched.add_job(
+                func=compact_plans,
+                trigger="interval",
+                seconds=PLAN_ARCHIVE_INTERVAL_SECONDS,
+                id="plan_compaction",
+                replace_existing=True,
+                coalesce=True,
+                max_instances=1,
+            )
+        except Exception as e:
+            logger.error("failed to add plan compaction job: %s", e)
+
+    try:
+        sched.add_job(
+            func=purge_expired_state,
+            trigger="interval",
+            seconds=STATE_PURGE_INTERVAL_SECONDS,
+            id="state_purge",
+            replace_existing=True,
+            coalesce=True,
+            max_instances=1,
+        )
+    except Exception as e:
+        logger.error("failed to add state purge job: %s", e)
+
+    if DISPATCH_MODE == "sharded":
+        _start_dispatcher(jobstores["default"])
+    else:
+        # plans created beyond SCHEDULE_LOOKAHEAD_DAYS get their job once they enter the window
+        try:
+            sched.add_job(
+                func=arm_plans_entering_window,
+                trigger="interval",
+                seconds=SCHEDULE_SWEEP_INTERVAL_SECONDS,
+                id="schedule_lookahead_sweep",
+                replace_existing=True,
+                coalesce=True,
+                max_instances=1,
+            )
+        except Exception as e:
+            logger.error("failed to add look-ahead sweep job: %s", e)
+
+    return _scheduler
+
+
+def arm_plans_entering_window() -> int:
+    """Schedule pending plans of the [-1d, +SCHEDULE_LOOKAHEAD_DAYS] window that have no notify_at yet.
+
+    Plans dated beyond the window when they were written get no job (see main._in_schedule_window);
+    this periodic sweep arms them as the window moves. Users who turned notifications off are skipped.
+    Works in keyset batches of RESCHEDULE_WRITE_BATCH plans; returns the number of scheduled plans.
+    """
+    if _scheduler is None:
+        return 0
+    now_utc = _utcnow()
+    start_date = (now_utc - timedelta(days=1)).date()
+    end_date = (now_utc + timedelta(days=SCHEDULE_LOOKAHEAD_DAYS)).date()
+    opted_out = exists().where(UserSettings.uid == PlanORM.user_id, UserSettings.notifications_enabled == False)
+    scheduled = scanned = 0
+    last_id = ""
+    try:
+        while True:
+            db = SessionLocal()
             try:
-                return dt.replace(tzinfo=timezone.utc)
-            except Exception:
-                return datetime.fromtimestamp(dt.timestamp(), tz=timezone.utc)
-        return dt.astimezone(timezone.utc)
+                batch = db.execute(select(PlanORM).where(
+                    PlanORM.notified == False,
+                    PlanORM.date.between(start_date, end_date),
+                    PlanORM.notify_at.is_(None),
+                    PlanORM.id > last_id,
+                    ~opted_out,
+                ).order_by(PlanORM.id).limit(RESCHEDULE_WRITE_BATCH)).scalars().all()
+                db.expunge_all()
+            finally:
+                db.close()
+            if not batch:
+                break
+            scanned += len(batch)
+            scheduled += schedule_notifications_for_plans(batch)
+            last_id = batch[-1].id
+    except Exception:
+        logger.exception("look-ahead sweep failed")
+    logger.info("look-ahead sweep: plans armed", extra={"scanned": scanned, "scheduled": scheduled})
+    return scheduled
 
-    # reschedule pending plans
+
+def reschedule_pending_plans() -> Optional[dict]:
+    """Re-add jobs for pending plans in the [-1d, +SCHEDULE_LOOKAHEAD_DAYS] window after a restart.
+
+    Runs after start_scheduler(); the API runs it on a background thread so startup does not
+    wait for the scan (see GET /api/ready). A persisted notify_at in the future gets its job back;
+    one missed by at most GRACE_WINDOW runs 5 seconds from now; an older one is not sent late, and
+    the plan is marked notified unless it has a later reminder. Future jobs that survived the restart
+    in the persistent job store are kept as they are. Returns the outcome counts.
+    """
+    if _scheduler is None:
+        return None
     try:
-        now_utc = datetime.now(timezone.utc)
+        now_utc = _utcnow()
         start_date = (now_utc - timedelta(days=1)).date()
-        end_date = (now_utc + timedelta(days=7)).date()
+        end_date = (now_utc + timedelta(days=SCHEDULE_LOOKAHEAD_DAYS)).date()
         db = SessionLocal()
         try:
             plans = db.execute(select(PlanORM).where(
                 PlanORM.notified == False,
                 PlanORM.date.between(start_date, end_date)
             )).scalars().all()
+            armed = _armed_plan_ids(_jobstore) if _jobstore is not None and DISPATCH_MODE != "sharded" else set()
+            rescheduled = recovered = expired = kept = 0
+            expired_ids = []
             for p in plans:
                 try:
-                    na = getattr(p, "notify_at", None)
-                    if na is not None:
-                        na_utc = _ensure_aware_utc(na)
-                        # persist normalized notify_at if it was naive
-                        if na.tzinfo is None:
-                            try:
-                                p.notify_at = na_utc
-                                db.add(p)
-                                db.commit()
-                            except Exception:
-                                db.rollback()
-
-                        # if notify_at is in the future, schedule directly
-                        try:
-                            if na_utc > now_utc:
-                                job_id = f"plan_{p.id}"
-                                _scheduler.add_job(
-                                    func=_dispatch_notification_job,
-                                    trigger="date",
-                                    run_date=na_utc,
-                                    id=job_id,
-                                    args=[p.id],
-                                    replace_existing=True,
-                                    misfire_grace_time=60,
-                                )
-                                print(f"[SCHEDULE] scheduled job {job_id} from persisted notify_at {na_utc.isoformat()}")
-                                continue
-                        except Exception:
-                            pass
-
-                    # if notify_at in past -> decide: run immediately if within grace, else mark notified
-                    if na is not None and na_utc <= now_utc:
+                    # notify_at is stored as naive UTC (see _as_naive_utc); it is only read here, never rewritten
+                    na_utc = _ensure_aware_utc(p.notify_at)
+                    if na_utc is not None and na_utc > now_utc:
+                        if p.id in armed:
+                            kept += 1
+                            continue
+                        if _add_plan_job(p.id, na_utc):
+                            logger.debug("reschedule: scheduled job from persisted notify_at", extra={"plan_id": p.id, "notify_at": na_utc.isoformat()})
+                            rescheduled += 1
+                            continue
+                    elif na_utc is not None:
+                        # missed while down: run immediately if within grace, else do not send it late
                         age = now_utc - na_utc
                         if age <= GRACE_WINDOW:
-                            immediate_run = now_utc + timedelta(seconds=5)
-                            job_id = f"plan_{p.id}"
-                            _scheduler.add_job(
-                                func=_dispatch_notification_job,
-                                trigger="date",
-                                run_date=immediate_run,
-                                id=job_id,
-                                args=[p.id],
-                                replace_existing=True,
-                                misfire_grace_time=3600,
-                            )
-                            print(f"[SCHEDULE-RECOVER] job {job_id} missed by {age}, scheduled immediate run at {immediate_run.isoformat()}")
-                            continue
+                            _add_plan_job(p.id, now_utc + timedelta(seconds=5), misfire_grace_time=3600)
+                            logger.debug("reschedule: missed job scheduled for immediate run", extra={"plan_id": p.id, "missed_by_seconds": age.total_seconds()})
+                            recovered += 1
                         else:
-                            p.notified = True
-                            db.add(p)
-                            db.commit()
-                            try:
-                                print(f"[SCHEDULE-RECOVER] plan {p.id} notify_at {na_utc.isoformat()} too old (age={age}), marking notified to avoid late send")
-                            except Exception:
-                                print(f"[SCHEDULE-RECOVER] plan {p.id} notify_at too old, marking notified to avoid late send")
-                            continue
+                            if schedule_notification_for_plan(p) is None:
+                                expired_ids.append(p.id)
+                                logger.debug("reschedule: notify_at too old, marking notified to avoid late send", extra={"plan_id": p.id, "missed_by_seconds": age.total_seconds()})
+                            expired += 1
+                        continue
 
                     # otherwise compute fresh schedule
                     schedule_notification_for_plan(p)
+                    rescheduled += 1
                 except Exception:
-                    import traceback
-                    traceback.print_exc()
+                    logger.exception("reschedule: failed for plan", extra={"plan_id": p.id})
+            # one UPDATE per batch instead of a commit per expired plan
+            for i in range(0, len(expired_ids), RESCHEDULE_WRITE_BATCH):
+                db.execute(update(PlanORM.__table__).where(PlanORM.id.in_(expired_ids[i:i + RESCHEDULE_WRITE_BATCH])).values(notified=True))
+            if expired_ids:
+                db.commit()
         finally:
             db.close()
+        counts = {"scanned": len(plans), "rescheduled": rescheduled, "recovered": recovered, "expired": expired, "kept": kept}
+        logger.info("reschedule: pending plans processed", extra=counts)
+        return counts
     except Exception:
-        import traceback
-        traceback.print_exc()
+        logger.exception("reschedule: unexpected error")
+        return None
 
-    return _scheduler
+
+
+def init_and_reschedule():
+    """Initialize scheduler and reschedule pending plans synchronously (scripts, benchmarks)."""
+    sched = start_scheduler()
+    reschedule_pending_plans()
+    return sched
 
 
 def shutdown():
-    global _scheduler
+    global _scheduler, _jobstore, _dispatcher, _dispatcher_thread, _dispatcher_stop
+    if _dispatcher_thread is not None:
+        # run_forever releases the dispatcher's leases when it returns
+        _dispatcher_stop.set()
+        _dispatcher_thread.join(timeout=DISPATCH_POLL_SECONDS + 5)
+    _dispatcher = _dispatcher_thread = _dispatcher_stop = None
     if _scheduler is not None:
         try:
             _scheduler.shutdown(wait=False)
-            print("[SCHEDULER] scheduler shutdown")
+            logger.info("scheduler shutdown")
         except Exception:
             pass
-    _scheduler = None
+    _scheduler = _jobstore = None
+    SCHEDULER_QUEUE_DEPTH.set_callback(None)
 
 
 def _reschedule_user_pending_plans_sync(uid: str, db: Optional[Session] = None):
@@ -288,7 +598,7 @@ def _reschedule_user_pending_plans_sync(uid: str, db: Optional[Session] = None):
         if db is None:
             db = SessionLocal()
             own_session = True
-        now_utc = datetime.now(timezone.utc)
+        now_utc = _utcnow()
         start_date = (now_utc - timedelta(days=1)).date()
         end_date = (now_utc + timedelta(days=30)).date()
         plans = db.execute(select(PlanORM).where(
@@ -303,14 +613,7 @@ def _reschedule_user_pending_plans_sync(uid: str, db: Optional[Session] = None):
             except Exception:
                 pass
             try:
-                user_zone = _get_user_zoneinfo(uid)
-                try:
-                    local_dt = datetime.combine(p.date, p.start_time).replace(tzinfo=user_zone)
-                    notify_dt_utc = local_dt.astimezone(timezone.utc)
-                except Exception:
-                    notify_dt_utc = datetime.combine(p.date, p.start_time).replace(tzinfo=timezone.utc)
-                if notify_dt_utc > now_utc:
-                    schedule_notification_for_plan(p)
+                schedule_notification_for_plan(p)
             except Exception:
                 pass
     finally:
@@ -319,3 +622,12 @@ def _reschedule_user_pending_plans_sync(uid: str, db: Optional[Session] = None):
                 db.close()
             except Exception:
                 pass
+
+
+def _on_session_timezone_expired(uid, tz_str):
+    """A session timezone ran out: move the user's pending jobs back to the stored timezone."""
+    logger.info("timezone: session timezone %r expired", tz_str, extra={"uid": uid})
+    threading.Thread(target=_reschedule_user_pending_plans_sync, args=(uid,), daemon=True).start()
+
+
+SESSION_TIMEZONES.on_expire = _on_session_timezone_expired
@@ -0,0 +1,250 @@
+import unicodedata
+from datetime import date as PyDate, time as PyTime
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import Column, Date, bindparam, MetaData, String, Table, Text, Time, delete, func, insert, or_, select, text, tuple_
+from sqlalchemy.orm import Session
+
+from flow7_core.models import PlanORM, PlanArchiveORM
+from flow7_core.log import get_logger
+
+logger = get_logger("search")
+
+# Full-text index over plan titles and descriptions (table plan_search, one row per plan; archived
+# plans stay indexed). SQLite uses an FTS5 table, Postgres a tsvector column with a GIN index, and
+# other databases fall back to LIKE over plans. Text is normalized here rather than by the database
+# so index and query see the same terms on every backend: case-folded, with accents stripped
+# (cafe finds café, istanbul finds İstanbul) except in Indic scripts, where combining vowel signs
+# are part of the word. Every query term matches as a prefix and all terms must match.
+
+# extra query terms beyond this are ignored
+MAX_QUERY_TERMS = 8
+# rows copied per batch when the index is first built over existing plans
+BACKFILL_BATCH_SIZE = 1000
+
+# combining marks after letters in these ranges are kept (Devanagari .. Sinhala)
+_KEEP_MARKS_RANGES = ((0x0900, 0x0DFF),)
+# letters without a canonical decomposition that users type without the accent
+_FOLD = {"ı": "i", "ß": "ss", "ø": "o", "đ": "d", "ł": "l", "æ": "ae", "œ": "oe"}
+
+_FTS5_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS plan_search USING fts5("
+    "plan_id, user_id, date UNINDEXED, start_time UNINDEXED, document, "
+    "tokenize = \"unicode61 remove_diacritics 0 categories 'L* N* Co M*'\", prefix = '2 3')"
+)
+_TSVECTOR_DDL = (
+    "CREATE TABLE IF NOT EXISTS plan_search ("
+    "plan_id VARCHAR PRIMARY KEY, user_id VARCHAR NOT NULL, date DATE NOT NULL, "
+    "start_time TIME NOT NULL, document TSVECTOR NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_plan_search_document ON plan_search USING gin (document)",
+    "CREATE INDEX IF NOT EXISTS ix_plan_search_user_date_start_id ON plan_search (user_id, date, start_time, plan_id)",
+)
+
+# date/start_time are copied from the plan so matches can be ordered and paged without joining plans;
+# built on first use, so the Postgres dialect (TSVECTOR) is not imported by SQLite deployments
+_tables = {}
+
+
+def _table(dialect: str) -> Table:
+    table = _tables.get(dialect)
+    if table is None:
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import TSVECTOR as document_type
+        else:
+            document_type = Text
+        table = _tables[dialect] = Table(
+            "plan_search", MetaData(),
+            Column("plan_id", String, primary_key=True),
+            Column("user_id", String, nullable=False),
+            Column("date", Date, nullable=False),
+            Column("start_time", Time, nullable=False),
+            Column("document", document_type, nullable=False),
+        )
+    return table
+
+
+def _keeps_marks(ch: str) -> bool:
+    cp = ord(ch)
+    return any(lo <= cp <= hi for lo, hi in _KEEP_MARKS_RANGES)
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    """Split `value` into normalized search terms: runs of letters and digits (with kept marks)."""
+    if not value:
+        return []
+    tokens, current, base = [], [], ""
+    for ch in unicodedata.normalize("NFKD", value.casefold()):
+        category = unicodedata.category(ch)[0]
+        if category == "M":
+            if current and _keeps_marks(base):
+                current.append(ch)
+        elif category in "LN":
+            base = ch
+            current.append(_FOLD.get(ch, ch))
+        elif current:
+            tokens.append("".join(current))
+            current = []
+    if current:
+        tokens.append("".join(current))
+    return [unicodedata.normalize("NFC", t) for t in tokens]
+
+
+def document_text(title: Optional[str], description: Optional[str]) -> str:
+    return " ".join(tokenize(title) + tokenize(description))
+
+
+def backend_for(dialect: str) -> str:
+    """fts5 (SQLite), tsvector (Postgres) or like (anything else, unindexed)."""
+    return {"sqlite": "fts5", "postgresql": "tsvector"}.get(dialect, "like")
+
+
+def _dialect(db: Session) -> str:
+    return db.get_bind().dialect.name
+
+
+def _fts_phrase(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _insert_statement(dialect: str):
+    table = _table(dialect)
+    document = bindparam("b_document")
+    if dialect == "postgresql":
+        document = func.to_tsvector("simple", document)
+    return insert(table).values(
+        plan_id=bindparam("b_plan_id"), user_id=bindparam("b_user_id"), date=bindparam("b_date", type_=Date),
+        start_time=bindparam("b_start_time", type_=Time), document=document,
+    )
+
+
+def unindex_plans(db: Session, plan_ids: Iterable[str]) -> None:
+    plan_ids = list(plan_ids)
+    dialect = _dialect(db)
+    backend = backend_for(dialect)
+    if not plan_ids or backend == "like":
+        return
+    if backend == "fts5":
+        # plan_id is an indexed FTS column: a phrase match finds the row without scanning the table,
+        # the equality keeps ids that only tokenize alike (case, punctuation) apart
+        for plan_id in plan_ids:
+            db.execute(
+                text("DELETE FROM plan_search WHERE rowid IN (SELECT rowid FROM plan_search WHERE plan_search MATCH :q AND plan_id = :plan_id)"),
+                {"q": "plan_id:" + _fts_phrase(plan_id), "plan_id": plan_id},
+            )
+    else:
+        table = _table(dialect)
+        db.execute(delete(table).where(table.c.plan_id.in_(plan_ids)))
+
+
+def index_plans(db: Session, plans: Iterable, new: bool = False) -> None:
+    """(Re)index plans in the caller's transaction; call after any change to title, description or date.
+
+    `new=True` skips removing previous rows (plans inserted in this transaction).
+    """
+    plans = list(plans)
+    dialect = _dialect(db)
+    if not plans or backend_for(dialect) == "like":
+        return
+    if not new:
+        unindex_plans(db, [p.id for p in plans])
+    _insert_rows(db, dialect, plans)
+
+
+def _insert_rows(db: Session, dialect: str, plans: list) -> None:
+    rows = [
+        {"b_plan_id": p.id, "b_user_id": p.user_id, "b_date": p.date, "b_start_time": p.start_time,
+         "b_document": document_text(p.title, p.description)}
+        for p in plans
+    ]
+    db.execute(_insert_statement(dialect), rows)
+
+
+def ensure_search_index(engine) -> bool:
+    """Create plan_search if missing and build it from existing plans. Returns True when it was built."""
+    dialect = engine.dialect.name
+    backend = backend_for(dialect)
+    if backend == "like":
+        return False
+    from sqlalchemy import inspect
+
+    if "plan_search" in inspect(engine).get_table_names():
+        return False
+    with engine.begin() as conn:
+        if backend == "fts5":
+            conn.exec_driver_sql(_FTS5_DDL)
+        else:
+            for ddl in _TSVECTOR_DDL:
+                conn.exec_driver_sql(ddl)
+
+    db = Session(bind=engine)
+    try:
+        total = 0
+        for model in (PlanORM, PlanArchiveORM):
+            stmt = select(model).execution_options(yield_per=BACKFILL_BATCH_SIZE)
+            batch = []
+            for plan in db.execute(stmt).scalars():
+                batch.append(plan)
+                if len(batch) >= BACKFILL_BATCH_SIZE:
+                    _insert_rows(db, dialect, batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                _insert_rows(db, dialect, batch)
+                total += len(batch)
+        db.commit()
+        logger.info("search index built over %d plans", total)
+    finally:
+        db.close()
+    return True
+
+
+def search_plan_ids(db: Session, uid: str, query: str, limit: int, before: Optional[Tuple[PyDate, PyTime, str]] = None) -> List[str]:
+    """Ids of `uid`'s plans matching every term of `query`, newest first (date, start_time, id).
+
+    `before` is a decoded cursor; only matches strictly before that position are returned.
+    """
+    terms = tokenize(query)[:MAX_QUERY_TERMS]
+    if not terms:
+        return []
+    dialect = _dialect(db)
+    backend = backend_for(dialect)
+    if backend == "like":
+        return _like_plan_ids(db, uid, terms, limit, before)
+
+    table = _table(dialect)
+    c = table.c
+    stmt = select(c.plan_id)
+    if backend == "fts5":
+        # the user_id term only narrows the match: unicode61 case-folds and splits ids on punctuation,
+        # so "ALICE" also matches alice's rows; ownership is the exact comparison
+        match = "user_id:" + _fts_phrase(uid) + " AND document:(" + " AND ".join(_fts_phrase(t) + "*" for t in terms) + ")"
+        stmt = stmt.where(text("plan_search MATCH :match").bindparams(match=match), c.user_id == uid)
+    else:
+        tsquery = " & ".join("'" + t.replace("'", "''") + "':*" for t in terms)
+        stmt = stmt.where(c.user_id == uid, c.document.op("@@")(func.to_tsquery("simple", tsquery)))
+    if before is not None:
+        stmt = stmt.where(tuple_(c.date, c.start_time, c.plan_id) < tuple_(*before))
+    stmt = stmt.order_by(c.date.desc(), c.start_time.desc(), c.plan_id.desc()).limit(limit)
+    return list(db.execute(stmt).scalars())
+
+
+def _like_plan_ids(db: Session, uid: str, terms: List[str], limit: int, before) -> List[str]:
+    clauses = [PlanORM.user_id == uid]
+    for term in terms:
+        pattern = f"%{term}%"
+        clauses.append(or_(PlanORM.title.ilike(pattern), PlanORM.description.ilike(pattern)))
+    if before is not None:
+        clauses.append(tuple_(PlanORM.date, PlanORM.start_time, PlanORM.id) < tuple_(*before))
+    stmt = select(PlanORM.id).where(*clauses).order_by(PlanORM.date.desc(), PlanORM.start_time.desc(), PlanORM.id.desc()).limit(limit)
+    return list(db.execute(stmt).scalars())
+
+
+def load_plans(db: Session, plan_ids: List[str]) -> list:
+    """Plans (live or archived) for `plan_ids`, in the given order."""
+    if not plan_ids:
+        return []
+    found = {p.id: p for p in db.execute(select(PlanORM).where(PlanORM.id.in_(plan_ids))).scalars()}
+    missing = [i for i in plan_ids if i not in found]
+    if missing:
+        found.update({p.id: p for p in db.execute(select(PlanArchiveORM).where(PlanArchiveORM.id.in_(missing))).scalars()})
+    return [found[i] for i in plan_ids if i in found]
@@ -1,3 +1,147 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional
+
+from flow7_core.config import STATE_MAX_ENTRIES, USER_FALLBACK_TTL_SECONDS
+from flow7_core.metrics import STATE_ENTRIES, STATE_EVICTIONS
+
+_MISSING = object()
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "seq")
+
+    def __init__(self, value, expires_at: Optional[float], seq: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.seq = seq
+
+
+class BoundedTTLStore:
+    """Thread-safe in-memory map with an entry cap (LRU eviction) and per-entry TTLs.
+
+    Expiry is driven by a heap of (expires_at, seq, key): every access first pops entries whose
+    time has come, so the cost is proportional to what actually expired. Re-setting a key leaves
+    its old heap item behind; such items are recognised by their stale seq and skipped.
+    `on_expire(key, value)` runs (outside the lock) for entries removed because their TTL ran out.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl: Optional[float] = None,
+                 on_expire: Optional[Callable[[Hashable, Any], None]] = None, clock=time.monotonic):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_expire = on_expire
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._lock = threading.RLock()
+        _STORES.append(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def _pop_expired(self, now: float) -> list:
+        expired = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, seq, key = heapq.heappop(heap)
+            entry = self._entries.get(key)
+            if entry is not None and entry.seq == seq:
+                del self._entries[key]
+                expired.append((key, entry.value))
+        if expired:
+            STATE_EVICTIONS.inc(len(expired), store=self.name, reason="expired")
+        return expired
+
+    def _notify(self, expired: list) -> None:
+        STATE_ENTRIES.set(len(self._entries), store=self.name)
+        if self.on_expire is None:
+            return
+        for key, value in expired:
+            try:
+                self.on_expire(key, value)
+            except Exception:
+                pass
+
+    def get(self, key, default=None):
+        with self._lock:
+            expired = self._pop_expired(self.clock())
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if expired:
+            self._notify(expired)
+        return default if entry is None else entry.value
+
+    def set(self, key, value, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            now = self.clock()
+            expired = self._pop_expired(now)
+            seq = next(self._seq)
+            expires_at = now + ttl if ttl is not None else None
+            self._entries[key] = _Entry(value, expires_at, seq)
+            self._entries.move_to_end(key)
+            if expires_at is not None:
+                heapq.heappush(self._heap, (expires_at, seq, key))
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            if evicted:
+                STATE_EVICTIONS.inc(evicted, store=self.name, reason="lru")
+            # drop stale heap items once they outnumber live entries
+            if len(self._heap) > 2 * len(self._entries) + 64:
+                self._heap = [(e.expires_at, e.seq, k) for k, e in self._entries.items() if e.expires_at is not None]
+                heapq.heapify(self._heap)
+        self._notify(expired)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        STATE_ENTRIES.set(len(self._entries), store=self.name)
+        return default if entry is None else entry.value
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            expired = self._pop_expired(self.clock())
+        self._notify(expired)
+        return len(expired)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._heap = []
+        STATE_ENTRIES.set(0, store=self.name)
+
+
+_STORES: List[BoundedTTLStore] = []
+
+
+def purge_expired_state() -> int:
+    """Expire due entries of every store (periodic scheduler job, so expiry does not wait for traffic)."""
+    return sum(store.purge_expired() for store in list(_STORES))
+
+
 # Shared ephemeral in-memory state (fallbacks)
-USER_SUBSCRIPTIONS = {}
-SESSION_TIMEZONES = {}  # uid -> (timezone_str, expiry_ts)
+# uid -> settings-like dict used when the DB has no row yet; the DB stays the source of truth
+USER_SUBSCRIPTIONS = BoundedTTLStore("user_subscriptions", STATE_MAX_ENTRIES, ttl=USER_FALLBACK_TTL_SECONDS)
+# uid -> IANA timezone set with PUT /user/timezone/ persist=false; each entry expires after its ttl_hours
+SESSION_TIMEZONES = BoundedTTLStore("session_timezones", STATE_MAX_ENTRIES)
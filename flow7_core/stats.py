@@ -0,0 +1,163 @@
+from collections import defaultdict
+from datetime import date as PyDate, time as PyTime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from flow7_core.models import PlanORM, PlanArchiveORM, PlanDailyStats, PlanHourlyStats
+from flow7_core.log import get_logger
+
+logger = get_logger("stats")
+
+# Planning statistics kept as aggregates: plan_daily_stats (count, minutes per day) and
+# plan_hourly_stats (minutes per day and hour). Plan writes apply signed deltas with
+# INSERT .. ON CONFLICT DO UPDATE SET x = x + delta in their own transaction, so concurrent
+# writes never lose updates and reads cost O(days in range), independent of the number of plans.
+
+# plans are streamed in batches of this size when the aggregates are first built
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _minute(t: PyTime) -> int:
+    return t.hour * 60 + t.minute
+
+
+def plan_minutes_by_hour(start_time: PyTime, end_time: Optional[PyTime]) -> Dict[int, int]:
+    """{hour: minutes of [start_time, end_time) inside that hour}; plans without an end count 0 minutes."""
+    if end_time is None:
+        return {}
+    start, end = _minute(start_time), _minute(end_time)
+    hours = {}
+    for hour in range(start // 60, (end + 59) // 60):
+        minutes = min(end, (hour + 1) * 60) - max(start, hour * 60)
+        if minutes > 0:
+            hours[hour] = minutes
+    return hours
+
+
+class StatsDelta:
+    """Accumulates signed per-day and per-hour changes of one transaction before they are written."""
+
+    def __init__(self):
+        self.days: Dict[PyDate, list] = defaultdict(lambda: [0, 0])
+        self.hours: Dict[Tuple[PyDate, int], int] = defaultdict(int)
+
+    def add(self, day: PyDate, start_time: PyTime, end_time: Optional[PyTime], sign: int = 1) -> "StatsDelta":
+        by_hour = plan_minutes_by_hour(start_time, end_time)
+        entry = self.days[day]
+        entry[0] += sign
+        entry[1] += sign * sum(by_hour.values())
+        for hour, minutes in by_hour.items():
+            self.hours[(day, hour)] += sign * minutes
+        return self
+
+    def add_plan(self, plan, sign: int = 1) -> "StatsDelta":
+        return self.add(plan.date, plan.start_time, plan.end_time, sign)
+
+
+def _upsert(db: Session, model, key_columns, rows: list, value_columns) -> None:
+    """Add `rows`' values onto existing rows of `model` (creating missing ones)."""
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[getattr(model, c) for c in key_columns],
+            set_={c: getattr(model, c) + getattr(stmt.excluded, c) for c in value_columns},
+        )
+        db.execute(stmt, rows)
+        return
+    # generic fallback: read-modify-write under the caller's transaction
+    for values in rows:
+        row = db.get(model, tuple(values[c] for c in key_columns))
+        if row is None:
+            db.add(model(**values))
+        else:
+            for c in value_columns:
+                setattr(row, c, getattr(row, c) + values[c])
+
+
+def apply_delta(db: Session, uid: str, delta: StatsDelta) -> None:
+    """Write `delta` for `uid` inside the caller's transaction (before its commit)."""
+    days = [
+        {"user_id": uid, "date": d, "plan_count": count, "planned_minutes": minutes}
+        for d, (count, minutes) in delta.days.items() if count or minutes
+    ]
+    hours = [
+        {"user_id": uid, "date": d, "hour": h, "planned_minutes": minutes}
+        for (d, h), minutes in delta.hours.items() if minutes
+    ]
+    _upsert(db, PlanDailyStats, ("user_id", "date"), days, ("plan_count", "planned_minutes"))
+    _upsert(db, PlanHourlyStats, ("user_id", "date", "hour"), hours, ("planned_minutes",))
+
+
+def backfill_stats(engine) -> int:
+    """Build the aggregates from all existing plans (live and archived); run once when the tables are new.
+
+    Plans are streamed in (user_id, date) order, so at most one user's deltas are held at a time.
+    """
+    db = Session(bind=engine)
+    total = 0
+    try:
+        for model in (PlanORM, PlanArchiveORM):
+            stmt = (select(model.user_id, model.date, model.start_time, model.end_time)
+                    .order_by(model.user_id, model.date)
+                    .execution_options(yield_per=BACKFILL_BATCH_SIZE))
+            uid, delta = None, StatsDelta()
+            for row_uid, day, start_time, end_time in db.execute(stmt):
+                if row_uid != uid:
+                    if uid is not None:
+                        apply_delta(db, uid, delta)
+                    uid, delta = row_uid, StatsDelta()
+                delta.add(day, start_time, end_time)
+                total += 1
+            if uid is not None:
+                apply_delta(db, uid, delta)
+        db.commit()
+        logger.info("plan statistics built over %d plans", total)
+    finally:
+        db.close()
+    return total
+
+
+def _hours(minutes: int) -> float:
+    return round(minutes / 60.0, 2)
+
+
+def _week_start(day: PyDate) -> PyDate:
+    return day - timedelta(days=day.weekday())
+
+
+def range_stats(db: Session, uid: str, start_date: PyDate, end_date: PyDate, top_slots: int = 5) -> dict:
+    """Per-day and per-week totals plus the busiest (weekday, hour) slots of a date range."""
+    days = db.execute(select(PlanDailyStats.date, PlanDailyStats.plan_count, PlanDailyStats.planned_minutes).where(
+        PlanDailyStats.user_id == uid,
+        PlanDailyStats.date.between(start_date, end_date),
+    ).order_by(PlanDailyStats.date)).all()
+    weeks: Dict[PyDate, list] = {}
+    for day, count, minutes in days:
+        entry = weeks.setdefault(_week_start(day), [0, 0])
+        entry[0] += count
+        entry[1] += minutes
+
+    slots: Dict[Tuple[int, int], int] = defaultdict(int)
+    for day, hour, minutes in db.execute(select(PlanHourlyStats.date, PlanHourlyStats.hour, PlanHourlyStats.planned_minutes).where(
+        PlanHourlyStats.user_id == uid,
+        PlanHourlyStats.date.between(start_date, end_date),
+    )):
+        slots[(day.weekday(), hour)] += minutes
+    busiest = sorted(((m, k) for k, m in slots.items() if m > 0), key=lambda item: (-item[0], item[1]))[:top_slots]
+
+    return {
+        "plan_count": sum(c for _, c, _ in days),
+        "planned_hours": _hours(sum(m for _, _, m in days)),
+        "days": [{"date": d, "plan_count": c, "planned_hours": _hours(m)} for d, c, m in days if c or m],
+        "weeks": [{"week_start": w, "plan_count": c, "planned_hours": _hours(m)} for w, (c, m) in sorted(weeks.items()) if c or m],
+        "busiest_slots": [{"weekday": wd, "hour": h, "planned_hours": _hours(m)} for m, (wd, h) in busiest],
+    }
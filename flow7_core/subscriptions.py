@@ -0,0 +1,51 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import select, update
+
+from flow7_core.config import SUBSCRIPTION_SWEEP_BATCH_SIZE
+from flow7_core.db import SessionLocal
+from flow7_core.models import UserSettings
+from flow7_core.auth import invalidate_user_context
+from flow7_core.log import get_logger
+
+logger = get_logger("subscriptions")
+
+
+def sweep_expired_subscriptions(now: Optional[datetime] = None) -> int:
+    """Downgrade every paid subscription whose expiry has passed to FREE, in batches.
+
+    Runs periodically from the scheduler so request handlers can trust `subscription_level`
+    without comparing `subscription_expires_at` themselves. Uses the index on
+    subscription_expires_at; returns the number of downgraded users.
+    """
+    # expiry timestamps are stored as naive UTC
+    now = (now or datetime.now(timezone.utc)).astimezone(timezone.utc).replace(tzinfo=None)
+    total = 0
+    db = SessionLocal()
+    try:
+        while True:
+            uids = db.execute(select(UserSettings.uid).where(
+                UserSettings.subscription_expires_at <= now,
+                UserSettings.subscription_level != "FREE",
+            ).limit(SUBSCRIPTION_SWEEP_BATCH_SIZE)).scalars().all()
+            if not uids:
+                break
+            db.execute(update(UserSettings).where(
+                UserSettings.uid.in_(uids),
+                UserSettings.subscription_level != "FREE",
+            ).values(subscription_level="FREE", updated_at=now).execution_options(synchronize_session=False))
+            db.commit()
+            for uid in uids:
+                invalidate_user_context(uid)
+            total += len(uids)
+            if len(uids) < SUBSCRIPTION_SWEEP_BATCH_SIZE:
+                break
+    except Exception:
+        db.rollback()
+        logger.exception("subscription sweep failed")
+    finally:
+        db.close()
+    if total:
+        logger.info("subscription sweep: downgraded expired subscriptions", extra={"downgraded": total})
+    return total
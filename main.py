@@ -5,16 +5,14 @@ from uuid import uuid4
 import base64
 import json
 
-import uvicorn
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Depends, Security, Request
-import logging
-
-# proper module logger (use Python logging, not fastapi.logger which lacks .exception)
-logger = logging.getLogger(__name__)
+from fastapi import FastAPI, HTTPException, Depends, Security, Request, Response, Query, Header
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, validator
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, ValidationError, validator
 from sqlalchemy import (
     create_engine,
     Column,
@@ -32,37 +30,45 @@ from sqlalchemy.orm import declarative_base, sessionmaker, Session
 from zoneinfo import ZoneInfo
 import time
 import threading
-# Scheduler (APScheduler) for persistent per-plan jobs
-APScheduler_AVAILABLE = False
+import tempfile
+# Optional brotli support (pip install brotli-asgi); falls back to gzip-only compression
+BROTLI_AVAILABLE = False
 try:
-    from apscheduler.schedulers.background import BackgroundScheduler
-    from apscheduler.schedulers.blocking import BlockingScheduler
-    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
-    APScheduler_AVAILABLE = True
+    from brotli_asgi import BrotliMiddleware
+    BROTLI_AVAILABLE = True
 except Exception:
-    APScheduler_AVAILABLE = False
-# Firebase / firebase_admin initialization is handled in flow7_core.config
+    BROTLI_AVAILABLE = False
+# Firebase / firebase_admin is initialized lazily by flow7_core.config.init_firebase()
 
 # --- Modularized config, DB and models ---
-from flow7_core.config import DATABASE_URL, FIREBASE_ADMIN_AVAILABLE, FIREBASE_CHECK_REVOKED
-from flow7_core.db import engine, SessionLocal, Base, get_db
-from flow7_core.models import PlanORM, UserSettings, DeviceToken
+from flow7_core.config import DATABASE_URL, init_firebase, firebase_available, FIREBASE_CHECK_REVOKED, COMPRESSION_MINIMUM_SIZE, COMPRESSION_LEVEL, SUBSCRIPTION_LIMITS_IN_DAYS, SCHEDULE_LOOKAHEAD_DAYS, DISPATCH_MODE, EVENTS_MAX_STREAMS_PER_USER, ICS_IMPORT_MAX_BYTES, ICS_IMPORT_SPOOL_BYTES, ICS_IMPORT_CHUNK_SIZE
+from flow7_core.db import engine, SessionLocal, Base, get_db, read_session_for, init_db
+from flow7_core.models import PlanORM, PlanArchiveORM, UserSettings, DeviceToken
 from flow7_core.auth import get_current_user, token_auth_scheme
-from flow7_core.state import USER_SUBSCRIPTIONS
+from flow7_core.state import USER_SUBSCRIPTIONS, SESSION_TIMEZONES
+from flow7_core.log import get_logger
+
+# proper module logger (queue-backed "flow7" logger tree; see flow7_core.log)
+logger = get_logger("api")
 
 # bring helpers from modularized modules
 from flow7_core.notifications import get_time_obj_from_str, time_to_str, send_notification_to_user, _get_user_zoneinfo
-from flow7_core.scheduler import schedule_notification_for_plan, cancel_scheduled_plan, init_and_reschedule, shutdown, _reschedule_user_pending_plans_sync
-
-# Ensure DB tables exist (models imported above)
-Base.metadata.create_all(bind=engine)
+from flow7_core.scheduler import schedule_notification_for_plan, schedule_notifications_for_plans, cancel_scheduled_plan, start_scheduler, reschedule_pending_plans, shutdown, _reschedule_user_pending_plans_sync
+from flow7_core import metrics
+from flow7_core.idempotency import idempotent
+from flow7_core.devices import register_device_token
+from flow7_core.ratelimit import enforce_rate_limit, check_rate_limit
+from flow7_core.caching import make_etag, is_not_modified, set_validators, not_modified_response
+from flow7_core.occupancy import refresh_days, lock_days, plan_bitmaps, plan_mask, load_range, free_windows, MINUTES_PER_DAY
+from flow7_core.events import get_broker, queue_plan_event, sse_stream
+from flow7_core.bulkcopy import SUPPORTED_DIALECTS as COPY_DIALECTS, source_bounds, find_conflicts, insert_copies, load_copies
+from flow7_core.ical import IcsError, iter_events, event_fields, stream_ics
+from flow7_core.search import index_plans, unindex_plans, search_plan_ids, load_plans
+from flow7_core.stats import StatsDelta, apply_delta, range_stats
+from flow7_core.reminders import REMINDER_SLOTS, mask_from_names, names_from_mask
+from flow7_core.export import encode_cursor, decode_cursor, plans_range_query, plans_range_stats, iter_plans, stream_ndjson, stream_csv
+from flow7_core.retention import restore_plan
 
-# Lazy import firebase messaging/auth symbols if firebase_admin is installed/configured
-try:
-    from firebase_admin import messaging, auth
-except Exception:
-    messaging = None
-    auth = None
 
 
 # --- 3. PYDANTIC SCHEMAS (DATA TRANSFER OBJECTS) ---
@@ -70,6 +76,19 @@ except Exception:
 
 TIME_PATTERN = r"^\d{2}:\d{2}$" # HH:MM formatı için regex
 
+def _validate_reminder_names(names: Optional[List[str]]) -> Optional[List[str]]:
+    if names is not None:
+        try:
+            mask_from_names(names)
+        except ValueError:
+            raise ValueError("Geçersiz hatırlatıcı. Geçerli değerler: " + ", ".join(name for name, _, _ in REMINDER_SLOTS))
+    return names
+
+
+def _reminder_mask(names: Optional[List[str]]) -> Optional[int]:
+    return None if names is None else mask_from_names(names)
+
+
 class PlanBase(BaseModel):
     """Planlar için temel şema. Ortak alanları içerir."""
     date: PyDate
@@ -77,6 +96,12 @@ class PlanBase(BaseModel):
     end_time: str = Field(..., pattern=TIME_PATTERN, description="HH:MM formatında bitiş zamanı")
     title: str = Field(..., min_length=1, max_length=100)
     description: Optional[str] = Field(None, max_length=500)
+    reminders: Optional[List[str]] = Field(None, max_items=len(REMINDER_SLOTS), description="Hatırlatıcılar (örn. start-10m, start, end); boş bırakılırsa kullanıcının varsayılanı")
+
+    @validator("reminders")
+    def reminders_must_be_known(cls, v):
+        """Hatırlatıcı adlarının REMINDER_SLOTS içinde olduğunu doğrular."""
+        return _validate_reminder_names(v)
 
     @validator("end_time")
     def end_time_must_be_after_start_time(cls, v, values, **kwargs):
@@ -101,6 +126,14 @@ class PlanOut(PlanBase):
     class Config:
         orm_mode = True
 
+class PlanCopy(BaseModel):
+    """Bir tarih aralığındaki planları `offset_days` kaydırarak `repeat` kez kopyalama isteği."""
+    source_start_date: PyDate
+    source_end_date: PyDate
+    offset_days: int = Field(..., ge=-366, le=366, description="Her kopyanın bir öncekine göre kaydırılacağı gün sayısı (örn. haftalık için 7)")
+    repeat: int = Field(1, ge=1, le=12, description="Kaç kopya oluşturulacağı")
+    on_conflict: str = Field("skip", pattern=r"^(skip|abort)$", description="skip: çakışan kopyaları atla; abort: çakışma varsa hiçbir şey ekleme")
+
 # Yeni: subscription güncelleme için Pydantic şeması
 class SubscriptionUpdate(BaseModel):
     level: str
@@ -125,8 +158,23 @@ class User(BaseModel):
 
 # get_current_user and get_db are provided by flow7_core modules (imported above)
 
-# Abonelik limitleri
-SUBSCRIPTION_LIMITS_IN_DAYS = {"FREE": 14, "PRO": 60, "ULTRA": 365}
+# Abonelik limitleri (flow7_core.config; rate limiter da aynı tabloyla ölçeklenir)
+
+def get_rate_limited_user(current_user: User = Depends(get_current_user)):
+    """Kimliği doğrulanmış kullanıcıyı döner; uid başına token-bucket limiti aşıldıysa 429 + Retry-After."""
+    enforce_rate_limit(current_user.uid, current_user.subscription)
+    return current_user
+
+
+def get_read_db(current_user: User = Depends(get_rate_limited_user)):
+    """Salt-okunur endpoint'ler için oturum: replica tanımlıysa oradan, kullanıcı yakın zamanda
+    yazdıysa (REPLICA_STICKY_SECONDS) kendi yazdığını görsün diye primary'den okur."""
+    db = read_session_for(current_user.uid)
+    try:
+        yield db
+    finally:
+        db.close()
+
 
 def check_planning_date_limit(user: User, target_date: PyDate):
     """Kullanıcının abonelik seviyesine göre planlama yapabileceği son tarihi kontrol eder."""
@@ -151,12 +199,64 @@ def plan_to_out(plan: PlanORM) -> dict:
         "title": plan.title,
         "description": plan.description or "",
         "notified": bool(getattr(plan, "notified", False)),
+        "reminders": names_from_mask(plan.reminder_mask) if getattr(plan, "reminder_mask", None) is not None else None,
     }
 
 
 # _get_user_zoneinfo is implemented in flow7_core.notifications and imported at module top
 
 
+def _in_schedule_window(day: PyDate, today: PyDate) -> bool:
+    """Bildirim işleri dünden SCHEDULE_LOOKAHEAD_DAYS gün sonrasına kadarki planlar için tutulur (saat dilimi payı dahil).
+    Sharded dağıtımda iş yoktur, yalnızca notify_at yazılır; bu yüzden ileri tarihli planlar da hemen zamanlanır."""
+    if day < today - timedelta(days=1):
+        return False
+    return DISPATCH_MODE == "sharded" or day <= today + timedelta(days=SCHEDULE_LOOKAHEAD_DAYS)
+
+
+def _schedule_if_due(plan: PlanORM):
+    """Plan zamanlama penceresindeyse bildirim işini bir sonraki hatırlatıcısına kurar (geçmişte kalanlar atlanır)."""
+    try:
+        if _in_schedule_window(plan.date, datetime.now(timezone.utc).date()) and _user_notifications_enabled(plan.user_id):
+            schedule_notification_for_plan(plan)
+    except Exception:
+        logger.exception("Error scheduling plan %s", plan.id)
+
+
+# --- Plan yazma kancaları: türetilmiş veriler planla aynı transaction içinde güncellenir ---
+def _on_plan_created(db: Session, plan: PlanORM):
+    refresh_days(db, plan.user_id, {plan.date})
+    index_plans(db, [plan], new=True)
+    apply_delta(db, plan.user_id, StatsDelta().add_plan(plan))
+    queue_plan_event(db, plan.user_id, "plan.created", plan_to_out(plan))
+
+
+def _on_plans_created(db: Session, uid: str, plans: List[PlanORM], kind: str):
+    """Toplu ekleme (ICS içe aktarma, kopyalama): her plan için ayrı olay yerine tek `kind` olayı."""
+    days = {p.date for p in plans}
+    refresh_days(db, uid, days)
+    index_plans(db, plans, new=True)
+    delta = StatsDelta()
+    for p in plans:
+        delta.add_plan(p)
+    apply_delta(db, uid, delta)
+    queue_plan_event(db, uid, kind, {"count": len(plans), "start_date": min(days).isoformat(), "end_date": max(days).isoformat()})
+
+
+def _on_plan_updated(db: Session, plan: PlanORM, old_date: PyDate, old_start: PyTime, old_end: Optional[PyTime]):
+    refresh_days(db, plan.user_id, {old_date, plan.date})
+    index_plans(db, [plan])
+    apply_delta(db, plan.user_id, StatsDelta().add(old_date, old_start, old_end, -1).add_plan(plan))
+    queue_plan_event(db, plan.user_id, "plan.updated", plan_to_out(plan))
+
+
+def _on_plan_deleted(db: Session, plan: PlanORM):
+    refresh_days(db, plan.user_id, {plan.date})
+    unindex_plans(db, [plan.id])
+    apply_delta(db, plan.user_id, StatsDelta().add_plan(plan, -1))
+    queue_plan_event(db, plan.user_id, "plan.deleted", {"id": plan.id, "date": plan.date.isoformat()})
+
+
 # --- 6. API ENDPOINTS (ROUTING) ---
 app = FastAPI(
     title="Flow7 API",
@@ -171,28 +271,74 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],                # GET, POST, PUT, DELETE, OPTIONS vb.
     allow_headers=["*"],                # Authorization dahil tüm başlıklara izin
+    expose_headers=["ETag", "Last-Modified", "X-Next-Cursor", "Idempotent-Replayed"],
 )
 
+# --- Sıkıştırma: Accept-Encoding'e göre brotli (kuruluysa) veya gzip; küçük yanıtlar sıkıştırılmaz ---
+if BROTLI_AVAILABLE:
+    # SSE akışı sıkıştırılmaz (sıkıştırıcı olayları tamponlar); GZipMiddleware text/event-stream'i zaten atlar
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE, gzip_fallback=True, excluded_handlers=["/api/plans/events"])
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE, compresslevel=COMPRESSION_LEVEL)
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """İstek süresini route şablonu (/api/plans/{plan_id}) bazında ölçer; ham path kullanılmaz."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", None) or "unmatched"
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - start, method=request.method, route=route_path)
+        metrics.HTTP_REQUESTS.inc(method=request.method, route=route_path, status=status)
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus metin formatında API, DB ve scheduler metrikleri."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.get("/api/status", tags=["General"])
 def get_api_status():
     """API'nin sağlık durumunu kontrol eder."""
     return {"status": "ok", "version": "2.0.0", "timestamp": datetime.now(timezone.utc)}
 
+@app.get("/api/ready", tags=["General"])
+def get_api_readiness(response: Response):
+    """
+    Hazır olma kontrolü: şema ve scheduler hazır, bekleyen planlar yeniden zamanlanmışsa 200, aksi halde 503.
+    (/api/status yalnızca sürecin ayakta olduğunu söyler.)
+    """
+    ready = _startup_state["schema"] and _startup_state["scheduler"] and _startup_state["rescheduled"]
+    if not ready:
+        response.status_code = 503
+    return {"ready": ready, **_startup_state}
+
 @app.post("/api/plans", response_model=PlanOut, status_code=201, tags=["Plans"])
+@idempotent(status_code=201, response_model=PlanOut)
 def create_plan(
     plan_data: PlanCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_rate_limited_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
 ):
     """
     Yeni bir kullanıcı planı oluşturur.
+    `Idempotency-Key` başlığı ile tekrarlanan istekler saklanan yanıtı döner (çakışma sorgusu,
+    insert ve zamanlama yeniden çalıştırılmaz).
     """
     check_planning_date_limit(current_user, plan_data.date)
 
     start_time_obj = get_time_obj_from_str(plan_data.start_time)
     end_time_obj = get_time_obj_from_str(plan_data.end_time)
 
-    # Çakışma kontrolü
+    # Çakışma kontrolü: günün doluluk satırı kilitlenir, aynı güne eşzamanlı yazan istek bu planı görür
+    lock_days(db, current_user.uid, {plan_data.date})
     existing_plan = db.execute(select(PlanORM).where(
         PlanORM.user_id == current_user.uid,
         PlanORM.date == plan_data.date,
@@ -220,61 +366,416 @@ def create_plan(
         title=plan_data.title,
         description=plan_data.description,
         notified=False,
+        reminder_mask=_reminder_mask(plan_data.reminders),
+        notified_mask=0,
     )
     db.add(new_plan)
+    _on_plan_created(db, new_plan)
     db.commit()
     db.refresh(new_plan)
 
-    # Schedule if the plan is for today and its start_time is still in the future
-    try:
-        now = datetime.now(timezone.utc)
-        if new_plan.date == now.date():
-            # compute notify datetime using user's timezone
-            user_zone = _get_user_zoneinfo(new_plan.user_id)
-            try:
-                local_dt = datetime.combine(new_plan.date, new_plan.start_time).replace(tzinfo=user_zone)
-                notify_dt = local_dt.astimezone(timezone.utc)
-            except Exception:
-                notify_dt = datetime.combine(new_plan.date, new_plan.start_time).replace(tzinfo=timezone.utc)
-            if notify_dt > now and _user_notifications_enabled(new_plan.user_id):
-                schedule_notification_for_plan(new_plan)
-    except Exception:
-        logger.exception("Error scheduling newly created plan %s", new_plan.id)
-
+    _schedule_if_due(new_plan)
     return plan_to_out(new_plan)
 
 
+# Sayfalı listelemede tek sayfada dönebilecek en fazla plan sayısı
+PLAN_PAGE_MAX = 500
+
+
 @app.get("/api/plans", response_model=List[PlanOut], tags=["Plans"])
 def get_user_plans_by_date_range(
     start_date: PyDate,
     end_date: PyDate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=PLAN_PAGE_MAX),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_rate_limited_user),
 ):
-    """Belirtilen tarih aralığındaki tüm kullanıcı planlarını listeler."""
+    """
+    Belirtilen tarih aralığındaki kullanıcı planlarını listeler (replica tanımlıysa oradan okunur).
+    `limit` verilirse (date, start_time, id) üzerinden keyset sayfalama yapılır; sonraki sayfa
+    varsa imleci `X-Next-Cursor` başlığında döner ve bir sonraki istekte `cursor` olarak gönderilir.
+    """
     if start_date > end_date:
         raise HTTPException(status_code=400, detail="Başlangıç tarihi, bitiş tarihinden sonra olamaz.")
 
-    plans = db.execute(select(PlanORM).where(
-        PlanORM.user_id == current_user.uid,
-        PlanORM.date.between(start_date, end_date)
-    ).order_by(PlanORM.date, PlanORM.start_time)).scalars().all()
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Geçersiz sayfalama imleci.")
+
+    # Koşullu GET: aralıktaki satır sayısı + en son updated_at değişmediyse satırları hiç yüklemeden 304 dön.
+    # (Silme sadece sayıyı değiştirdiği için If-Modified-Since burada güvenilir değil; yalnız ETag kullanılır.)
+    count, last_modified = db.execute(plans_range_stats(current_user.uid, start_date, end_date)).one()
+    etag = make_etag("plans", current_user.uid, start_date, end_date, limit, cursor, count, last_modified)
+    if is_not_modified(request, etag, last_modified, use_modified_since=False):
+        return not_modified_response(etag, last_modified)
+    set_validators(response, etag, last_modified)
+
+    stmt = plans_range_query(current_user.uid, start_date, end_date, after=after)
+    if limit is None:
+        plans = db.execute(stmt).scalars().all()
+    else:
+        plans = db.execute(stmt.limit(limit + 1)).scalars().all()
+        if len(plans) > limit:
+            plans = plans[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor(plans[-1])
 
     return [plan_to_out(p) for p in plans]
 
 
+# Boş zaman aramasında tek istekte taranabilecek en fazla gün
+FREE_SLOTS_MAX_DAYS = 366
+
+
+def _minute_to_str(minute: int) -> str:
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def _str_to_minute(value: str) -> int:
+    """"HH:MM" -> gün içindeki dakika; gün sonu için "24:00" kabul edilir."""
+    hours, minutes = (int(p) for p in value.split(":"))
+    minute = hours * 60 + minutes
+    if minutes > 59 or minute > MINUTES_PER_DAY:
+        raise HTTPException(status_code=400, detail=f"Geçersiz saat: {value}")
+    return minute
+
+
+@app.get("/api/plans/free-slots", tags=["Plans"])
+def find_free_slots(
+    start_date: PyDate,
+    end_date: PyDate,
+    duration: int = Query(..., ge=1, le=MINUTES_PER_DAY, description="Dakika cinsinden gereken boş süre"),
+    earliest: str = Query("00:00", pattern=TIME_PATTERN, description="Günlük arama penceresinin başı (HH:MM)"),
+    latest: Optional[str] = Query(None, pattern=TIME_PATTERN, description="Günlük arama penceresinin sonu (HH:MM, varsayılan gün sonu)"),
+    limit: int = Query(20, ge=1, le=PLAN_PAGE_MAX),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_rate_limited_user),
+):
+    """
+    Tarih aralığında en az `duration` dakika süren boş zaman pencerelerini döner.
+    Günlük dakika çözünürlüklü doluluk bitmap'leri üzerinde bit işlemleriyle hesaplanır; planlar yüklenmez.
+    Gün sonuna uzanan pencerenin bitişi "24:00" olarak döner.
+    """
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="Başlangıç tarihi, bitiş tarihinden sonra olamaz.")
+    if (end_date - start_date).days >= FREE_SLOTS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"En fazla {FREE_SLOTS_MAX_DAYS} günlük aralık sorgulanabilir.")
+    window_start = _str_to_minute(earliest)
+    window_end = _str_to_minute(latest) if latest else MINUTES_PER_DAY
+    if window_end <= window_start:
+        raise HTTPException(status_code=400, detail="Arama penceresinin sonu başından sonra olmalıdır.")
+
+    bitmaps = load_range(db, current_user.uid, start_date, end_date)
+    slots = []
+    for day in sorted(bitmaps):
+        for s, e in free_windows(bitmaps[day], duration, window_start, window_end):
+            slots.append({"date": day.isoformat(), "start_time": _minute_to_str(s), "end_time": _minute_to_str(e)})
+            if len(slots) >= limit:
+                return slots
+    return slots
+
+
+@app.get("/api/plans/search", response_model=List[PlanOut], tags=["Plans"])
+def search_user_plans(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200, description="Aranacak kelimeler; her kelime önek olarak eşleşir"),
+    limit: int = Query(20, ge=1, le=PLAN_PAGE_MAX),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_rate_limited_user),
+):
+    """
+    Plan başlık ve açıklamalarında tam metin arama (arşivlenmiş planlar dahil). Tüm kelimeler eşleşmeli;
+    büyük/küçük harf ve aksan farkı gözetilmez. Sonuçlar en yeniden eskiye sıralanır; devamı varsa
+    imleç `X-Next-Cursor` başlığında döner ve bir sonraki istekte `cursor` olarak gönderilir.
+    """
+    before = None
+    if cursor:
+        try:
+            before = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Geçersiz sayfalama imleci.")
+
+    plan_ids = search_plan_ids(db, current_user.uid, q, limit + 1, before=before)
+    plans = load_plans(db, plan_ids[:limit])
+    if len(plan_ids) > limit and plans:
+        response.headers["X-Next-Cursor"] = encode_cursor(plans[-1])
+    return [plan_to_out(p) for p in plans]
+
+
+# İstatistik sorgusunda tek istekte istenebilecek en fazla gün
+STATS_MAX_DAYS = 366
+
+
+@app.get("/api/stats", tags=["Plans"])
+def get_plan_stats(
+    start_date: PyDate,
+    end_date: PyDate,
+    top_slots: int = Query(5, ge=1, le=24 * 7, description="Döndürülecek en yoğun (haftanın günü, saat) dilimi sayısı"),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_rate_limited_user),
+):
+    """
+    Tarih aralığı için plan sayısı ve planlanan saatler: günlük ve haftalık (Pazartesi başlangıçlı)
+    toplamlar ile en yoğun saat dilimleri (`weekday` 0 = Pazartesi). Planlar taranmaz; yazma
+    işlemlerinde artımlı güncellenen günlük/saatlik özet tablolardan okunur.
+    """
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="Başlangıç tarihi, bitiş tarihinden sonra olamaz.")
+    if (end_date - start_date).days >= STATS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"En fazla {STATS_MAX_DAYS} günlük aralık sorgulanabilir.")
+    stats = range_stats(db, current_user.uid, start_date, end_date, top_slots=top_slots)
+    return {"start_date": start_date, "end_date": end_date, **stats}
+
+
+@app.get("/api/plans/events", tags=["Plans"])
+async def stream_plan_events(request: Request, current_user: User = Depends(get_rate_limited_user)):
+    """
+    Kullanıcının planlarındaki değişiklikleri (plan.created / plan.updated / plan.deleted) Server-Sent
+    Events olarak iter; diğer cihazlarda yapılan değişiklikleri görmek için polling gerekmez.
+    Akış geride kalırsa ya da istemci Last-Event-ID ile yeniden bağlanırsa (aradaki olaylar saklanmaz)
+    `resync` olayı gelir; istemci listeyi yeniden çekmelidir.
+    """
+    broker = get_broker()
+    if broker.stream_count(current_user.uid) >= EVENTS_MAX_STREAMS_PER_USER:
+        raise HTTPException(status_code=429, detail="Çok fazla açık olay akışı.")
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(sse_stream(current_user.uid, request), media_type="text/event-stream", headers=headers)
+
+
+@app.get("/api/plans/export", tags=["Plans"])
+def export_user_plans(
+    format: str = Query("ndjson", pattern=r"^(ndjson|csv)$"),
+    start_date: Optional[PyDate] = None,
+    end_date: Optional[PyDate] = None,
+    current_user: User = Depends(get_rate_limited_user),
+):
+    """
+    Kullanıcının planlarını (tarih verilmezse tüm geçmişi) NDJSON veya CSV olarak akış halinde döner.
+    Satırlar sunucu tarafı imleçten parça parça okunur; bellek kullanımı geçmişin boyutundan bağımsızdır.
+    """
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="Başlangıç tarihi, bitiş tarihinden sonra olamaz.")
+
+    plans = iter_plans(current_user.uid, start_date, end_date)
+    if format == "csv":
+        body, media_type, ext = stream_csv(plans, plan_to_out), "text/csv; charset=utf-8", "csv"
+    else:
+        body, media_type, ext = stream_ndjson(plans, plan_to_out), "application/x-ndjson", "ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="flow7-plans.{ext}"'}
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+
+# Kopyalamada kaynak aralığın en fazla gün sayısı
+COPY_MAX_SOURCE_DAYS = 31
+
+
+@app.post("/api/plans/copy", status_code=201, tags=["Plans"])
+@idempotent(status_code=201)
+def copy_user_plans(
+    payload: PlanCopy,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_rate_limited_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+):
+    """
+    Kaynak aralıktaki planları `offset_days` × k (k = 1..repeat) gün kaydırarak kopyalar; örn. bu haftayı
+    önümüzdeki 4 haftaya kopyalamak için offset_days=7, repeat=4. Kopyalar tek INSERT .. SELECT ile
+    veritabanında oluşturulur, mevcut planlarla çakışanlar tek sorguda bulunup döner. Son kopya abonelik
+    planlama sınırını aşarsa 403. SCHEDULE_LOOKAHEAD_DAYS içindeki kopyaların bildirimleri topluca zamanlanır.
+    """
+    if db.get_bind().dialect.name not in COPY_DIALECTS:
+        raise HTTPException(status_code=501, detail="Toplu kopyalama bu veritabanında desteklenmiyor.")
+    start, end, offset = payload.source_start_date, payload.source_end_date, payload.offset_days
+    if start > end:
+        raise HTTPException(status_code=400, detail="Başlangıç tarihi, bitiş tarihinden sonra olamaz.")
+    span = (end - start).days + 1
+    if span > COPY_MAX_SOURCE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Kaynak aralık en fazla {COPY_MAX_SOURCE_DAYS} gün olabilir.")
+    # kopyalar birbirinin ve kaynağın üstüne düşmesin
+    if abs(offset) < span:
+        raise HTTPException(status_code=400, detail=f"offset_days en az kaynak aralığın uzunluğu ({span} gün) olmalıdır.")
+
+    uid = current_user.uid
+    count, first, last = source_bounds(db, uid, start, end)
+    if not count:
+        return {"created": 0, "scheduled": 0, "conflicts": []}
+    shifts = (offset, offset * payload.repeat)
+    check_planning_date_limit(current_user, max(last + timedelta(days=k) for k in shifts))
+
+    conflicts = [
+        {
+            "source_id": c["id"],
+            "target_date": c["target_date"].isoformat(),
+            "start_time": time_to_str(c["start_time"]),
+            "end_time": time_to_str(c["end_time"]),
+            "title": c["title"],
+            "conflict_id": c["conflict_id"],
+            "conflict_title": c["conflict_title"],
+        }
+        for c in find_conflicts(db, uid, start, end, offset, payload.repeat)
+    ]
+    if conflicts and payload.on_conflict == "abort":
+        raise HTTPException(status_code=409, detail={"message": "Kopyalar mevcut planlarla çakışıyor.", "conflicts": conflicts})
+
+    created_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    copies = load_copies(db, insert_copies(db, uid, start, end, offset, payload.repeat, created_at))
+    today = datetime.now(timezone.utc).date()
+    due = [p for p in copies if _in_schedule_window(p.date, today)]
+    if copies:
+        _on_plans_created(db, uid, copies, "plans.copied")
+    db.commit()
+
+    scheduled = 0
+    if due and _user_notifications_enabled(uid):
+        scheduled = schedule_notifications_for_plans(due)
+    logger.info("copy: plans copied", extra={"uid": uid, "copied": len(copies), "conflicts": len(conflicts), "scheduled": scheduled})
+    return {"created": len(copies), "scheduled": scheduled, "conflicts": conflicts}
+
+
+@app.get("/api/plans.ics", tags=["Plans"])
+def export_user_plans_ics(
+    start_date: Optional[PyDate] = None,
+    end_date: Optional[PyDate] = None,
+    current_user: User = Depends(get_rate_limited_user),
+):
+    """
+    Kullanıcının planlarını iCalendar (ICS) dosyası olarak akış halinde döner; saatler UTC yazılır.
+    Satırlar /api/plans/export gibi sunucu tarafı imleçten okunur.
+    """
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="Başlangıç tarihi, bitiş tarihinden sonra olamaz.")
+    zone = _get_user_zoneinfo(current_user.uid)
+    body = stream_ics(iter_plans(current_user.uid, start_date, end_date), zone, name="Flow7")
+    headers = {"Content-Disposition": 'attachment; filename="flow7-plans.ics"'}
+    return StreamingResponse(body, media_type="text/calendar; charset=utf-8", headers=headers)
+
+
+# İçe aktarma raporunda ayrıntısı dönen en fazla atlanan etkinlik
+ICS_IMPORT_MAX_ERRORS = 100
+
+
+def _import_skip(report: dict, reason: str, event: dict, detail: str):
+    report["skipped"][reason] = report["skipped"].get(reason, 0) + 1
+    metrics.PLANS_IMPORTED.inc(outcome=reason)
+    if len(report["errors"]) < ICS_IMPORT_MAX_ERRORS:
+        report["errors"].append({"line": event.get("line"), "uid": event.get("UID", ({}, None))[1], "reason": reason, "detail": detail})
+
+
+def _import_chunk(db: Session, uid: str, items: list, report: dict, today: PyDate) -> List[PlanORM]:
+    """Bir parçanın çakışmalarını günlerin planlarından kurulan bitmap'lerle topluca kontrol eder, kalanları tek
+    transaction'da ekler. Zamanlama penceresine giren (bildirimi şimdi kurulması gereken) planları döner."""
+    days = {data.date for _, data in items}
+    lock_days(db, uid, days)
+    occupied = plan_bitmaps(db, uid, days)
+    plans = []
+    for event, data in items:
+        start_time_obj = get_time_obj_from_str(data.start_time)
+        end_time_obj = get_time_obj_from_str(data.end_time)
+        mask = plan_mask(start_time_obj, end_time_obj)
+        if occupied[data.date] & mask:
+            _import_skip(report, "conflict", event, f"{data.date.isoformat()} {data.start_time}-{data.end_time} mevcut bir planla çakışıyor")
+            continue
+        occupied[data.date] |= mask  # dosya içindeki çakışmalar da yakalanır
+        plans.append(PlanORM(
+            id=str(uuid4()),
+            user_id=uid,
+            date=data.date,
+            start_time=start_time_obj,
+            end_time=end_time_obj,
+            title=data.title,
+            description=data.description,
+            notified=False,
+            notified_mask=0,
+        ))
+    if not plans:
+        return []
+    due = [p for p in plans if _in_schedule_window(p.date, today)]
+    db.add_all(plans)
+    _on_plans_created(db, uid, plans, "plans.imported")
+    db.commit()
+    report["imported"] += len(plans)
+    metrics.PLANS_IMPORTED.inc(len(plans), outcome="imported")
+    return due
+
+
+def _import_ics(db: Session, user: User, fileobj) -> dict:
+    zone = _get_user_zoneinfo(user.uid)
+    today = datetime.now(timezone.utc).date()
+    limit_date = today + timedelta(days=SUBSCRIPTION_LIMITS_IN_DAYS.get(user.subscription, 14))
+    report = {"imported": 0, "skipped": {}, "errors": []}
+    due = []
+    chunk = []
+    for event in iter_events(fileobj):
+        try:
+            fields = event_fields(event, zone)
+            data = PlanCreate(**{k: fields[k] for k in ("date", "start_time", "end_time", "title", "description")})
+        except IcsError as e:
+            _import_skip(report, e.reason, event, str(e))
+            continue
+        except ValidationError as e:
+            _import_skip(report, "invalid", event, "; ".join(err["msg"] for err in e.errors()))
+            continue
+        if data.date > limit_date:
+            _import_skip(report, "beyond_limit", event, f"{user.subscription} aboneliği ile en fazla {limit_date.isoformat()} tarihine kadar plan yapabilirsiniz.")
+            continue
+        chunk.append((event, data))
+        if len(chunk) >= ICS_IMPORT_CHUNK_SIZE:
+            due += _import_chunk(db, user.uid, chunk, report, today)
+            chunk = []
+    if chunk:
+        due += _import_chunk(db, user.uid, chunk, report, today)
+    if due and _user_notifications_enabled(user.uid):
+        schedule_notifications_for_plans(due)
+    return report
+
+
+@app.post("/api/plans/import", tags=["Plans"])
+async def import_user_plans_ics(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_rate_limited_user),
+):
+    """
+    İstek gövdesindeki iCalendar (text/calendar) dosyasının etkinliklerini plan olarak ekler.
+    Gövde diske taşabilen geçici dosyaya akıtılır ve satır satır ayrıştırılır; her etkinlik PlanCreate
+    kurallarıyla doğrulanır, çakışmalar doluluk bitmap'leriyle toplu kontrol edilir ve planlar
+    ICS_IMPORT_CHUNK_SIZE'lık parçalar halinde eklenir. Çakışan, geçersiz, tüm gün/çok günlü/tekrarlı
+    veya abonelik sınırını aşan etkinlikler atlanır ve raporda sayılır; aynı dosyayı tekrar yüklemek
+    çakışma nedeniyle kopya oluşturmaz.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=ICS_IMPORT_SPOOL_BYTES) as spool:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > ICS_IMPORT_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"ICS dosyası en fazla {ICS_IMPORT_MAX_BYTES} bayt olabilir.")
+            spool.write(chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Boş ICS dosyası.")
+        spool.seek(0)
+        return await run_in_threadpool(_import_ics, db, current_user, spool)
+
+
 @app.put("/api/plans/{plan_id}", response_model=PlanOut, tags=["Plans"])
+@idempotent(status_code=200, response_model=PlanOut)
 def update_plan(
     plan_id: str,
     plan_data: PlanUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_rate_limited_user),
     force: Optional[bool] = False,  # query param to allow forcing update by removing conflicts
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
 ):
     """
-    Mevcut bir planı günceller.
+    Mevcut bir planı günceller. Arşivdeki (saklama süresini aşmış) bir plan önce canlı tabloya geri taşınır.
     """
-    db_plan = db.get(PlanORM, plan_id)
+    db_plan = db.get(PlanORM, plan_id) or restore_plan(db, plan_id)
     if not db_plan:
         raise HTTPException(status_code=404, detail="Plan bulunamadı.")
     if db_plan.user_id != current_user.uid:
@@ -285,7 +786,8 @@ def update_plan(
     start_time_obj = get_time_obj_from_str(plan_data.start_time)
     end_time_obj = get_time_obj_from_str(plan_data.end_time)
 
-    # Kendisi hariç diğer planlarla çakışma kontrolü
+    # Kendisi hariç diğer planlarla çakışma kontrolü (hedef günün doluluk satırı kilitli)
+    lock_days(db, current_user.uid, {plan_data.date})
     conflicts = db.execute(select(PlanORM).where(
         PlanORM.id != plan_id,
         PlanORM.user_id == current_user.uid,
@@ -298,17 +800,23 @@ def update_plan(
         if force:
             # delete all conflicting plans (user asked to force the update)
             deleted = []
+            delta = StatsDelta()
             try:
                 for cp in conflicts:
                     deleted.append(cp.id)
+                    delta.add_plan(cp, -1)
                     try:
                         # cancel scheduled jobs if any
                         cancel_scheduled_plan(cp.id)
                     except Exception:
                         pass
                     db.delete(cp)
+                    queue_plan_event(db, current_user.uid, "plan.deleted", {"id": cp.id, "date": cp.date.isoformat()})
+                refresh_days(db, current_user.uid, {plan_data.date})
+                unindex_plans(db, deleted)
+                apply_delta(db, current_user.uid, delta)
                 db.commit()
-                print(f"[FORCE-UPDATE] deleted conflicting plans for user {current_user.uid}: {deleted}")
+                logger.info("force-update: deleted conflicting plans", extra={"uid": current_user.uid, "plan_id": plan_id, "deleted": ",".join(deleted)})
             except Exception:
                 db.rollback()
                 raise HTTPException(status_code=500, detail="Failed to remove conflicting plans for force update")
@@ -327,43 +835,41 @@ def update_plan(
             raise HTTPException(status_code=409, detail={"message": "Güncellenen zaman aralığı başka bir planla çakışıyor.", "conflicts": conflict_list})
 
     # Verileri güncelle (time alanlarını time objesine çevir)
+    old_date, old_start, old_end = db_plan.date, db_plan.start_time, db_plan.end_time
     db_plan.date = plan_data.date
     db_plan.start_time = start_time_obj
     db_plan.end_time = end_time_obj
     db_plan.title = plan_data.title
     db_plan.description = plan_data.description
-    # Reset notified flag if times changed (allow future notification)
+    db_plan.reminder_mask = _reminder_mask(plan_data.reminders)
+    # Reset notified flags if times changed (allow future notification)
     db_plan.notified = False
+    db_plan.notified_mask = 0
+    db_plan.notify_at = None
+    _on_plan_updated(db, db_plan, old_date, old_start, old_end)
     db.commit()
     db.refresh(db_plan)
 
-    # Re-schedule: cancel any existing task, then if updated plan is today and in future, schedule
+    # Re-schedule: cancel any existing task, then arm the updated plan's next reminder if it is in the window
     try:
         cancel_scheduled_plan(db_plan.id)
-        now = datetime.now(timezone.utc)
-        if db_plan.date == now.date():
-            user_zone = _get_user_zoneinfo(db_plan.user_id)
-            try:
-                local_dt = datetime.combine(db_plan.date, db_plan.start_time).replace(tzinfo=user_zone)
-                notify_dt = local_dt.astimezone(timezone.utc)
-            except Exception:
-                notify_dt = datetime.combine(db_plan.date, db_plan.start_time).replace(tzinfo=timezone.utc)
-            if notify_dt > now and _user_notifications_enabled(db_plan.user_id):
-                schedule_notification_for_plan(db_plan)
     except Exception:
         logger.exception("Error re-scheduling updated plan %s", db_plan.id)
+    _schedule_if_due(db_plan)
 
     return plan_to_out(db_plan)
 
 
 @app.delete("/api/plans/{plan_id}", status_code=204, tags=["Plans"])
+@idempotent(status_code=204)
 def delete_plan(
     plan_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_rate_limited_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
 ):
-    """Mevcut bir planı siler."""
-    db_plan = db.get(PlanORM, plan_id)
+    """Mevcut bir planı siler; listelerde görünen arşivlenmiş planlar da arşivden silinir."""
+    db_plan = db.get(PlanORM, plan_id) or db.get(PlanArchiveORM, plan_id)
     if not db_plan:
         raise HTTPException(status_code=404, detail="Silinecek plan bulunamadı.")
     if db_plan.user_id != current_user.uid:
@@ -376,6 +882,7 @@ def delete_plan(
         logger.exception("Error cancelling scheduled task for deleted plan %s", plan_id)
 
     db.delete(db_plan)
+    _on_plan_deleted(db, db_plan)
     db.commit()
     return
 
@@ -383,7 +890,7 @@ def delete_plan(
 def update_subscription(
     payload: SubscriptionUpdate,
     db: Session = Depends(get_db), 
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_rate_limited_user),
 ):
     """
     Kullanıcının abonelik seviyesini veritabanında kalıcı olarak günceller.
@@ -400,21 +907,33 @@ def update_subscription(
     db.commit()
     db.refresh(settings)
 
-    if current_user.uid in USER_SUBSCRIPTIONS:
-         USER_SUBSCRIPTIONS[current_user.uid]["level"] = payload.level
-         USER_SUBSCRIPTIONS[current_user.uid]["expires"] = expires_dt
+    # tek okuma: girdi kontrol ile erişim arasında süresi dolup KeyError'a yol açamaz; yeniden yazmak TTL/LRU'yu tazeler
+    info = USER_SUBSCRIPTIONS.get(current_user.uid)
+    if info:
+        info["level"] = payload.level
+        info["expires"] = expires_dt
+        USER_SUBSCRIPTIONS[current_user.uid] = info
 
     return {"uid": current_user.uid, "level": settings.subscription_level, "expires_at": settings.subscription_expires_at.isoformat()}
 
 
 @app.get("/user/profile/", tags=["User"])
-def user_profile(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def user_profile(request: Request, response: Response, db: Session = Depends(get_read_db), current_user: User = Depends(get_rate_limited_user)):
     """
     Basit profil endpoint'i: uid, subscriptionLevel, expires_at (varsa), theme_preference,
     language_code ve notifications_enabled.
+    ETag / Last-Modified UserSettings.updated_at'ten türetilir; değişmediyse 304 döner.
     """
     uid = current_user.uid
-    settings = get_or_create_user_settings(uid, db)
+    settings = db.get(UserSettings, uid)
+    if settings is None:
+        # ilk kez görülen kullanıcı (ya da replica henüz yetişmedi): ayarları primary üzerinde oluştur
+        with SessionLocal() as primary:
+            settings = get_or_create_user_settings(uid, primary)
+    etag = make_etag("profile", uid, settings.updated_at)
+    if is_not_modified(request, etag, settings.updated_at):
+        return not_modified_response(etag, settings.updated_at)
+    set_validators(response, etag, settings.updated_at)
     expires = settings.subscription_expires_at
     return {
         "uid": uid,
@@ -423,6 +942,7 @@ def user_profile(db: Session = Depends(get_db), current_user: User = Depends(get
         "theme_preference": settings.theme or current_user.theme_preference,
         "language_code": settings.language_code or "en",
         "notifications_enabled": bool(settings.notifications_enabled),
+        "reminders": names_from_mask(settings.reminder_mask) if settings.reminder_mask is not None else None,
         "username": settings.username,
         "score": int(settings.subscription_score or 0),
     }
@@ -436,7 +956,7 @@ class ThemePreferenceUpdate(BaseModel):
 def update_user_theme(
     payload: ThemePreferenceUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_rate_limited_user),
 ):
     uid = current_user.uid
     settings = get_or_create_user_settings(uid, db)
@@ -454,8 +974,21 @@ class LanguageUpdate(BaseModel):
 class NotificationsUpdate(BaseModel):
     enabled: bool
 
+class DeviceRegistration(BaseModel):
+    token: str = Field(..., min_length=1, max_length=4096, description="FCM/APNs cihaz token'ı")
+    platform: Optional[str] = Field(None, pattern=r"^(android|ios|web)$")
+
+@app.put("/user/devices/", tags=["User"])
+def register_device(payload: DeviceRegistration, db: Session = Depends(get_db), current_user: User = Depends(get_rate_limited_user)):
+    """
+    Cihaz token'ını kullanıcıya kaydeder (token benzersizdir; başka bir uid'deyse bu kullanıcıya taşınır).
+    Aynı token tekrar kaydedildiğinde değişiklik yoksa veritabanına yazılmaz.
+    """
+    written, _ = register_device_token(db, current_user.uid, payload.token, payload.platform)
+    return {"uid": current_user.uid, "token": payload.token, "platform": payload.platform, "changed": written}
+
 @app.put("/user/language/", tags=["User"])
-def update_user_language(payload: LanguageUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def update_user_language(payload: LanguageUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_rate_limited_user)):
     uid = current_user.uid
     settings = get_or_create_user_settings(uid, db)
     settings.language_code = payload.language_code
@@ -466,7 +999,7 @@ def update_user_language(payload: LanguageUpdate, db: Session = Depends(get_db),
     return {"uid": uid, "language_code": settings.language_code}
 
 @app.put("/user/notifications/", tags=["User"])
-def update_user_notifications(payload: NotificationsUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def update_user_notifications(payload: NotificationsUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_rate_limited_user)):
     uid = current_user.uid
     settings = get_or_create_user_settings(uid, db)
     settings.notifications_enabled = bool(payload.enabled)
@@ -476,6 +1009,34 @@ def update_user_notifications(payload: NotificationsUpdate, db: Session = Depend
     db.refresh(settings)
     return {"uid": uid, "notifications_enabled": settings.notifications_enabled}
 
+class RemindersUpdate(BaseModel):
+    reminders: Optional[List[str]] = Field(..., max_items=len(REMINDER_SLOTS), description="Varsayılan hatırlatıcılar (örn. start-10m, start); null: sunucu varsayılanı")
+
+    @validator("reminders")
+    def reminders_must_be_known(cls, v):
+        return _validate_reminder_names(v)
+
+@app.put("/user/reminders/", tags=["User"])
+def update_user_reminders(payload: RemindersUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_rate_limited_user)):
+    """
+    Kendi hatırlatıcı seçimi olmayan planlar için kullanıcının varsayılan hatırlatıcılarını ayarlar.
+    Bekleyen planların bildirim işleri arka planda yeni seçime göre yeniden kurulur.
+    """
+    uid = current_user.uid
+    settings = get_or_create_user_settings(uid, db)
+    mask = _reminder_mask(payload.reminders)
+    if settings.reminder_mask != mask:
+        settings.reminder_mask = mask
+        settings.updated_at = datetime.now(timezone.utc)
+        db.add(settings)
+        db.commit()
+        db.refresh(settings)
+        try:
+            threading.Thread(target=_reschedule_user_pending_plans_sync, args=(uid,), daemon=True).start()
+        except Exception:
+            pass
+    return {"uid": uid, "reminders": payload.reminders}
+
 # --- ADD: notification worker ---
 def get_or_create_user_settings(uid: str, db: Session):
     """
@@ -552,13 +1113,36 @@ def _user_notifications_enabled(uid: str) -> bool:
 # dispatch logic is implemented in flow7_core.scheduler as _dispatch_notification_job
 
 
+# Başlangıç durumu: şema + scheduler hazır olunca istek kabul edilir; bekleyen planların yeniden
+# zamanlanması ve firebase kurulumu arka planda sürer (GET /api/ready bunları raporlar).
+_startup_state = {"schema": False, "scheduler": False, "rescheduled": False, "firebase": None}
+
+
+def _background_startup():
+    try:
+        _startup_state["firebase"] = init_firebase()
+    except Exception:
+        logger.exception("Error initializing firebase")
+    try:
+        reschedule_pending_plans()
+    except Exception:
+        logger.exception("Error rescheduling pending plans")
+    _startup_state["rescheduled"] = True
+
+
 @app.on_event("startup")
 def _on_startup_init_scheduler():
-    """App startup: initialize the modular scheduler and reschedule pending plans."""
+    """App startup: create missing tables and start the scheduler; rescheduling runs in the background."""
+    started = time.perf_counter()
+    init_db()
+    _startup_state["schema"] = True
     try:
-        init_and_reschedule()
+        start_scheduler()
     except Exception:
         logger.exception("Error initializing scheduler on startup")
+    _startup_state["scheduler"] = True
+    threading.Thread(target=_background_startup, name="flow7-startup", daemon=True).start()
+    logger.info("startup: accepting requests", extra={"startup_ms": round((time.perf_counter() - started) * 1000, 1)})
 
 
 @app.on_event("shutdown")
@@ -615,8 +1199,9 @@ async def timezone_header_middleware(request: Request, call_next):
             token = auth_header.split(" ", 1)[1].strip()
             uid = None
             # Prefer verified uid when firebase_admin is available
-            if FIREBASE_ADMIN_AVAILABLE:
+            if firebase_available():
                 try:
+                    from firebase_admin import auth
                     decoded = auth.verify_id_token(token, check_revoked=FIREBASE_CHECK_REVOKED)
                     uid = decoded.get("uid") or decoded.get("sub") or decoded.get("user_id") or decoded.get("email")
                 except Exception:
@@ -626,6 +1211,9 @@ async def timezone_header_middleware(request: Request, call_next):
                 uid = _parse_uid_from_token(token)
 
             # if we have a uid, validate tz_header and update in-memory store (best-effort)
+            # Her istekte DB'ye gidilmemesi için uid başına ayrı bir limit: aşılırsa sadece bu iş atlanır.
+            if uid and not check_rate_limit(uid, None, scope="timezone")[0]:
+                uid = None
             if uid:
                 try:
                     # validate timezone string
@@ -659,7 +1247,7 @@ async def timezone_header_middleware(request: Request, call_next):
                                     db.add(settings)
                                     db.commit()
                                     db.refresh(settings)
-                                    print(f"[TIMEZONE] middleware persisted timezone for uid={uid}: {stored_tz!r} -> {tz_header!r}")
+                                    logger.info("timezone: middleware persisted timezone %r -> %r", stored_tz, tz_header, extra={"uid": uid})
                                     # reschedule pending plans in background thread (don't pass db across threads)
                                     try:
                                         threading.Thread(target=_reschedule_user_pending_plans_sync, args=(uid,), daemon=True).start()
@@ -675,7 +1263,7 @@ async def timezone_header_middleware(request: Request, call_next):
                                         db.add(settings)
                                         db.commit()
                                         db.refresh(settings)
-                                        print(f"[TIMEZONE] middleware created settings and set timezone for uid={uid}: -> {tz_header!r}")
+                                        logger.info("timezone: middleware created settings with timezone %r", tz_header, extra={"uid": uid})
                                         try:
                                             threading.Thread(target=_reschedule_user_pending_plans_sync, args=(uid,), daemon=True).start()
                                         except Exception:
@@ -707,12 +1295,13 @@ async def timezone_header_middleware(request: Request, call_next):
 def update_user_timezone(
     payload: TimezoneUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_rate_limited_user),
 ):
     """
     Persist user's primary timezone (UserSettings.timezone) when `persist=True`.
     If the provided timezone differs from stored value, update DB and reschedule pending plans.
-    If persist=False, just update in-memory/session timezone (USER_SUBSCRIPTIONS) without changing DB.
+    If persist=False, set a session timezone (SESSION_TIMEZONES) for ttl_hours without changing DB;
+    it takes precedence over the stored one for notifications until it expires.
     """
     tz_str = payload.timezone
     persist = bool(payload.persist)
@@ -741,7 +1330,7 @@ def update_user_timezone(
             db.commit()
             db.refresh(settings)
             changed = True
-            print(f"[TIMEZONE] persisted timezone for uid={uid}: {old_tz!r} -> {tz_str!r}")
+            logger.info("timezone: persisted timezone %r -> %r", old_tz, tz_str, extra={"uid": uid})
             # Update in-memory fallback too
             info = USER_SUBSCRIPTIONS.get(uid) or {}
             info["timezone"] = tz_str
@@ -755,23 +1344,13 @@ def update_user_timezone(
         else:
             changed = False
     else:
-        # session-only update: store in-memory and optionally spawn reschedule for immediate effect
-        info = USER_SUBSCRIPTIONS.get(uid)
-        if not info:
-            USER_SUBSCRIPTIONS[uid] = {
-                "level": "FREE",
-                "theme": "DARK",
-                "timezone": tz_str,
-                "country": None,
-                "city": None,
-                "notifications_enabled": True,
-            }
-        else:
-            USER_SUBSCRIPTIONS[uid]["timezone"] = tz_str
-        # track session expiry in memory if desired (not persisted)
-        USER_SUBSCRIPTIONS[uid]["session_tz_set_at"] = datetime.now(timezone.utc).isoformat()
-        USER_SUBSCRIPTIONS[uid]["session_ttl_hours"] = ttl_hours
+        # session-only update: kept in memory for ttl_hours, then the stored timezone applies again
+        SESSION_TIMEZONES.set(uid, tz_str, ttl=ttl_hours * 3600)
+        try:
+            threading.Thread(target=_reschedule_user_pending_plans_sync, args=(uid,), daemon=True).start()
+        except Exception:
+            pass
         changed = True
-        print(f"[TIMEZONE] session timezone updated for uid={uid}: {tz_str!r} (ttl_hours={ttl_hours})")
+        logger.info("timezone: session timezone updated to %r", tz_str, extra={"uid": uid, "ttl_hours": ttl_hours})
 
     return {"uid": uid, "timezone": tz_str, "persisted": persist, "changed": bool(changed)}
\ No newline at end of file
@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Every run gets a throwaway SQLite file; set before flow7_core.config is imported (it reads the
+# environment once). Pushes go to the in-memory transport so nothing leaves the process.
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='flow7-tests-')}/test.db")
+os.environ.setdefault("PUSH_TRANSPORT", "memory")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def schema():
+    from flow7_core.db import init_db
+
+    init_db()
+
+
+@pytest.fixture
+def db(schema):
+    from flow7_core.db import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client(schema):
+    """API client without the lifespan: no scheduler thread, plan writes still run their hooks."""
+    from fastapi.testclient import TestClient
+
+    import main
+
+    return TestClient(main.app)
+
+
+def auth(uid: str) -> dict:
+    return {"Authorization": f"Bearer {uid}"}
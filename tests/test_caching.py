@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+
+from conftest import auth
+
+
+def _day(days):
+    return (datetime.now(timezone.utc).date() + timedelta(days=days)).isoformat()
+
+
+def _create(client, uid, days, start, end):
+    r = client.post("/api/plans", json={"title": "Cached", "date": _day(days), "start_time": start, "end_time": end}, headers=auth(uid))
+    assert r.status_code == 201, r.text
+    return r.json()["id"]
+
+
+def _list(client, uid, etag=None, days=(3, 4)):
+    headers = auth(uid)
+    if etag:
+        headers["If-None-Match"] = etag
+    return client.get("/api/plans", params={"start_date": _day(days[0]), "end_date": _day(days[1])}, headers=headers)
+
+
+def test_repeat_plan_list_is_a_304(client):
+    uid = "cacheplans1"
+    _create(client, uid, 3, "09:00", "10:00")
+    first = _list(client, uid)
+    assert first.status_code == 200 and len(first.json()) == 1
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    again = _list(client, uid, etag)
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["ETag"] == etag
+    # weak comparison, lists and "*"
+    assert _list(client, uid, etag[2:]).status_code == 304
+    assert _list(client, uid, f'W/"other", {etag}').status_code == 304
+    assert _list(client, uid, "*").status_code == 304
+    assert _list(client, uid, 'W/"other"').status_code == 200
+    # another range is another representation
+    assert _list(client, uid, etag, days=(3, 5)).status_code == 200
+
+
+def test_plan_list_etag_changes_with_creates_updates_and_deletes(client):
+    uid = "cacheplans2"
+    first_id = _create(client, uid, 3, "09:00", "10:00")
+    etags = [_list(client, uid).headers["ETag"]]
+
+    second_id = _create(client, uid, 4, "09:00", "10:00")
+    etags.append(_list(client, uid).headers["ETag"])
+    assert _list(client, uid, etags[0]).status_code == 200
+
+    r = client.put(f"/api/plans/{second_id}", json={"title": "Renamed", "date": _day(4), "start_time": "09:00", "end_time": "10:00"}, headers=auth(uid))
+    assert r.status_code == 200
+    etags.append(_list(client, uid).headers["ETag"])
+
+    # deleting the older plan leaves the newest updated_at as it was; the row count still changes the tag
+    assert client.delete(f"/api/plans/{first_id}", headers=auth(uid)).status_code == 204
+    etags.append(_list(client, uid).headers["ETag"])
+    assert len(set(etags)) == 4
+    assert _list(client, uid, etags[2]).status_code == 200
+    assert _list(client, uid, etags[3]).status_code == 304
+
+    # a write outside the range leaves the tag alone
+    _create(client, uid, 6, "09:00", "10:00")
+    assert _list(client, uid, etags[3]).status_code == 304
+
+
+def test_repeat_profile_is_a_304_until_a_settings_change(client):
+    uid = "cacheprofile1"
+    first = client.get("/user/profile/", headers=auth(uid))
+    assert first.status_code == 200
+    etag, last_modified = first.headers["ETag"], first.headers["Last-Modified"]
+
+    again = client.get("/user/profile/", headers={**auth(uid), "If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+    assert client.get("/user/profile/", headers={**auth(uid), "If-Modified-Since": last_modified}).status_code == 304
+
+    assert client.put("/user/theme/", json={"theme": "LIGHT"}, headers=auth(uid)).status_code == 200
+    changed = client.get("/user/profile/", headers={**auth(uid), "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["theme_preference"] == "LIGHT"
+    assert changed.headers["ETag"] != etag
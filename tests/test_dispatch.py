@@ -0,0 +1,168 @@
+import zlib
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+
+from flow7_core import scheduler
+from flow7_core.config import DISPATCH_SHARDS
+from flow7_core.db import SessionLocal
+from flow7_core.devices import register_device_token
+from flow7_core.dispatch import ShardDispatcher, assigned_shards
+from flow7_core.models import PlanORM, UserSettings, dispatch_shard_for
+from flow7_core.push import InMemoryTransport, set_transport
+
+
+def test_dispatch_shard_is_a_stable_hash_of_the_uid():
+    for uid in ("alice", "bob", "ünïcode", ""):
+        assert dispatch_shard_for(uid) == zlib.crc32(uid.encode("utf-8")) % DISPATCH_SHARDS
+        assert 0 <= dispatch_shard_for(uid) < DISPATCH_SHARDS
+    assert len({dispatch_shard_for(f"user{i}") for i in range(2000)}) == DISPATCH_SHARDS
+
+
+def test_plans_get_the_shard_of_their_user(db):
+    plan = PlanORM(id=str(uuid4()), user_id="shardowner1", date=datetime(2030, 1, 2).date(), start_time=datetime(2030, 1, 2, 9).time(), title="x")
+    db.add(plan)
+    db.commit()
+    assert plan.dispatch_shard == dispatch_shard_for("shardowner1")
+    db.delete(plan)
+    db.commit()
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 7])
+def test_assigned_shards_partition_all_shards(count):
+    workers = sorted(f"worker-{i}" for i in range(count))
+    owned = [assigned_shards(workers, w) for w in workers]
+    assert set().union(*owned) == set(range(DISPATCH_SHARDS))
+    assert sum(len(s) for s in owned) == DISPATCH_SHARDS
+    assert max(len(s) for s in owned) - min(len(s) for s in owned) <= 1
+
+
+def test_unknown_worker_owns_nothing():
+    assert assigned_shards(["worker-a", "worker-b"], "worker-c") == set()
+
+
+def _naive_utc(dt: datetime) -> datetime:
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _due_plan(db, uid, minutes_ago=2, notify=True):
+    start = _naive_utc(datetime.now(timezone.utc) - timedelta(minutes=minutes_ago)).replace(second=0, microsecond=0)
+    plan = PlanORM(id=str(uuid4()), user_id=uid, date=start.date(), start_time=start.time(), end_time=None,
+                   title=f"due {uid}", notified=False, notify_at=start if notify else None, reminder_mask=1)
+    db.add(plan)
+    return plan
+
+
+def _settings(db, uid, enabled=True):
+    db.merge(UserSettings(uid=uid, timezone="UTC", notifications_enabled=enabled))
+
+
+@pytest.fixture
+def seeded(db):
+    """Due plans of several users, one user opted out, one plan not due yet; removed afterwards."""
+    plans = [_due_plan(db, f"shardsplit{i}") for i in range(12)]
+    _settings(db, "shardsplitoff", enabled=False)
+    off = _due_plan(db, "shardsplitoff")
+    later = _due_plan(db, "shardsplit0", minutes_ago=-60)
+    db.commit()
+    yield {"due": {p.id for p in plans}, "off": off.id, "later": later.id}
+    db.execute(PlanORM.__table__.delete().where(PlanORM.user_id.like("shardsplit%")))
+    db.commit()
+
+
+def _rebalance(dispatcher):
+    session = SessionLocal()
+    try:
+        return dispatcher.rebalance(session)
+    finally:
+        session.close()
+
+
+def _due(dispatcher):
+    session = SessionLocal()
+    try:
+        return set(dispatcher.due_plan_ids(session))
+    finally:
+        session.close()
+
+
+def test_two_dispatchers_split_shards_and_due_plans(seeded):
+    first = ShardDispatcher("test-dispatcher-a", dispatch=lambda plan_id: None)
+    second = ShardDispatcher("test-dispatcher-b", dispatch=lambda plan_id: None)
+    try:
+        assert len(_rebalance(first)) == DISPATCH_SHARDS
+        # the newcomer's shards are still leased by the first dispatcher
+        assert _rebalance(second) == set()
+        # ... which hands them over at its next round
+        assert _rebalance(first) == assigned_shards(["test-dispatcher-a", "test-dispatcher-b"], "test-dispatcher-a")
+        assert _rebalance(second) == assigned_shards(["test-dispatcher-a", "test-dispatcher-b"], "test-dispatcher-b")
+        assert first.held.isdisjoint(second.held)
+
+        due_first, due_second = _due(first), _due(second)
+        assert due_first.isdisjoint(due_second)
+        assert seeded["due"] <= due_first | due_second
+        assert seeded["off"] not in due_first | due_second
+        assert seeded["later"] not in due_first | due_second
+        session = SessionLocal()
+        try:
+            for dispatcher, ids in ((first, due_first), (second, due_second)):
+                for plan in session.query(PlanORM).filter(PlanORM.id.in_(ids)):
+                    assert plan.dispatch_shard in dispatcher.held
+        finally:
+            session.close()
+    finally:
+        first.release()
+        second.release()
+
+
+@pytest.fixture
+def transport():
+    memory = InMemoryTransport()
+    set_transport(memory)
+    yield memory
+    set_transport(None)
+
+
+def test_sharded_poll_sends_only_to_opted_in_users(db, transport):
+    _settings(db, "shardsendon")
+    _settings(db, "shardsendoff", enabled=False)
+    on, off = _due_plan(db, "shardsendon"), _due_plan(db, "shardsendoff")
+    db.commit()
+    register_device_token(db, "shardsendon", "token-on", "android")
+    register_device_token(db, "shardsendoff", "token-off", "android")
+
+    dispatcher = ShardDispatcher("test-dispatcher-send")
+    try:
+        assert dispatcher.poll() >= 1
+    finally:
+        dispatcher.release()
+
+    assert [m["token"] for m in transport.messages] == ["token-on"]
+    db.expire_all()
+    assert db.get(PlanORM, on.id).notified is True
+    assert db.get(PlanORM, off.id).notified is False
+
+
+def test_sharded_mode_runs_dispatcher_thread_instead_of_a_job(schema, monkeypatch):
+    monkeypatch.setattr(scheduler, "DISPATCH_MODE", "sharded")
+    scheduler.start_scheduler()
+    try:
+        jobstore = scheduler._jobstore
+        with jobstore.engine.begin() as conn:
+            # a poll job persisted by an earlier version cannot be unpickled; the next start removes it
+            conn.execute(jobstore.jobs_t.insert().values(id="dispatch_poll_stale", next_run_time=None, job_state=b""))
+        assert scheduler._dispatcher_thread.is_alive()
+        assert not [job.id for job in scheduler._scheduler.get_jobs() if job.id.startswith("dispatch_poll_")]
+    finally:
+        scheduler.shutdown()
+    assert scheduler._dispatcher_thread is None
+
+    scheduler.start_scheduler()
+    try:
+        with scheduler._jobstore.engine.connect() as conn:
+            jobs_t = scheduler._jobstore.jobs_t
+            assert conn.execute(jobs_t.select().where(jobs_t.c.id.like("dispatch_poll_%"))).first() is None
+        assert scheduler._scheduler.get_job("schedule_lookahead_sweep") is None
+    finally:
+        scheduler.shutdown()
@@ -0,0 +1,91 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import auth
+from flow7_core.events import EventBroker, InMemoryEventBroker, set_broker, sse_stream
+
+
+class _Request:
+    """The parts of a Starlette request sse_stream looks at."""
+
+    def __init__(self, headers=None):
+        self.headers = headers or {}
+
+    async def is_disconnected(self):
+        return False
+
+
+def _frame(raw: bytes) -> dict:
+    fields = dict(line.split(": ", 1) for line in raw.decode("utf-8").strip().split("\n"))
+    if "data" in fields:
+        fields["data"] = json.loads(fields["data"])
+    return fields
+
+
+async def _next_event(stream, timeout=2.0):
+    """The next frame that is not a heartbeat comment."""
+    while True:
+        raw = await asyncio.wait_for(stream.__anext__(), timeout)
+        if not raw.startswith(b":"):
+            return _frame(raw)
+
+
+@pytest.fixture
+def broker():
+    memory = InMemoryEventBroker()
+    set_broker(memory)
+    yield memory
+    set_broker(None)
+
+
+def test_event_broker_is_abstract():
+    with pytest.raises(TypeError):
+        EventBroker()
+
+
+def test_plan_events_reach_only_the_owning_user(client, broker):
+    h = auth("eventsowner1")
+    day = (datetime.now(timezone.utc).date() + timedelta(days=4)).isoformat()
+
+    async def run():
+        owner = sse_stream("eventsowner1", _Request(), heartbeat=0.05)
+        other = sse_stream("eventsother1", _Request(), heartbeat=0.05)
+        # the first frame is the retry hint; the subscription exists from then on
+        assert await owner.__anext__() == b"retry: 3000\n\n"
+        assert await other.__anext__() == b"retry: 3000\n\n"
+        assert broker.stream_count() == 2
+
+        def writes():
+            r = client.post("/api/plans", json={"title": "Sync", "date": day, "start_time": "09:00", "end_time": "10:00"}, headers=h)
+            plan_id = r.json()["id"]
+            client.put(f"/api/plans/{plan_id}", json={"title": "Synced", "date": day, "start_time": "09:00", "end_time": "10:30"}, headers=h)
+            client.delete(f"/api/plans/{plan_id}", headers=h)
+            return plan_id
+
+        plan_id = await asyncio.to_thread(writes)
+        events = [await _next_event(owner) for _ in range(3)]
+        assert [e["event"] for e in events] == ["plan.created", "plan.updated", "plan.deleted"]
+        assert events[0]["data"]["id"] == plan_id and events[1]["data"]["title"] == "Synced"
+        assert len({e["id"] for e in events}) == 3
+        # only pings for the other user
+        for _ in range(3):
+            assert (await asyncio.wait_for(other.__anext__(), 1.0)).startswith(b":")
+
+        await owner.aclose()
+        await other.aclose()
+        assert broker.stream_count() == 0
+
+    asyncio.run(run())
+
+
+def test_reconnect_with_last_event_id_gets_resync(broker):
+    async def run():
+        stream = sse_stream("eventsreconnect1", _Request({"last-event-id": "gone-42"}), heartbeat=0.05)
+        assert await stream.__anext__() == b"retry: 3000\n\n"
+        assert (await _next_event(stream))["event"] == "resync"
+        await stream.aclose()
+
+    asyncio.run(run())
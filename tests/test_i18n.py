@@ -0,0 +1,56 @@
+import pytest
+
+from flow7_core.config import NOTIFICATION_DEFAULT_LANGUAGE
+from flow7_core.i18n import _TEXTS, CATALOG, SUPPORTED_LANGUAGES, NotificationTemplates, resolve_language, templates_for
+from flow7_core.reminders import REMINDER_SLOTS
+
+
+@pytest.mark.parametrize("code, language", [
+    ("de", "de"),
+    ("DE", "de"),
+    ("de-AT", "de"),
+    ("zh_Hans", "zh"),
+    ("pt-BR", NOTIFICATION_DEFAULT_LANGUAGE),
+    ("", NOTIFICATION_DEFAULT_LANGUAGE),
+    (None, NOTIFICATION_DEFAULT_LANGUAGE),
+])
+def test_resolve_language(code, language):
+    assert resolve_language(code) == language
+
+
+def test_every_language_labels_every_reminder_slot():
+    assert SUPPORTED_LANGUAGES == tuple(sorted(_TEXTS))
+    for language in SUPPORTED_LANGUAGES:
+        labels = CATALOG[language].reminder_labels
+        assert set(labels) == {name for name, _, _ in REMINDER_SLOTS}
+        assert all(labels.values())
+
+
+def test_reminder_labels_pick_unit_and_plural():
+    en, de = templates_for("en"), templates_for("de")
+    assert en.reminder_label("start") == "Starting now"
+    assert en.reminder_label("end") == "Ending now"
+    assert en.reminder_label("start-5m") == "Starts in 5 minutes"
+    assert en.reminder_label("start-1h") == "Starts in 1 hour"
+    assert en.reminder_label("start-2h") == "Starts in 2 hours"
+    assert en.reminder_label("start-1d") == "Starts in 1 day"
+    assert de.reminder_label("start-1h") == "Beginnt in 1 Stunde"
+    assert templates_for("tr").reminder_label("start-30m") == "30 dakika sonra başlıyor"
+
+
+def test_unknown_reminder_name_falls_back_to_start_label():
+    assert templates_for("en").reminder_label("start-3m") == "Starting now"
+
+
+def test_digest_title_formats_count():
+    assert templates_for("en").digest_title(count=3) == "Flow7: 3 plans"
+    assert templates_for("ja").digest_title(count=2) == "Flow7: 2件の予定"
+
+
+def test_catalog_rejects_unknown_placeholders_and_missing_templates():
+    texts = dict(_TEXTS["en"], starts_in="Starts in {minutes}")
+    with pytest.raises(ValueError, match="unknown placeholder"):
+        NotificationTemplates("xx", texts)
+    texts = {k: v for k, v in _TEXTS["en"].items() if k != "ends_now"}
+    with pytest.raises(ValueError, match="missing template"):
+        NotificationTemplates("xx", texts)
@@ -0,0 +1,119 @@
+import io
+from datetime import date, time
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from flow7_core.ical import IcsError, escape_text, event_fields, iter_events, iter_lines, stream_ics, unescape_text
+
+ISTANBUL = ZoneInfo("Europe/Istanbul")
+
+
+def _calendar(*lines: str) -> io.BytesIO:
+    return io.BytesIO("\r\n".join(lines).encode("utf-8") + b"\r\n")
+
+
+def _events(*event_lines: str):
+    return list(iter_events(_calendar("BEGIN:VCALENDAR", "BEGIN:VEVENT", *event_lines, "END:VEVENT", "END:VCALENDAR")))
+
+
+def test_iter_lines_unfolds_continuations():
+    lines = list(iter_lines(_calendar("SUMMARY:Long", " er title", "\tend", "UID:1")))
+    assert lines == [(1, "SUMMARY:Longer titleend"), (4, "UID:1")]
+
+
+def test_iter_events_skips_nested_components_and_unknown_properties():
+    events = list(iter_events(_calendar(
+        "BEGIN:VCALENDAR",
+        "BEGIN:VEVENT",
+        "SUMMARY:Outer",
+        "X-CUSTOM:ignored",
+        "BEGIN:VALARM",
+        "SUMMARY:Alarm text",
+        "END:VALARM",
+        "END:VEVENT",
+        "END:VCALENDAR",
+    )))
+    assert len(events) == 1
+    assert events[0]["SUMMARY"] == ({}, "Outer")
+    assert "X-CUSTOM" not in events[0]
+    assert events[0]["line"] == 2
+
+
+def test_event_fields_converts_to_user_zone():
+    (event,) = _events("UID:a@x", "SUMMARY:Standup", "DTSTART:20300102T070000Z", "DTEND:20300102T073000Z")
+    fields = event_fields(event, ISTANBUL)
+    assert fields == {
+        "uid": "a@x", "date": date(2030, 1, 2), "start_time": "10:00", "end_time": "10:30",
+        "title": "Standup", "description": None,
+    }
+
+
+def test_event_fields_tzid_duration_and_escapes():
+    (event,) = _events(
+        'DTSTART;TZID="Europe/Berlin":20300102T090000',
+        "DURATION:PT1H15M",
+        "SUMMARY:Lunch\\, then walk",
+        "DESCRIPTION:line one\\nline two\\; done",
+    )
+    fields = event_fields(event, ISTANBUL)
+    assert (fields["start_time"], fields["end_time"]) == ("11:00", "12:15")
+    assert fields["title"] == "Lunch, then walk"
+    assert fields["description"] == "line one\nline two; done"
+
+
+def test_event_fields_floating_and_unknown_tzid_are_local():
+    (floating,) = _events("DTSTART:20300102T090000", "DTEND:20300102T100000")
+    (windows,) = _events("DTSTART;TZID=W. Europe Standard Time:20300102T090000")
+    assert event_fields(floating, ISTANBUL)["start_time"] == "09:00"
+    assert event_fields(windows, ISTANBUL)["start_time"] == event_fields(windows, ISTANBUL)["end_time"] == "09:00"
+
+
+@pytest.mark.parametrize("lines, reason", [
+    (("DTSTART;VALUE=DATE:20300102",), "all_day"),
+    (("DTSTART:20300102T230000Z", "DTEND:20300103T010000Z"), "multi_day"),
+    (("DTSTART:20300102T090000Z", "RRULE:FREQ=DAILY"), "unsupported"),
+    (("DTSTART:20300102T090000Z", "STATUS:CANCELLED"), "unsupported"),
+    (("SUMMARY:no start",), "invalid"),
+    (("DTSTART:20300102T090000Z", "DURATION:soon"), "invalid"),
+    (("DTSTART:2030-01-02 09:00",), "invalid"),
+])
+def test_event_fields_rejects_events_a_plan_cannot_hold(lines, reason):
+    (event,) = _events(*lines)
+    with pytest.raises(IcsError) as exc:
+        event_fields(event, ZoneInfo("UTC"))
+    assert exc.value.reason == reason
+
+
+def test_text_escaping_round_trips():
+    value = "a, b; c\\d\nnext"
+    assert unescape_text(escape_text(value)) == value
+
+
+def _plan(plan_id, title, start, end, description=None):
+    return SimpleNamespace(id=plan_id, date=date(2030, 1, 2), start_time=start, end_time=end, title=title, description=description)
+
+
+def test_stream_ics_round_trips_through_the_parser():
+    plans = [
+        _plan("p1", "Çalışma, planı; ödev", time(9, 0), time(10, 30), "satır 1\nsatır 2"),
+        _plan("p2", "No end", time(14, 0), None),
+    ]
+    data = b"".join(stream_ics(plans, ISTANBUL, name="Flow7"))
+    assert data.startswith(b"BEGIN:VCALENDAR\r\n") and data.endswith(b"END:VCALENDAR\r\n")
+    parsed = [event_fields(e, ISTANBUL) for e in iter_events(io.BytesIO(data))]
+    assert [(f["uid"], f["title"], f["start_time"], f["end_time"], f["description"]) for f in parsed] == [
+        ("p1@flow7", "Çalışma, planı; ödev", "09:00", "10:30", "satır 1\nsatır 2"),
+        ("p2@flow7", "No end", "14:00", "14:00", None),
+    ]
+
+
+def test_stream_ics_folds_long_lines_without_splitting_characters():
+    title = "ğ" * 100  # two bytes each
+    data = b"".join(stream_ics([_plan("p1", title, time(9, 0), time(10, 0))], ZoneInfo("UTC")))
+    for line in data.split(b"\r\n"):
+        assert len(line) <= 75
+        line.decode("utf-8")  # every physical line is valid UTF-8 on its own
+    (event,) = iter_events(io.BytesIO(data))
+    assert event["SUMMARY"][1] == title
@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import auth
+from flow7_core import idempotency
+from flow7_core.idempotency import REPLAY_HEADER, IdempotencyStore
+from flow7_core.models import PlanORM
+
+
+def _day(days=4):
+    return (datetime.now(timezone.utc).date() + timedelta(days=days)).isoformat()
+
+
+def _plan(title="Review", start="09:00", end="10:00", days=4):
+    return {"title": title, "date": _day(days), "start_time": start, "end_time": end}
+
+
+def _key(key):
+    return {"Idempotency-Key": key}
+
+
+def _count(db, uid):
+    db.expire_all()
+    return db.query(PlanORM).filter(PlanORM.user_id == uid).count()
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fresh store on a hand-driven clock, so tests neither share keys nor wait for the TTL."""
+    clock = _Clock()
+    monkeypatch.setattr(idempotency, "store", IdempotencyStore(ttl=60, max_entries=100, clock=clock))
+    return clock
+
+
+def test_replayed_create_returns_the_same_plan_without_a_second_row(client, db, clock):
+    uid = "idemcreate1"
+    headers = {**auth(uid), **_key("create-1")}
+    first = client.post("/api/plans", json=_plan(), headers=headers)
+    assert first.status_code == 201
+    assert REPLAY_HEADER not in first.headers
+    again = client.post("/api/plans", json=_plan(), headers=headers)
+    assert again.status_code == 201
+    assert again.headers[REPLAY_HEADER] == "true"
+    assert again.json() == first.json()
+    assert _count(db, uid) == 1
+
+
+def test_same_key_with_a_different_body_is_rejected(client, db, clock):
+    uid = "idemmismatch1"
+    headers = {**auth(uid), **_key("create-1")}
+    assert client.post("/api/plans", json=_plan(), headers=headers).status_code == 201
+    assert client.post("/api/plans", json=_plan(title="Other"), headers=headers).status_code == 422
+    assert _count(db, uid) == 1
+
+
+def test_keys_are_scoped_per_user(client, db, clock):
+    body = _plan()
+    assert client.post("/api/plans", json=body, headers={**auth("idemscopea"), **_key("shared")}).status_code == 201
+    other = client.post("/api/plans", json=body, headers={**auth("idemscopeb"), **_key("shared")})
+    assert other.status_code == 201
+    assert REPLAY_HEADER not in other.headers
+
+
+def test_replayed_conflict_comes_back_unchanged(client, db, clock):
+    uid = "idemconflict1"
+    blocking = client.post("/api/plans", json=_plan(), headers=auth(uid)).json()
+    headers = {**auth(uid), **_key("overlap")}
+    first = client.post("/api/plans", json=_plan(title="Overlap", start="09:30", end="10:30"), headers=headers)
+    assert first.status_code == 409
+    # the stored error is replayed even once the conflict is gone
+    assert client.delete(f"/api/plans/{blocking['id']}", headers=auth(uid)).status_code == 204
+    again = client.post("/api/plans", json=_plan(title="Overlap", start="09:30", end="10:30"), headers=headers)
+    assert again.status_code == 409
+    assert again.headers[REPLAY_HEADER] == "true"
+    assert again.json() == first.json()
+    assert _count(db, uid) == 0
+
+
+def test_replayed_delete_returns_204(client, db, clock):
+    uid = "idemdelete1"
+    plan_id = client.post("/api/plans", json=_plan(), headers=auth(uid)).json()["id"]
+    headers = {**auth(uid), **_key("delete-1")}
+    first = client.delete(f"/api/plans/{plan_id}", headers=headers)
+    assert first.status_code == 204
+    again = client.delete(f"/api/plans/{plan_id}", headers=headers)
+    # without the key the retry would be a 404
+    assert again.status_code == 204
+    assert again.headers[REPLAY_HEADER] == "true"
+    assert again.content == b""
+    assert client.delete(f"/api/plans/{plan_id}", headers=auth(uid)).status_code == 404
+
+
+def test_replayed_update_and_copy(client, db, clock):
+    uid = "idemupdate1"
+    plan_id = client.post("/api/plans", json=_plan(days=3), headers=auth(uid)).json()["id"]
+    headers = {**auth(uid), **_key("update-1")}
+    first = client.put(f"/api/plans/{plan_id}", json=_plan(title="Moved", days=3), headers=headers)
+    assert first.status_code == 200
+    again = client.put(f"/api/plans/{plan_id}", json=_plan(title="Moved", days=3), headers=headers)
+    assert again.headers[REPLAY_HEADER] == "true" and again.json() == first.json()
+
+    copy = {"source_start_date": _day(3), "source_end_date": _day(3), "offset_days": 1, "repeat": 2}
+    headers = {**auth(uid), **_key("copy-1")}
+    first = client.post("/api/plans/copy", json=copy, headers=headers)
+    assert first.status_code == 201 and first.json()["created"] == 2
+    again = client.post("/api/plans/copy", json=copy, headers=headers)
+    assert again.headers[REPLAY_HEADER] == "true" and again.json() == first.json()
+    assert _count(db, uid) == 3
+
+
+def test_key_expires_after_the_ttl(client, db, clock):
+    uid = "idemttl1"
+    headers = {**auth(uid), **_key("create-1")}
+    assert client.post("/api/plans", json=_plan(), headers=headers).status_code == 201
+    clock.now += 59
+    assert client.post("/api/plans", json=_plan(), headers=headers).headers.get(REPLAY_HEADER) == "true"
+    clock.now += 2
+    # the key is forgotten: the request runs again and hits the plan it created the first time
+    expired = client.post("/api/plans", json=_plan(), headers=headers)
+    assert expired.status_code == 409
+    assert REPLAY_HEADER not in expired.headers
+    assert _count(db, uid) == 1
+
+
+def test_in_flight_request_with_the_same_key_gets_409(client, clock, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_SECONDS", 0.01)
+    monkeypatch.setattr(idempotency, "_fingerprint", lambda name, kwargs: "same")
+    # the first request with this key is still running (begun, never finished)
+    idempotency.store.begin(("idemflight1", "busy"), "same")
+    r = client.post("/api/plans", json=_plan(), headers={**auth("idemflight1"), **_key("busy")})
+    assert r.status_code == 409
+
+
+def test_store_evicts_oldest_at_max_entries():
+    clock = _Clock()
+    store = IdempotencyStore(ttl=60, max_entries=2, clock=clock)
+    for key in ("a", "b", "c"):
+        assert store.begin(("u", key), "f")[1]
+    store.begin(("u", "d"), "f")
+    _, owner = store.begin(("u", "a"), "f")
+    assert owner  # "a" was evicted, so it starts over
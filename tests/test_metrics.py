@@ -0,0 +1,72 @@
+import re
+from uuid import uuid4
+
+import pytest
+
+from conftest import auth
+from flow7_core import metrics
+from flow7_core.metrics import Counter, Histogram, _Metric
+
+
+def _scrape(client) -> str:
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"] == metrics.CONTENT_TYPE
+    return r.text
+
+
+def _sample(text: str, name: str, **labels) -> float:
+    """Value of the sample `name` whose labels include `labels`."""
+    for line in text.splitlines():
+        if line.startswith(name + "{") or line.startswith(name + " "):
+            if all(f'{k}="{v}"' in line for k, v in labels.items()):
+                return float(line.rsplit(" ", 1)[1].replace("+Inf", "inf"))
+    raise AssertionError(f"no sample {name} {labels}")
+
+
+def test_metric_base_is_abstract():
+    with pytest.raises(TypeError):
+        _Metric("flow7_test_abstract", "never registered")
+
+
+def test_requests_are_labelled_by_route_template(client):
+    plan_id = str(uuid4())
+    before = _scrape(client)
+    try:
+        seen = _sample(before, "flow7_http_requests_total", method="DELETE", route="/api/plans/{plan_id}", status="404")
+    except AssertionError:
+        seen = 0.0
+    assert client.delete(f"/api/plans/{plan_id}", headers=auth("metricsuser1")).status_code == 404
+
+    text = _scrape(client)
+    assert plan_id not in text
+    assert _sample(text, "flow7_http_requests_total", method="DELETE", route="/api/plans/{plan_id}", status="404") == seen + 1
+    labels = {"method": "DELETE", "route": "/api/plans/{plan_id}"}
+    buckets = [line for line in text.splitlines()
+               if line.startswith("flow7_http_request_duration_seconds_bucket{") and all(f'{k}="{v}"' in line for k, v in labels.items())]
+    assert len(buckets) == len(metrics.DEFAULT_BUCKETS) + 1
+    assert 'le="+Inf"' in buckets[-1]
+    counts = [float(line.rsplit(" ", 1)[1]) for line in buckets]
+    assert counts == sorted(counts)  # cumulative
+    count = _sample(text, "flow7_http_request_duration_seconds_count", **labels)
+    assert counts[-1] == count >= 1
+    assert _sample(text, "flow7_http_request_duration_seconds_sum", **labels) > 0
+    assert "# TYPE flow7_http_request_duration_seconds histogram" in text
+
+
+def test_label_values_are_escaped(client, monkeypatch):
+    # metrics created here register on a copy of the registry, dropped after the test
+    monkeypatch.setattr(metrics, "_REGISTRY", list(metrics._REGISTRY))
+    counter = Counter("flow7_test_escaped_total", "Label escaping.", ("value",))
+    counter.inc(value='say "hi"\\now\nnext')
+    hist = Histogram("flow7_test_escaped_seconds", "Label escaping.", ("path",), buckets=(1.0,))
+    hist.observe(0.5, path='a"b')
+
+    text = _scrape(client)
+    assert 'flow7_test_escaped_total{value="say \\"hi\\"\\\\now\\nnext"} 1' in text
+    assert 'flow7_test_escaped_seconds_bucket{path="a\\"b",le="1"} 1' in text
+    assert 'flow7_test_escaped_seconds_bucket{path="a\\"b",le="+Inf"} 1' in text
+    assert 'flow7_test_escaped_seconds_sum{path="a\\"b"} 0.5' in text
+    # every sample is one line: name{labels} value
+    sample = re.compile(r'^[a-z_:][a-z0-9_:]*(\{([a-z_]+="([^"\\]|\\.)*",?)*\})? \S+$')
+    assert all(sample.match(line) for line in text.splitlines() if line and not line.startswith("#"))
@@ -0,0 +1,84 @@
+from datetime import date, datetime, time, timedelta, timezone
+
+from conftest import auth
+from flow7_core.models import PlanOccupancy
+from flow7_core.occupancy import (
+    BITMAP_BYTES, FULL_DAY, MINUTES_PER_DAY, free_windows, from_bytes, load_range, plan_bitmaps, plan_mask, span_mask, to_bytes,
+)
+
+
+def test_span_mask_covers_half_open_range():
+    assert span_mask(2, 5) == 0b11100
+    assert span_mask(5, 5) == 0
+    assert span_mask(6, 5) == 0
+    assert span_mask(0, MINUTES_PER_DAY) == FULL_DAY
+
+
+def test_plan_mask_uses_minutes_of_day():
+    mask = plan_mask(time(9, 0), time(9, 30))
+    assert mask == span_mask(540, 570)
+    assert bin(mask).count("1") == 30
+    # plans without an end occupy nothing
+    assert plan_mask(time(9, 0), None) == 0
+
+
+def test_bitmap_bytes_round_trip():
+    bitmap = span_mask(0, 1) | span_mask(600, 660) | span_mask(1439, 1440)
+    raw = to_bytes(bitmap)
+    assert len(raw) == BITMAP_BYTES
+    assert from_bytes(raw) == bitmap
+    assert from_bytes(to_bytes(FULL_DAY)) == FULL_DAY
+
+
+def test_free_windows_of_empty_and_full_day():
+    assert free_windows(0, 30) == [(0, MINUTES_PER_DAY)]
+    assert free_windows(FULL_DAY, 1) == []
+
+
+def test_free_windows_respects_duration_and_bounds():
+    busy = span_mask(540, 600) | span_mask(630, 660)  # 09:00-10:00, 10:30-11:00
+    # 10:00-10:30 is too short for an hour
+    assert free_windows(busy, 60, earliest=480, latest=720) == [(480, 540), (660, 720)]
+    assert free_windows(busy, 30, earliest=480, latest=720) == [(480, 540), (600, 630), (660, 720)]
+    assert free_windows(busy, 61, earliest=480, latest=600) == []
+
+
+def test_free_windows_exact_fit():
+    busy = span_mask(0, 100) | span_mask(145, MINUTES_PER_DAY)
+    assert free_windows(busy, 45) == [(100, 145)]
+    assert free_windows(busy, 46) == []
+
+
+def _stored(db, uid, day):
+    row = db.get(PlanOccupancy, (uid, day))
+    return from_bytes(row.bitmap) if row is not None else None
+
+
+def test_plan_writes_keep_stored_bitmap_in_sync(client, db):
+    uid = "occupancyuser1"
+    day = datetime.now(timezone.utc).date() + timedelta(days=3)
+    other = day + timedelta(days=1)
+    first = client.post("/api/plans", json={"title": "a", "date": day.isoformat(), "start_time": "09:00", "end_time": "10:00"}, headers=auth(uid))
+    assert first.status_code == 201
+    second = client.post("/api/plans", json={"title": "b", "date": day.isoformat(), "start_time": "09:30", "end_time": "11:00"}, headers=auth(uid))
+    # overlapping plans are rejected by the conflict check
+    assert second.status_code == 409
+    second = client.post("/api/plans", json={"title": "b", "date": day.isoformat(), "start_time": "13:00", "end_time": "14:00"}, headers=auth(uid))
+    assert second.status_code == 201
+    assert _stored(db, uid, day) == span_mask(540, 600) | span_mask(780, 840) == plan_bitmaps(db, uid, [day])[day]
+
+    # moving a plan to another day rebuilds both days
+    moved = client.put(f"/api/plans/{second.json()['id']}", json={"title": "b", "date": other.isoformat(), "start_time": "13:00", "end_time": "14:00"}, headers=auth(uid))
+    assert moved.status_code == 200
+    db.expire_all()
+    assert _stored(db, uid, day) == span_mask(540, 600)
+    assert _stored(db, uid, other) == span_mask(780, 840)
+
+    assert client.delete(f"/api/plans/{first.json()['id']}", headers=auth(uid)).status_code in (200, 204)
+    db.expire_all()
+    assert _stored(db, uid, day) == 0
+
+
+def test_load_range_fills_days_without_rows(db):
+    bitmaps = load_range(db, "occupancynobody", date(2030, 1, 1), date(2030, 1, 3))
+    assert bitmaps == {date(2030, 1, 1): 0, date(2030, 1, 2): 0, date(2030, 1, 3): 0}
@@ -0,0 +1,118 @@
+import base64
+import csv
+import io
+import json
+from datetime import date, datetime, time, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+
+from conftest import auth
+from flow7_core.export import decode_cursor, encode_cursor
+from flow7_core.models import PlanArchiveORM, PlanORM
+from flow7_core.retention import compact_plans
+
+OLD_DAY = date(2020, 5, 4)  # before the retention cutoff: listing reads plans UNION ALL plans_archive
+
+
+def _future_day():
+    return datetime.now(timezone.utc).date() + timedelta(days=4)
+
+
+def _add(db, uid, plan_id, day, start, end, notified=False):
+    db.add(PlanORM(id=plan_id, user_id=uid, date=day, start_time=start, end_time=end, title=plan_id, notified=notified))
+
+
+def test_cursor_round_trip():
+    plan = PlanORM(id="plan-1", date=date(2030, 1, 2), start_time=time(9, 30))
+    cursor = encode_cursor(plan)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (date(2030, 1, 2), time(9, 30), "plan-1")
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-a-cursor",
+    base64.urlsafe_b64encode(b'["2030-01-02","09:30"]').decode(),
+    base64.urlsafe_b64encode(b'["2030-13-02","09:30","x"]').decode(),
+    "",
+])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize("day", [_future_day(), OLD_DAY], ids=["live", "with-archive"])
+def test_pages_split_plans_with_the_same_start_by_id(client, db, day):
+    uid = f"pageties{day:%Y}"
+    # four plans; three share (date, start_time) and are ordered by id only
+    ids = [f"{uid}-b", f"{uid}-a", f"{uid}-c"]
+    for plan_id in ids:
+        _add(db, uid, plan_id, day, time(9, 0), time(10, 0))
+    _add(db, uid, f"{uid}-0", day, time(8, 0), time(9, 0))
+    db.commit()
+    params = {"start_date": day.isoformat(), "end_date": day.isoformat(), "limit": 2}
+
+    first = client.get("/api/plans", params=params, headers=auth(uid))
+    assert first.status_code == 200
+    assert [p["id"] for p in first.json()] == [f"{uid}-0", f"{uid}-a"]
+    cursor = first.headers["X-Next-Cursor"]
+    assert decode_cursor(cursor) == (day, time(9, 0), f"{uid}-a")
+
+    second = client.get("/api/plans", params={**params, "cursor": cursor}, headers=auth(uid))
+    assert [p["id"] for p in second.json()] == [f"{uid}-b", f"{uid}-c"]
+    # exactly `limit` rows left: the last page carries no cursor
+    assert "X-Next-Cursor" not in second.headers
+
+    # the pages add up to the unpaginated list
+    everything = client.get("/api/plans", params={"start_date": day.isoformat(), "end_date": day.isoformat()}, headers=auth(uid))
+    assert [p["id"] for p in everything.json()] == [p["id"] for p in first.json() + second.json()]
+    assert "X-Next-Cursor" not in everything.headers
+
+
+def test_tampered_cursor_is_a_400(client, db):
+    uid = "pagetamper1"
+    day = _future_day()
+    for n in range(3):
+        _add(db, uid, f"{uid}-{n}", day, time(9 + n, 0), time(9 + n, 30))
+    db.commit()
+    params = {"start_date": day.isoformat(), "end_date": day.isoformat(), "limit": 1}
+    cursor = client.get("/api/plans", params=params, headers=auth(uid)).headers["X-Next-Cursor"]
+
+    for bad in (cursor[:-3], cursor[:5] + "!!" + cursor[7:], "Zm9v"):
+        r = client.get("/api/plans", params={**params, "cursor": bad}, headers=auth(uid))
+        assert r.status_code == 400, bad
+
+
+@pytest.fixture
+def archived(db):
+    """A new user with one live plan and two plans compacted into plans_archive."""
+    uid = f"pageexport{uuid4().hex[:8]}"
+    _add(db, uid, f"{uid}-old-1", OLD_DAY, time(9, 0), time(10, 0), notified=True)
+    _add(db, uid, f"{uid}-old-2", OLD_DAY + timedelta(days=1), time(7, 30), time(8, 0), notified=True)
+    _add(db, uid, f"{uid}-live", _future_day(), time(12, 0), time(13, 0))
+    db.commit()
+    assert compact_plans() >= 2
+    assert db.query(PlanArchiveORM).filter(PlanArchiveORM.user_id == uid).count() == 2
+    return uid
+
+
+def test_ndjson_export_includes_archived_plans(client, archived):
+    r = client.get("/api/plans/export", params={"format": "ndjson"}, headers=auth(archived))
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [row["id"] for row in rows] == [f"{archived}-old-1", f"{archived}-old-2", f"{archived}-live"]
+    assert rows[0]["notified"] is True and rows[0]["end_time"] == "10:00"
+
+    # a range after the cutoff reads the live table only
+    r = client.get("/api/plans/export", params={"start_date": _future_day().isoformat()}, headers=auth(archived))
+    assert [json.loads(line)["id"] for line in r.text.splitlines()] == [f"{archived}-live"]
+
+
+def test_csv_export_includes_archived_plans(client, archived):
+    r = client.get("/api/plans/export", params={"format": "csv", "end_date": "2020-12-31"}, headers=auth(archived))
+    assert r.status_code == 200
+    assert r.headers["content-disposition"] == 'attachment; filename="flow7-plans.csv"'
+    rows = list(csv.DictReader(io.StringIO(r.text)))
+    assert [row["id"] for row in rows] == [f"{archived}-old-1", f"{archived}-old-2"]
+    assert rows[1]["start_time"] == "07:30" and rows[1]["notified"] == "True"
@@ -0,0 +1,107 @@
+from types import SimpleNamespace
+
+import pytest
+
+from flow7_core import notifications
+from flow7_core.devices import register_device_token, user_tokens
+from flow7_core.notifications import _deliver, _send_batch
+from flow7_core.push import THROTTLED, UNAVAILABLE, UNREGISTERED, FaultProfile, InMemoryTransport, PushTransport, set_transport
+
+BACKOFF = 1.5
+
+
+class _Sleeps(list):
+    """Records _send_batch's backoff sleeps instead of sleeping; `then` runs after each one."""
+
+    def __init__(self, then=None):
+        super().__init__()
+        self.then = then
+
+    def __call__(self, seconds):
+        self.append(seconds)
+        if self.then:
+            self.then()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    recorded = _Sleeps()
+    monkeypatch.setattr(notifications, "time_module", SimpleNamespace(sleep=recorded))
+    monkeypatch.setattr(notifications, "FIREBASE_SEND_RETRIES", 2)
+    monkeypatch.setattr(notifications, "FIREBASE_SEND_BACKOFF", BACKOFF)
+    return recorded
+
+
+def _send(transport, tokens):
+    return _send_batch(transport, "pushuser", tokens, "title", "body", {"type": "plan_notification"})
+
+
+def test_push_transport_is_abstract():
+    with pytest.raises(TypeError):
+        PushTransport()
+
+
+def test_transient_failures_are_retried_and_permanent_ones_are_not(sleeps):
+    faults = FaultProfile(token_errors={"flaky-1": UNAVAILABLE, "gone-1": UNREGISTERED})
+    transport = InMemoryTransport(faults)
+    sleeps.then = faults.token_errors.clear  # the provider recovers during the backoff
+
+    result = _send(transport, ["ok-1", "flaky-1", "gone-1"])
+    assert transport.calls == 2
+    assert sleeps == [BACKOFF]
+    assert result.success_count == 2
+    assert result.errors == {"gone-1": UNREGISTERED}
+    assert sorted(m["token"] for m in transport.messages) == ["flaky-1", "ok-1"]
+
+
+def test_backoff_doubles_until_the_retries_run_out(sleeps):
+    transport = InMemoryTransport(FaultProfile(token_errors={"flaky-*": UNAVAILABLE}))
+    result = _send(transport, ["flaky-1", "flaky-2", "ok-1"])
+    assert transport.calls == 3
+    assert sleeps == [BACKOFF, BACKOFF * 2]
+    assert result.success_count == 1
+    assert result.errors == {"flaky-1": UNAVAILABLE, "flaky-2": UNAVAILABLE}
+
+
+def test_provider_retry_after_wins_over_a_shorter_backoff(sleeps):
+    faults = FaultProfile(throttle_rate=1.0, retry_after=5.0)
+    transport = InMemoryTransport(faults)
+    result = _send(transport, ["ok-1", "ok-2"])
+    assert sleeps == [5.0, 5.0]
+    assert result.errors == {"ok-1": THROTTLED, "ok-2": THROTTLED}
+    assert transport.messages == []
+
+
+def test_transport_exception_counts_as_unavailable(sleeps):
+    class Broken(InMemoryTransport):
+        def send_multicast(self, tokens, title, body, data):
+            if not sleeps:
+                raise ConnectionError("provider down")
+            return super().send_multicast(tokens, title, body, data)
+
+    transport = Broken()
+    result = _send(transport, ["ok-1"])
+    assert sleeps == [BACKOFF]
+    assert result.success_count == 1 and result.errors == {}
+
+
+@pytest.fixture
+def transport():
+    memory = InMemoryTransport(FaultProfile(token_errors={"prune-gone-*": UNREGISTERED, "prune-flaky-*": UNAVAILABLE}))
+    set_transport(memory)
+    yield memory
+    set_transport(None)
+
+
+def test_deliver_prunes_unregistered_tokens_only(db, transport, sleeps):
+    uid = "pushpruneuser1"
+    tokens = ["prune-ok-1", "prune-gone-1", "prune-flaky-1", "prune-gone-2"]
+    for token in tokens:
+        register_device_token(db, uid, token, "android")
+    assert sorted(user_tokens(uid)) == sorted(tokens)
+
+    result = _deliver([uid], tokens, "title", "body", {})
+    assert result.success_count == 1
+    assert result.errors == {"prune-gone-1": UNREGISTERED, "prune-flaky-1": UNAVAILABLE, "prune-gone-2": UNREGISTERED}
+    # unregistered tokens are deleted (and the cached list dropped); a transient failure keeps its token
+    assert sorted(user_tokens(uid)) == ["prune-flaky-1", "prune-ok-1"]
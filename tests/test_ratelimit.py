@@ -0,0 +1,105 @@
+import math
+
+import pytest
+from fastapi import HTTPException
+
+from conftest import auth
+from flow7_core import ratelimit
+from flow7_core.config import RATE_LIMIT_BURST, RATE_LIMIT_PER_MINUTE
+from flow7_core.ratelimit import InMemoryRateLimitBackend, RateLimitBackend, enforce_rate_limit, tier_multiplier
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        RateLimitBackend()
+
+
+def test_bucket_starts_full_and_refills_at_rate(clock):
+    backend = InMemoryRateLimitBackend(clock=clock)
+    for _ in range(3):
+        assert backend.take("k", rate=0.5, burst=3) == (True, 0.0)
+    allowed, retry_after = backend.take("k", rate=0.5, burst=3)
+    assert not allowed and retry_after == pytest.approx(2.0)
+    clock.now += 1.0  # half a token
+    allowed, retry_after = backend.take("k", rate=0.5, burst=3)
+    assert not allowed and retry_after == pytest.approx(1.0)
+    clock.now += 1.0
+    assert backend.take("k", rate=0.5, burst=3)[0]
+    # a long idle period refills to the burst, not beyond
+    clock.now += 3600
+    assert all(backend.take("k", rate=0.5, burst=3)[0] for _ in range(3))
+    assert not backend.take("k", rate=0.5, burst=3)[0]
+
+
+def test_cost_above_the_tokens_left_is_refused_whole(clock):
+    backend = InMemoryRateLimitBackend(clock=clock)
+    assert backend.take("k", rate=1.0, burst=5, cost=4)[0]
+    allowed, retry_after = backend.take("k", rate=1.0, burst=5, cost=3)
+    assert not allowed and retry_after == pytest.approx(2.0)
+    assert backend.take("k", rate=1.0, burst=5, cost=1)[0]  # the refused take spent nothing
+
+
+def test_keys_are_bounded_least_recently_used_first(clock):
+    backend = InMemoryRateLimitBackend(max_keys=2, clock=clock)
+    backend.take("a", rate=0.0, burst=1)
+    backend.take("b", rate=0.0, burst=1)
+    assert not backend.take("a", rate=0.0, burst=1)[0]  # a is now the most recently used
+    backend.take("c", rate=0.0, burst=1)
+    assert len(backend) == 2
+    # a kept its empty bucket; b was evicted and comes back full
+    assert backend.take("a", rate=0.0, burst=1) == (False, float("inf"))
+    assert backend.take("b", rate=0.0, burst=1)[0]
+    assert len(backend) == 2
+
+
+def test_tier_multipliers_are_a_bounded_table():
+    assert tier_multiplier(None) == tier_multiplier("FREE") == 1.0
+    assert tier_multiplier("UNKNOWN") == 1.0
+    assert 1.0 < tier_multiplier("PRO") < tier_multiplier("ULTRA") <= 4.0
+
+
+@pytest.fixture
+def limited(monkeypatch, clock):
+    backend = InMemoryRateLimitBackend(clock=clock)
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit, "_backend", backend)
+    return backend
+
+
+def test_enforce_raises_429_with_retry_after(limited):
+    for _ in range(int(RATE_LIMIT_BURST)):
+        enforce_rate_limit("ratelimitfree1", "FREE")
+    with pytest.raises(HTTPException) as exc:
+        enforce_rate_limit("ratelimitfree1", "FREE")
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == str(max(1, math.ceil(60 / RATE_LIMIT_PER_MINUTE)))
+    # scopes and tiers have their own buckets
+    enforce_rate_limit("ratelimitfree1", "FREE", scope="other")
+    for _ in range(int(RATE_LIMIT_BURST * tier_multiplier("ULTRA"))):
+        enforce_rate_limit("ratelimitultra1", "ULTRA")
+    with pytest.raises(HTTPException):
+        enforce_rate_limit("ratelimitultra1", "ULTRA")
+
+
+def test_api_returns_429_once_the_bucket_is_empty(client, limited, clock):
+    h = auth("ratelimitapi1")
+    statuses = [client.get("/user/profile/", headers=h).status_code for _ in range(int(RATE_LIMIT_BURST))]
+    assert statuses == [200] * int(RATE_LIMIT_BURST)
+    r = client.get("/user/profile/", headers=h)
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) >= 1
+    clock.now += 60.0 / RATE_LIMIT_PER_MINUTE
+    assert client.get("/user/profile/", headers=h).status_code == 200
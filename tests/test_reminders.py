@@ -0,0 +1,72 @@
+from datetime import date, datetime, time, timezone
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from flow7_core.reminders import (
+    ALL_REMINDERS_MASK, DEFAULT_REMINDER_MASK, REMINDER_SLOTS, effective_mask, mask_from_names, names_from_mask,
+    pending_reminders, reminder_name, reminder_times,
+)
+
+UTC = timezone.utc
+
+
+def test_slot_bits_follow_slot_order():
+    assert mask_from_names(["start"]) == 1
+    assert mask_from_names(["start-5m"]) == 2
+    assert mask_from_names(["end"]) == 1 << (len(REMINDER_SLOTS) - 1)
+    assert ALL_REMINDERS_MASK == mask_from_names(name for name, _, _ in REMINDER_SLOTS)
+
+
+def test_names_and_mask_round_trip():
+    mask = mask_from_names([" start-1h", "start", "end "])
+    assert names_from_mask(mask) == ["start", "start-1h", "end"]
+    assert mask_from_names(names_from_mask(mask)) == mask
+    assert names_from_mask(0) == []
+
+
+def test_unknown_reminder_name_is_rejected():
+    with pytest.raises(ValueError):
+        mask_from_names(["start", "start-3m"])
+
+
+def test_reminder_name_of_bit():
+    for i, (name, _, _) in enumerate(REMINDER_SLOTS):
+        assert reminder_name(1 << i) == name
+
+
+def test_effective_mask_prefers_plan_then_user_then_default():
+    assert effective_mask(4, 8) == 4
+    # an explicit empty plan mask means "no reminders", not "use the default"
+    assert effective_mask(0, 8) == 0
+    assert effective_mask(None, 8) == 8
+    assert effective_mask(None, None) == DEFAULT_REMINDER_MASK
+
+
+def test_reminder_times_are_utc_and_ordered():
+    mask = mask_from_names(["end", "start", "start-1d", "start-10m"])
+    times = reminder_times(date(2030, 1, 2), time(9, 0), time(10, 0), mask, ZoneInfo("Europe/Istanbul"))
+    assert [(reminder_name(bit), when) for bit, when in times] == [
+        ("start-1d", datetime(2030, 1, 1, 6, 0, tzinfo=UTC)),
+        ("start-10m", datetime(2030, 1, 2, 5, 50, tzinfo=UTC)),
+        ("start", datetime(2030, 1, 2, 6, 0, tzinfo=UTC)),
+        ("end", datetime(2030, 1, 2, 7, 0, tzinfo=UTC)),
+    ]
+
+
+def test_end_reminder_is_skipped_without_end_time():
+    mask = mask_from_names(["start", "end"])
+    times = reminder_times(date(2030, 1, 2), time(9, 0), None, mask, ZoneInfo("UTC"))
+    assert [reminder_name(bit) for bit, _ in times] == ["start"]
+
+
+def test_pending_reminders_skip_notified_bits():
+    mask = mask_from_names(["start-1h", "start", "end"])
+    plan = SimpleNamespace(date=date(2030, 1, 2), start_time=time(9, 0), end_time=time(10, 0),
+                           notified_mask=mask_from_names(["start-1h"]))
+    assert [reminder_name(bit) for bit, _ in pending_reminders(plan, mask, ZoneInfo("UTC"))] == ["start", "end"]
+    plan.notified_mask = None
+    assert len(pending_reminders(plan, mask, ZoneInfo("UTC"))) == 3
+    plan.notified_mask = mask
+    assert pending_reminders(plan, mask, ZoneInfo("UTC")) == []
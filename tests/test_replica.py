@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from conftest import auth
+from flow7_core import db as db_module
+from flow7_core.config import REPLICA_STICKY_SECONDS
+from flow7_core.db import Base
+from flow7_core.models import UserSettings
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def replica(schema, tmp_path, monkeypatch):
+    """A second SQLite file as the replica. Replication is never run, so it stays behind the primary
+    and a response shows which database served it."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    clock = _Clock()
+    monkeypatch.setattr(db_module, "ReplicaSessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    monkeypatch.setattr(db_module, "time", SimpleNamespace(monotonic=clock))
+    monkeypatch.setattr(db_module, "_STICKY_USERS", type(db_module._STICKY_USERS)())
+    yield SimpleNamespace(engine=engine, clock=clock)
+    engine.dispose()
+
+
+def test_plan_list_reads_the_primary_until_the_sticky_window_ends(client, replica):
+    uid = "replicaplans1"
+    h = auth(uid)
+    day = (datetime.now(timezone.utc).date() + timedelta(days=4)).isoformat()
+    params = {"start_date": day, "end_date": day}
+
+    assert client.get("/api/plans", params=params, headers=h).json() == []
+    r = client.post("/api/plans", json={"title": "Fresh", "date": day, "start_time": "09:00", "end_time": "10:00"}, headers=h)
+    assert r.status_code == 201
+    # right after the write: the primary, which has the plan
+    assert [p["title"] for p in client.get("/api/plans", params=params, headers=h).json()] == ["Fresh"]
+    replica.clock.now += REPLICA_STICKY_SECONDS - 0.1
+    assert len(client.get("/api/plans", params=params, headers=h).json()) == 1
+    # past the window: the replica, which has not caught up
+    replica.clock.now += 0.2
+    assert client.get("/api/plans", params=params, headers=h).json() == []
+
+
+def test_profile_follows_the_same_rule(client, replica):
+    uid = "replicaprofile1"
+    h = auth(uid)
+    # an existing user, replicated before the write (a first request would create the settings on the
+    # primary and pin the user); Core inserts, so the seeding itself pins nobody
+    for engine in (db_module.engine, replica.engine):
+        with engine.begin() as conn:
+            conn.execute(UserSettings.__table__.insert().values(uid=uid, timezone="UTC", theme="LIGHT"))
+
+    assert client.get("/user/profile/", headers=h).json()["theme_preference"] == "LIGHT"
+    assert client.put("/user/theme/", json={"theme": "DARK"}, headers=h).status_code == 200
+    assert client.get("/user/profile/", headers=h).json()["theme_preference"] == "DARK"
+    replica.clock.now += REPLICA_STICKY_SECONDS + 0.1
+    assert client.get("/user/profile/", headers=h).json()["theme_preference"] == "LIGHT"
@@ -0,0 +1,105 @@
+import json
+from datetime import date, datetime, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+
+from conftest import auth
+from flow7_core.config import PLAN_RETENTION_DAYS
+from flow7_core.models import PlanArchiveORM, PlanORM
+from flow7_core.retention import archive_cutoff, compact_plans, range_reaches_archive
+
+OLD_DAY = date(2020, 6, 1)
+
+
+def _plan(day, start, end, title="old"):
+    return {"title": title, "date": day.isoformat(), "start_time": start, "end_time": end}
+
+
+def _create(client, uid, day, start, end):
+    r = client.post("/api/plans", json=_plan(day, start, end), headers=auth(uid))
+    assert r.status_code == 201, r.text
+    return r.json()["id"]
+
+
+def _notified(db, *ids):
+    db.execute(PlanORM.__table__.update().where(PlanORM.id.in_(ids)).values(notified=True))
+    db.commit()
+
+
+def _where(db, plan_id):
+    db.expire_all()
+    if db.get(PlanORM, plan_id) is not None:
+        return "plans"
+    if db.get(PlanArchiveORM, plan_id) is not None:
+        return "archive"
+    return None
+
+
+@pytest.fixture
+def compacted(client, db):
+    """Two notified plans of a new user past the cutoff, compacted, plus a pending one that stays live."""
+    uid = f"retention{uuid4().hex[:8]}"
+    archived = [_create(client, uid, OLD_DAY, "09:00", "10:00"), _create(client, uid, OLD_DAY, "11:00", "12:00")]
+    pending = _create(client, uid, OLD_DAY, "14:00", "15:00")
+    _notified(db, *archived)
+    assert compact_plans() >= 2
+    assert [_where(db, i) for i in archived + [pending]] == ["archive", "archive", "plans"]
+    return uid, archived, pending
+
+
+def test_cutoff_follows_the_retention_window():
+    assert archive_cutoff(date(2030, 6, 1)) == date(2030, 6, 1) - timedelta(days=PLAN_RETENTION_DAYS)
+    assert range_reaches_archive(None)
+    assert range_reaches_archive(date(2000, 1, 1))
+    assert not range_reaches_archive(datetime.now(timezone.utc).date())
+
+
+def test_only_old_notified_plans_are_compacted(client, db):
+    uid = "retentionuser2"
+    recent = datetime.now(timezone.utc).date() - timedelta(days=1)
+    plan_ids = [_create(client, uid, recent, "09:00", "10:00"), _create(client, uid, OLD_DAY, "09:00", "10:00")]
+    _notified(db, *plan_ids)
+    compact_plans()
+    assert [_where(db, i) for i in plan_ids] == ["plans", "archive"]
+
+
+def test_compacted_plans_are_still_listed_and_exported(client, compacted):
+    uid, archived, pending = compacted
+    params = {"start_date": OLD_DAY.isoformat(), "end_date": OLD_DAY.isoformat()}
+    listed = client.get("/api/plans", params=params, headers=auth(uid)).json()
+    assert [p["id"] for p in listed] == archived + [pending]
+
+    r = client.get("/api/plans/export", params={**params, "format": "ndjson"}, headers=auth(uid))
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [row["id"] for row in rows] == archived + [pending]
+    assert [row["notified"] for row in rows] == [True, True, False]
+
+
+def test_put_on_an_archived_plan_restores_it(client, db, compacted):
+    uid, archived, _ = compacted
+    r = client.put(f"/api/plans/{archived[0]}", json=_plan(OLD_DAY, "09:00", "10:30", title="edited"), headers=auth(uid))
+    assert r.status_code == 200, r.text
+    assert r.json()["title"] == "edited" and r.json()["end_time"] == "10:30"
+    assert _where(db, archived[0]) == "plans"
+    assert _where(db, archived[1]) == "archive"
+    listed = client.get("/api/plans", params={"start_date": OLD_DAY.isoformat(), "end_date": OLD_DAY.isoformat()}, headers=auth(uid)).json()
+    assert [p["title"] for p in listed if p["id"] == archived[0]] == ["edited"]
+    assert len(listed) == 3  # in one table only
+
+
+def test_put_on_another_users_archived_plan_leaves_it_archived(client, db, compacted):
+    _, archived, _ = compacted
+    r = client.put(f"/api/plans/{archived[0]}", json=_plan(OLD_DAY, "09:00", "10:00"), headers=auth("retentionintruder"))
+    assert r.status_code == 403
+    assert _where(db, archived[0]) == "archive"
+
+
+def test_delete_on_an_archived_plan_deletes_it(client, db, compacted):
+    uid, archived, pending = compacted
+    assert client.delete(f"/api/plans/{archived[1]}", headers=auth("retentionintruder")).status_code == 403
+    assert client.delete(f"/api/plans/{archived[1]}", headers=auth(uid)).status_code == 204
+    assert _where(db, archived[1]) is None
+    assert client.delete(f"/api/plans/{archived[1]}", headers=auth(uid)).status_code == 404
+    listed = client.get("/api/plans", params={"start_date": OLD_DAY.isoformat(), "end_date": OLD_DAY.isoformat()}, headers=auth(uid)).json()
+    assert [p["id"] for p in listed] == [archived[0], pending]
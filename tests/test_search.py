@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+
+from conftest import auth
+from flow7_core.search import document_text, tokenize
+
+
+def test_tokenize_folds_case_and_accents():
+    assert tokenize("Café İstanbul, ÇAĞRI straße—x2") == ["cafe", "istanbul", "cagri", "strasse", "x2"]
+    assert tokenize("") == []
+    assert tokenize(None) == []
+
+
+def test_tokenize_keeps_marks_of_indic_scripts():
+    # the vowel signs are part of the word in Devanagari; dropping them would merge different words
+    assert tokenize("हिन्दी बैठक") == ["हिन्दी", "बैठक"]
+
+
+def test_document_text_joins_title_and_description():
+    assert document_text("Team Sync", "Room 4") == "team sync room 4"
+    assert document_text("Team", None) == "team"
+
+
+def _create(client, uid, title, start="10:00", end="11:00", description=None):
+    day = (datetime.now(timezone.utc).date() + timedelta(days=2)).isoformat()
+    payload = {"title": title, "date": day, "start_time": start, "end_time": end}
+    if description is not None:
+        payload["description"] = description
+    r = client.post("/api/plans", json=payload, headers=auth(uid))
+    assert r.status_code == 201, r.text
+    return r.json()["id"]
+
+
+def _search(client, uid, q):
+    r = client.get("/api/plans/search", params={"q": q}, headers=auth(uid))
+    assert r.status_code == 200, r.text
+    return [p["title"] for p in r.json()]
+
+
+def test_search_matches_prefixes_of_every_term(client):
+    uid = "searchterms1"
+    _create(client, uid, "Café İstanbul meeting", description="quarterly review")
+    _create(client, uid, "Dentist", start="12:00", end="13:00")
+    assert _search(client, uid, "istan") == ["Café İstanbul meeting"]
+    assert _search(client, uid, "cafe quarter") == ["Café İstanbul meeting"]
+    assert _search(client, uid, "cafe dentist") == []
+
+
+def test_search_does_not_leak_between_users_whose_ids_tokenize_alike(client):
+    # FTS5 case-folds the user_id column: "searchleak" and "SEARCHLEAK" are the same term there
+    _create(client, "searchleak", "Private salary talk")
+    assert _search(client, "searchleak", "salary") == ["Private salary talk"]
+    assert _search(client, "SEARCHLEAK", "salary") == []
+    assert _search(client, "Searchleak", "private") == []
+
+
+def test_search_follows_updates_and_deletes(client):
+    uid = "searchedits1"
+    plan_id = _create(client, uid, "Gym")
+    day = (datetime.now(timezone.utc).date() + timedelta(days=2)).isoformat()
+    r = client.put(f"/api/plans/{plan_id}", json={"title": "Swimming", "date": day, "start_time": "10:00", "end_time": "11:00"}, headers=auth(uid))
+    assert r.status_code == 200, r.text
+    assert _search(client, uid, "gym") == []
+    assert _search(client, uid, "swim") == ["Swimming"]
+    assert client.delete(f"/api/plans/{plan_id}", headers=auth(uid)).status_code in (200, 204)
+    assert _search(client, uid, "swim") == []
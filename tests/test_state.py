@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+from conftest import auth
+from flow7_core import scheduler
+from flow7_core.state import SESSION_TIMEZONES, USER_SUBSCRIPTIONS, BoundedTTLStore, purge_expired_state
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+def test_entries_expire_after_their_ttl(clock):
+    store = BoundedTTLStore("test_expiry", max_entries=10, ttl=30, clock=clock)
+    store["a"] = 1
+    clock.now += 10
+    store["b"] = 2
+    clock.now += 20  # a is due, b has 10s left
+    assert "a" not in store
+    assert store["b"] == 2
+    with pytest.raises(KeyError):
+        store["a"]
+    clock.now += 10
+    assert store.get("b") is None
+    assert len(store) == 0
+
+
+def test_resetting_a_key_restarts_its_ttl(clock):
+    store = BoundedTTLStore("test_reset", max_entries=10, ttl=30, clock=clock)
+    store["a"] = 1
+    clock.now += 20
+    store["a"] = 2
+    clock.now += 20  # the first heap item is due but stale
+    assert store["a"] == 2
+    clock.now += 10
+    assert "a" not in store
+
+
+def test_per_key_ttl_overrides_the_default(clock):
+    store = BoundedTTLStore("test_ttl_override", max_entries=10, ttl=30, clock=clock)
+    store.set("short", 1, ttl=5)
+    store.set("long", 2, ttl=300)
+    store["default"] = 3
+    clock.now += 6
+    assert "short" not in store
+    clock.now += 30
+    assert "default" not in store
+    assert store["long"] == 2
+
+
+def test_entries_without_ttl_never_expire(clock):
+    store = BoundedTTLStore("test_no_ttl", max_entries=10, clock=clock)
+    store["a"] = 1
+    clock.now += 10 ** 9
+    assert store["a"] == 1
+
+
+def test_least_recently_used_entry_is_evicted_at_max_entries(clock):
+    store = BoundedTTLStore("test_lru", max_entries=3, clock=clock)
+    for key in "abc":
+        store[key] = key
+    assert store["a"] == "a"  # a is now the most recently used
+    store["d"] = "d"
+    assert len(store) == 3
+    assert "b" not in store
+    assert [k for k in "acd" if k in store] == ["a", "c", "d"]
+
+
+def test_on_expire_runs_for_expired_entries_only(clock):
+    expired = []
+    store = BoundedTTLStore("test_on_expire", max_entries=2, ttl=10, on_expire=lambda k, v: expired.append((k, v)), clock=clock)
+    store["a"] = 1
+    store["b"] = 2
+    store["c"] = 3  # LRU eviction of a: not an expiry
+    store.pop("b")
+    clock.now += 11
+    assert store.purge_expired() == 1
+    assert expired == [("c", 3)]
+
+
+def test_session_timezone_expiry_reschedules_the_user(monkeypatch, clock):
+    rescheduled = []
+    monkeypatch.setattr(SESSION_TIMEZONES, "clock", clock)
+    monkeypatch.setattr(scheduler, "_reschedule_user_pending_plans_sync", lambda uid: rescheduled.append(uid))
+    SESSION_TIMEZONES.set("statetzuser1", "Asia/Tokyo", ttl=3600)
+    clock.now += 3599
+    purge_expired_state()
+    assert SESSION_TIMEZONES.get("statetzuser1") == "Asia/Tokyo"
+    clock.now += 2
+    purge_expired_state()
+    assert SESSION_TIMEZONES.get("statetzuser1") is None
+    # the callback hands the reschedule to a thread
+    for _ in range(100):
+        if rescheduled:
+            break
+        time.sleep(0.01)
+    assert rescheduled == ["statetzuser1"]
+
+
+def test_subscription_update_refreshes_the_fallback_entry(client, monkeypatch, clock):
+    uid = "statesubuser1"
+    monkeypatch.setattr(USER_SUBSCRIPTIONS, "clock", clock)
+    USER_SUBSCRIPTIONS[uid] = {"level": "FREE", "timezone": "UTC"}
+    clock.now += USER_SUBSCRIPTIONS.ttl - 1
+    r = client.put("/user/subscription/", json={"level": "PRO", "days": 30}, headers=auth(uid))
+    assert r.status_code == 200
+    clock.now += 2  # past the original TTL; the update re-set the entry
+    assert USER_SUBSCRIPTIONS[uid]["level"] == "PRO"
+    assert USER_SUBSCRIPTIONS[uid]["timezone"] == "UTC"
+    USER_SUBSCRIPTIONS.pop(uid)
+
+
+def test_subscription_update_without_fallback_entry(client):
+    r = client.put("/user/subscription/", json={"level": "PRO", "days": 30}, headers=auth("statesubuser2"))
+    assert r.status_code == 200
+    assert "statesubuser2" not in USER_SUBSCRIPTIONS
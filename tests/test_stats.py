@@ -0,0 +1,102 @@
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from conftest import auth
+from flow7_core.db import Base
+from flow7_core.models import PlanArchiveORM, PlanORM
+from flow7_core.retention import compact_plans
+from flow7_core.stats import StatsDelta, plan_minutes_by_hour, range_stats, backfill_stats
+
+RANGE = (date(2019, 1, 1), date(2031, 12, 31))
+
+
+def test_plan_minutes_split_across_hours():
+    assert plan_minutes_by_hour(datetime(2030, 1, 1, 9, 45).time(), datetime(2030, 1, 1, 11, 10).time()) == {9: 15, 10: 60, 11: 10}
+    assert plan_minutes_by_hour(datetime(2030, 1, 1, 9, 0).time(), None) == {}
+
+
+def test_stats_delta_cancels_out():
+    day, start, end = date(2030, 1, 1), datetime(2030, 1, 1, 9).time(), datetime(2030, 1, 1, 10).time()
+    delta = StatsDelta().add(day, start, end).add(day, start, end, -1)
+    assert delta.days[day] == [0, 0]
+    assert all(m == 0 for m in delta.hours.values())
+
+
+def _fresh_stats(db, uid, tmp_path):
+    """range_stats of a new database holding only `uid`'s plans, with aggregates built by backfill_stats."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for model in (PlanORM, PlanArchiveORM):
+            rows = [dict(r._mapping) for r in db.execute(select(model.__table__).where(model.user_id == uid))]
+            if rows:
+                conn.execute(model.__table__.insert(), rows)
+    backfill_stats(engine)
+    fresh = Session(bind=engine)
+    try:
+        return range_stats(fresh, uid, *RANGE, top_slots=50)
+    finally:
+        fresh.close()
+        engine.dispose()
+
+
+def _ics(*events):
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0"]
+    for uid, day, start, end, title in events:
+        lines += ["BEGIN:VEVENT", f"UID:{uid}", f"DTSTART:{day:%Y%m%d}T{start}00", f"DTEND:{day:%Y%m%d}T{end}00", f"SUMMARY:{title}", "END:VEVENT"]
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(lines) + "\r\n").encode("utf-8")
+
+
+def test_incremental_aggregates_match_a_fresh_backfill(client, db, tmp_path):
+    uid = "statsdrift1"
+    h = auth(uid)
+    client.put("/user/timezone/", json={"timezone": "UTC"}, headers=h)
+    today = datetime.now(timezone.utc).date()
+    d1, d2, d3 = (today + timedelta(days=n) for n in (3, 4, 5))
+
+    def create(day, start, end, title="p"):
+        r = client.post("/api/plans", json={"title": title, "date": day.isoformat(), "start_time": start, "end_time": end}, headers=h)
+        assert r.status_code == 201, r.text
+        return r.json()["id"]
+
+    # create
+    a = create(d1, "09:00", "10:30")
+    b = create(d1, "11:00", "12:00")
+    create(d1, "14:15", "15:45")
+    create(d2, "08:00", "08:30")
+    # update: move to another day and change the length (old and new day)
+    r = client.put(f"/api/plans/{a}", json={"title": "moved", "date": d2.isoformat(), "start_time": "10:00", "end_time": "12:20"}, headers=h)
+    assert r.status_code == 200, r.text
+    # force update: deletes the plans it overlaps
+    r = client.put(f"/api/plans/{b}", json={"title": "wide", "date": d1.isoformat(), "start_time": "11:00", "end_time": "15:00"}, params={"force": True}, headers=h)
+    assert r.status_code == 200, r.text
+    assert client.get("/api/plans", params={"start_date": d1.isoformat(), "end_date": d1.isoformat()}, headers=h).json()[0]["id"] == b
+    # delete
+    assert client.delete(f"/api/plans/{create(d3, '18:00', '19:00')}", headers=h).status_code == 204
+    # copy
+    r = client.post("/api/plans/copy", json={"source_start_date": d2.isoformat(), "source_end_date": d2.isoformat(), "offset_days": 2, "repeat": 2}, headers=h)
+    assert r.status_code == 201 and r.json()["created"] == 4  # both plans of d2, twice
+    # import
+    body = _ics(("i1@test", d3, "0700", "0745", "imported"), ("i2@test", d3, "2200", "2330", "late"))
+    r = client.post("/api/plans/import", content=body, headers={**h, "Content-Type": "text/calendar"})
+    assert r.status_code == 200 and r.json()["imported"] == 2, r.text
+    # archive: an old notified plan is compacted, then one archived plan is deleted and one restored by PUT
+    old = date(2020, 3, 2)
+    archived = [create(old, "09:00", "10:00"), create(old, "13:00", "13:30")]
+    db.execute(PlanORM.__table__.update().where(PlanORM.id.in_(archived)).values(notified=True))
+    db.commit()
+    assert compact_plans() >= 2
+    assert db.get(PlanArchiveORM, archived[0]) is not None
+    assert client.delete(f"/api/plans/{archived[0]}", headers=h).status_code == 204
+    r = client.put(f"/api/plans/{archived[1]}", json={"title": "restored", "date": old.isoformat(), "start_time": "13:00", "end_time": "14:10"}, headers=h)
+    assert r.status_code == 200, r.text
+
+    db.expire_all()
+    incremental = range_stats(db, uid, *RANGE, top_slots=50)
+    assert incremental == _fresh_stats(db, uid, tmp_path)
+    assert incremental["plan_count"] == db.query(PlanORM).filter(PlanORM.user_id == uid).count() + db.query(PlanArchiveORM).filter(PlanArchiveORM.user_id == uid).count()
+    assert client.get("/api/stats", params={"start_date": d1.isoformat(), "end_date": d3.isoformat()}, headers=h).json()["plan_count"] == \
+        range_stats(db, uid, d1, d3)["plan_count"]